@@ -0,0 +1,196 @@
+import numpy as np # imports the library to do array math
+import time # for us to time the decoder
+from modes_demod import demodulate, bytes_to_mag, PULSES, PREAMBLE_SAMPLES, FRAME_SAMPLES, MAG_SCALE # the vectorized detection engine
+from capture_pipeline import CapturePipeline # threaded capture/decode with block overlap
+from modes_crc import check_frames # batched CRC + bit error correction
+from sdr_common import sources # synthetic Mode S at any sample rate (capture_pipeline put sdr_common on the path)
+
+# benchmark for the detection engine -- no SDR needed, we build our own 1090 MHz samples
+# run with: python adsb_benchmark.py
+RATE = 2.0e6 # same sample rate as the tracker
+BLOCK = 256 * 1024 # same block size as the tracker (131 ms of airtime)
+THRESH = 0.03 # same threshold as the tracker
+NUM_BLOCKS = 50 # how many blocks to time
+FRAMES_PER_BLOCK = 60 # a busy airport feed
+NOISE = 0.01 # noise level (magnitude), about what adsb_test showed with no planes
+AMPLITUDE = 0.2 # pulse height of the planes
+CRC_FRAMES = 5000 # candidate frames for the CRC comparison
+PIPELINE_BLOCKS = 40 # how many blocks to stream through the threaded pipeline (~5 s)
+SPLIT_BLOCK = 4096 # small blocks for the block split check, so lots of frames land near an edge
+SPLIT_SECONDS = 1.0
+
+# real DF17 messages with good CRC (from the mode-s.org examples)
+MESSAGES = ['8D4840D6202CC371C32CE0576098', # callsign KLM1023
+            '8D40621D58C382D690C8AC2863A7', # airborne position
+            '8D485020994409940838175B284F', # velocity
+            '8DA05F219B06B6AF189400CBC33F'] # velocity (airspeed)
+
+
+# turn a hex message into the magnitude pulses the dongle would see (preamble + PPM bits)
+def modulate(msg):
+    bits = np.unpackbits(np.frombuffer(bytes.fromhex(msg), dtype=np.uint8))
+    env = np.zeros(FRAME_SAMPLES)
+    env[list(PULSES)] = 1.0 # the 4 preamble pulses
+    data = env[PREAMBLE_SAMPLES:].reshape(-1, 2) # 2 samples per bit
+    data[bits == 1, 0] = 1.0 # 1 -> pulse in the first half
+    data[bits == 0, 1] = 1.0 # 0 -> pulse in the second half
+    return env
+
+
+# make complex noise with frames dropped in at random spots
+# boundaries lists sample positions (block edges) that should get a frame straddling them
+def make_block(rng, length=BLOCK, num_frames=FRAMES_PER_BLOCK, boundaries=()):
+    samples = (rng.normal(0, NOISE, length) + 1j * rng.normal(0, NOISE, length)) / np.sqrt(2)
+    spacing = FRAME_SAMPLES + PREAMBLE_SAMPLES # room for a frame plus some jitter
+    starts = [b - FRAME_SAMPLES // 2 for b in boundaries] # half the frame on each side of the edge
+    taken = {s // spacing for s in starts} | {s // spacing + 1 for s in starts}
+    free = [k for k in range(length // spacing - 1) if k not in taken]
+    slots = rng.choice(free, num_frames, replace=False) # no two frames overlap
+    starts += [slot * spacing + rng.integers(0, PREAMBLE_SAMPLES) for slot in slots]
+    sent = []
+    for start in starts:
+        msg = MESSAGES[rng.integers(len(MESSAGES))]
+        phase = np.exp(1j * rng.uniform(0, 2 * np.pi)) # the carrier phase is random for every plane
+        samples[start:start + FRAME_SAMPLES] += AMPLITUDE * modulate(msg) * phase
+        sent.append(msg)
+    return samples, sent
+
+
+# feed a long stream through the threaded pipeline at the dongle's pace (one block every 131 ms)
+# and check nothing is dropped and the frames sitting on the block edges still come out
+def run_pipeline(rng, num_blocks=PIPELINE_BLOCKS):
+    edges = [k * BLOCK for k in range(1, num_blocks)]
+    stream, sent = make_block(rng, num_blocks * BLOCK, num_blocks * FRAMES_PER_BLOCK, edges)
+    found = []
+
+    def handler(starts, msgs):
+        found.extend(msgs)
+
+    pipeline = CapturePipeline(BLOCK, handler, THRESH)
+    pipeline.start()
+    t_next = time.monotonic()
+    for k in range(num_blocks):
+        time.sleep(max(0.0, t_next - time.monotonic())) # wait for the "dongle"
+        pipeline.push(stream[k * BLOCK:(k + 1) * BLOCK])
+        t_next += BLOCK / RATE
+    pipeline.drain()
+    pipeline.stop()
+
+    st = pipeline.stats()
+    good = set(MESSAGES)
+    print(f"\nPipeline: {num_blocks} blocks at {st['rate']/1e6:.2f} MS/s")
+    print(f"Dropped blocks: {st['blocks_dropped']} | Buffer high-water: {st['high_water']}/{st['slots']}")
+    print(f"Frames recovered: {sum(1 for m in found if m in good)}/{len(sent)} ({len(edges)} straddling block edges)")
+
+
+# the same synthetic stream through the pipeline in small blocks and as one block: every frame has to come
+# out exactly once either way (a frame near an edge decoded by both blocks would show up twice)
+def run_block_split(rate, seconds=SPLIT_SECONDS, block=SPLIT_BLOCK):
+    source = sources.SyntheticSource(rate, 1090e6, seed=1, noise=NOISE, duration=seconds, modes_rate=2000.0)
+    stream = source.read_samples(int(seconds * rate))
+
+    def decode(block_size):
+        found = []
+        pipeline = CapturePipeline(block_size, lambda starts, msgs: found.extend(zip(starts.tolist(), msgs)), THRESH,
+                                   dtype=np.complex64, num_slots=4, rate=rate)
+        pipeline.start()
+        for k in range(0, len(stream), block_size):
+            pipeline.push(stream[k:k + block_size], wait=True) # a file, nothing may be dropped
+        pipeline.drain()
+        pipeline.stop()
+        return sorted(found)
+
+    split, whole = decode(block), decode(len(stream))
+    twice = len(split) - len(set(split))
+    print(f"Block split at {rate/1e6:g} MS/s: {len(split)} frames in {block}-sample blocks, {len(whole)} as one block, "
+          f"{twice} decoded twice ({source.bursts_sent} sent)")
+
+
+# compare the two front ends on the same raw bytes:
+#   read_samples path: bytes -> complex128 (what pyrtlsdr does) -> np.abs -> float64 magnitude
+#   lookup table path: bytes -> uint16 magnitude in one gather into a reused buffer
+def run_front_ends(blocks):
+    raws = []
+    for samples, sent in blocks:
+        raw = np.empty(2 * len(samples), dtype=np.uint8) # what the dongle would have sent
+        raw[0::2] = np.clip(samples.real * 127.5 + 127.5, 0, 255)
+        raw[1::2] = np.clip(samples.imag * 127.5 + 127.5, 0, 255)
+        raws.append((raw, set(sent)))
+
+    mag_buf = np.empty(BLOCK, dtype=np.uint16)
+    results = {}
+    for name in ('read_samples + np.abs', 'uint16 lookup table'):
+        found = 0
+        t0 = time.perf_counter()
+        for raw, good in raws:
+            if name == 'uint16 lookup table':
+                mag = bytes_to_mag(raw, mag_buf)
+                starts, msgs = demodulate(mag, THRESH * MAG_SCALE)
+            else:
+                samples = ((raw.astype(np.float64) - 127.5) / 127.5).view(np.complex128) # same as pyrtlsdr's packed_bytes_to_iq
+                mag = np.abs(samples)
+                starts, msgs = demodulate(mag, THRESH)
+            found += sum(1 for m in msgs if m in good)
+        results[name] = (time.perf_counter() - t0, found)
+
+    print(f"\nFront ends ({len(raws)} blocks, {2 * BLOCK / 1024:.0f} KB of raw bytes each):")
+    for name, (elapsed, found) in results.items():
+        if name == 'uint16 lookup table':
+            traffic = BLOCK * 2 # the uint16 magnitudes, written into the same buffer every block
+        else:
+            traffic = BLOCK * 16 + BLOCK * 8 # complex128 samples + float64 magnitudes allocated every block
+        print(f"{name:<24} {elapsed / len(raws) * 1e3:6.2f} ms per block | {traffic / 1e6:5.1f} MB written per block | frames: {found}")
+
+
+# batched CRC vs one pms.crc call per candidate, on good frames, frames with 1 bad bit and pure noise
+def run_crc(rng):
+    import pyModeS as pms # only needed for the comparison
+    good = np.array([np.unpackbits(np.frombuffer(bytes.fromhex(m), dtype=np.uint8)) for m in MESSAGES])
+    bits = good[rng.integers(len(good), size=CRC_FRAMES)]
+    kind = rng.integers(3, size=CRC_FRAMES) # 0 = good, 1 = one bad bit, 2 = noise
+    one = np.flatnonzero(kind == 1)
+    bits[one, rng.integers(5, 112, size=len(one))] ^= 1
+    noise = kind == 2
+    bits[noise] = rng.integers(0, 2, size=(np.count_nonzero(noise), 112))
+
+    t0 = time.perf_counter()
+    ok_pms = sum(1 for m in [np.packbits(b).tobytes().hex() for b in bits] if pms.crc(m) == 0)
+    t_pms = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ok, nbits, icao, fixed = check_frames(bits.copy(), fix_bits=1)
+    t_batch = time.perf_counter() - t0
+
+    print(f"\nCRC ({CRC_FRAMES} candidates, {len(one)} with one bad bit):")
+    print(f"pms.crc per frame        {t_pms * 1e3:6.1f} ms | valid: {ok_pms}")
+    print(f"batched + 1 bit fix      {t_batch * 1e3:6.1f} ms | valid: {int(ok.sum())} ({int(np.count_nonzero(fixed))} fixed)")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(1090) # fixed seed so every run is the same
+    blocks = [make_block(rng) for _ in range(NUM_BLOCKS)]
+
+    found = 0
+    total = 0
+    t0 = time.perf_counter()
+    for samples, sent in blocks:
+        mag = np.abs(samples) # same as the tracker
+        starts, msgs = demodulate(mag, THRESH)
+        good = set(sent)
+        found += sum(1 for m in msgs if m in good)
+        total += len(sent)
+    elapsed = time.perf_counter() - t0
+
+    airtime = NUM_BLOCKS * BLOCK / RATE # how many seconds of signal we just processed
+    print(f"Blocks: {NUM_BLOCKS} x {BLOCK:,} samples ({airtime:.2f} s of airtime)")
+    print(f"Decode time: {elapsed:.3f} s ({elapsed / NUM_BLOCKS * 1e3:.2f} ms per block)")
+    print(f"Throughput: {NUM_BLOCKS * BLOCK / elapsed / 1e6:.1f} MS/s")
+    print(f"Real-time factor: {airtime / elapsed:.1f}x faster than real time")
+    print(f"Frames recovered: {found}/{total}")
+
+    run_front_ends(blocks)
+    run_crc(rng)
+    run_pipeline(rng)
+    print()
+    for rate in (2.0e6, 2.4e6):
+        run_block_split(rate)
@@ -1,67 +1,102 @@
 import numpy as np                      # imports the library to do array math
 import matplotlib.pyplot as plt         # imports the library to graph and visualize
-from rtlsdr import RtlSdr               # imports RTL-SDR radio control class which lets us talk to the RTL-SDR hardware
+import argparse                         # command line options (one-shot test or monitor)
+import time
+import os                               # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common.spectrum import welch_psd, bin_freqs # batched Welch PSD
+from sdr_common.band_monitor import BandMonitor # memory-mapped average, waterfall and occupancy index
+from sdr_common import sources # the RTL-SDR (opened on the first read), a capture file or synthetic IQ
 
 ADSB_FREQ = 1090e6 # 1090 MHz is the ADS-B frequency
 SAMPLE_RATE = 2e6 # sample rate
 GAIN = 49.6 # maximum gain for weak signals 
+NFFT = 1024 # bins per spectrum in monitor mode
 
-print(f"\nConfiguring RTL-SDR:")
-print(f"Frequency: {ADSB_FREQ/1e6} MHz")
-print(f"Sample Rate: {SAMPLE_RATE/1e6} MS/s")
-print(f"Gain: {GAIN} dB")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the 1090 MHz signal once, or keep monitoring it")
+    parser.add_argument('--monitor', metavar='DIR', help="keep running and record the average, waterfall and occupancy in DIR (draw/query with sdr_common/band_monitor.py)")
+    parser.add_argument('--interval', type=float, default=1.0, help="with --monitor: seconds between updates (default 1)")
+    sources.add_arguments(parser) # --source synthetic makes up Mode S bursts, no dongle needed
+    args = parser.parse_args()
 
-sdr = RtlSdr() # creating the RTL-SDR object
-sdr.sample_rate = SAMPLE_RATE # what the RTL should sample at
-sdr.center_freq = ADSB_FREQ # what frequency it should tune into
-sdr.gain = GAIN # amplifier gain
+    sdr = sources.open_source(args.source, SAMPLE_RATE, ADSB_FREQ, GAIN) # the RTL-SDR: sample rate, frequency to tune into, amplifier gain
 
-print("\nCapturing data...")
-samples = sdr.read_samples(256*1024) # read the samples (complex), changed due to overflow error, FFT works best with powers of 2
-sdr.close() # disconnect from the SDR
+    if isinstance(sdr, sources.RtlSdrSource):
+        print(f"\nConfiguring RTL-SDR:")
+    else:
+        print(f"\nSource: {args.source}")
+    print(f"Frequency: {ADSB_FREQ/1e6} MHz")
+    print(f"Sample Rate: {SAMPLE_RATE/1e6} MS/s")
+    if isinstance(sdr, sources.RtlSdrSource):
+        print(f"Gain: {GAIN} dB")
 
-print(f"Captured {len(samples):,} samples")
+    if args.monitor:
+        # same capture over and over, each spectrum goes into the band monitor
+        band = BandMonitor(args.monitor, bin_freqs(ADSB_FREQ, SAMPLE_RATE, NFFT), channel_step=50e3, channel_width=100e3)
+        print(f"\nMonitoring into {args.monitor} (Ctrl-C to stop)...")
+        try:
+            while True:
+                t0 = time.monotonic()
+                band.update(welch_psd(sdr.read_samples(256*1024), NFFT))
+                if band.updates() % 10 == 0:
+                    band.flush()
+                    print(f"{band.updates()} updates", end='\r')
+                time.sleep(max(0.0, args.interval - (time.monotonic() - t0)))
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            band.flush()
+            sdr.close()
+        sys.exit()
 
-print("\nAnalyzing signal...")
-fft = np.fft.fftshift(np.fft.fft(samples)) # converts time domain into frequency domain using fast fourier transform, and uses the shift the frequency to center 
-freqs = np.fft.fftshift(np.fft.fftfreq(len(samples), 1/SAMPLE_RATE)) # generates the frequency values for each FFT and shifts them to the center
-power_db = 20 * np.log10(np.abs(fft) + 1e-10) # finding the power in dB
+    print("\nCapturing data...")
+    samples = sdr.read_samples(256*1024) # read the samples (complex), changed due to overflow error, FFT works best with powers of 2
+    sdr.close() # disconnect from the SDR
 
-magnitude = np.abs(samples) # the magnitude so only caring about signal strength
-max_signal = np.max(magnitude) # finding the maximum magnitude
-mean_signal = np.mean(magnitude) # average of the magnitude, to represent the noise floor
+    print(f"Captured {len(samples):,} samples")
 
-print(f"\nSignal Statistics:")
-print(f"Max amplitude: {max_signal:.4f}")
-print(f"Mean amplitude: {mean_signal:.4f}")
-print(f"Peak-to-mean ratio: {max_signal/mean_signal:.2f}x")
+    print("\nAnalyzing signal...")
+    fft = np.fft.fftshift(np.fft.fft(samples)) # converts time domain into frequency domain using fast fourier transform, and uses the shift the frequency to center 
+    freqs = np.fft.fftshift(np.fft.fftfreq(len(samples), 1/SAMPLE_RATE)) # generates the frequency values for each FFT and shifts them to the center
+    power_db = 20 * np.log10(np.abs(fft) + 1e-10) # finding the power in dB
 
-# if the ratio is above 3 we have strong signals
-if max_signal/mean_signal > 3:
-    print(f"\nSeeing strong pulses!")
-else:
-    print(f"\nSignals look weak. Move closer to the window")
+    magnitude = np.abs(samples) # the magnitude so only caring about signal strength
+    max_signal = np.max(magnitude) # finding the maximum magnitude
+    mean_signal = np.mean(magnitude) # average of the magnitude, to represent the noise floor
 
-# plot the spectrum so it is readable
-plt.figure(figsize=(14, 8))
+    print(f"\nSignal Statistics:")
+    print(f"Max amplitude: {max_signal:.4f}")
+    print(f"Mean amplitude: {mean_signal:.4f}")
+    print(f"Peak-to-mean ratio: {max_signal/mean_signal:.2f}x")
 
-# subplot 1: Spectrum
-plt.subplot(2, 1, 1)
-plt.plot(freqs/1e6, power_db, linewidth=0.5) # Hz to MHz, and plotting the power in dB
-plt.xlabel('Frequency Offset (MHz)')
-plt.ylabel('Power (dB)')
-plt.title('ADS-B Signal Spectrum at 1090 MHz')
-plt.grid(True, alpha=0.3)
+    # if the ratio is above 3 we have strong signals
+    if max_signal/mean_signal > 3:
+        print(f"\nSeeing strong pulses!")
+    else:
+        print(f"\nSignals look weak. Move closer to the window")
 
-# subplot 2: Time domain (first 10,000 samples)
-plt.subplot(2, 1, 2)
-time_samples = magnitude[:10000]
-plt.plot(time_samples, linewidth=0.5) # plotting the magnitude of the first 10000 samples
-plt.xlabel('Sample')
-plt.ylabel('Magnitude')
-plt.title('Time Domain - Looking for ADS-B Pulses')
-plt.grid(True, alpha=0.3)
+    # plot the spectrum so it is readable
+    plt.figure(figsize=(14, 8))
 
-# adjust spacing and show us the plots
-plt.tight_layout()
-plt.show()
+    # subplot 1: Spectrum
+    plt.subplot(2, 1, 1)
+    plt.plot(freqs/1e6, power_db, linewidth=0.5) # Hz to MHz, and plotting the power in dB
+    plt.xlabel('Frequency Offset (MHz)')
+    plt.ylabel('Power (dB)')
+    plt.title('ADS-B Signal Spectrum at 1090 MHz')
+    plt.grid(True, alpha=0.3)
+
+    # subplot 2: Time domain (first 10,000 samples)
+    plt.subplot(2, 1, 2)
+    time_samples = magnitude[:10000]
+    plt.plot(time_samples, linewidth=0.5) # plotting the magnitude of the first 10000 samples
+    plt.xlabel('Sample')
+    plt.ylabel('Magnitude')
+    plt.title('Time Domain - Looking for ADS-B Pulses')
+    plt.grid(True, alpha=0.3)
+
+    # adjust spacing and show us the plots
+    plt.tight_layout()
+    plt.show()
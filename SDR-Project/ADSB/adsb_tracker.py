@@ -1,26 +1,43 @@
 import numpy as np # imports the library to do array math
-from rtlsdr import RtlSdr # imports RTL-SDR radio control class which lets us talk to the RTL-SDR hardware
 import pyModeS as pms # lets us turn the binary into names
+from capture_pipeline import CapturePipeline # threaded capture/decode with block overlap
+from modes_demod import TRIGGER_DB # how far above the noise floor a preamble has to be
+from track_store import TrackStore # the aircraft table (expiry heap + CPR decoding)
+from decode_cache import DecodeCache # skips pyModeS for repeats of the same frame
+from net_output import OutputServer, sbs_line, beast_frame # TCP feeds for other programs
+from track_history import HistoryWriter, POSITION, VELOCITY, ALTITUDE # on-disk history of every update
+import argparse # command line options (live or replay a file)
+import sys # for printing the summary to stderr
 import time # for us to work with time
+import os # to find the shared sdr_common package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # Prometheus/JSON metrics (--metrics-port / --metrics-json)
+from sdr_common import sources # the dongle, a recorded capture or synthetic IQ behind one interface
 from math import radians, cos, sin, asin, sqrt # the specific tools we need for distance calculation on earth
 
 # configuation used
 FREQ = 1090e6 # 1090 MHz is the ADS-B frequency
-RATE = 2.0e6 # sample rate (fast enough)
+RATE = 2.0e6 # sample rate (fast enough); --rate 2.4e6 switches to the phase-aware demod
 GAIN = 40.0 # gain to amplify the weaker signals (this worked the best) -- planes are above me so far signals
-THRESH = 0.03 # looked at the adsb_test to see where the strongest magnitudes are (used this for detection)
+THRESH = None # trigger level: None follows the noise floor (TRIGGER_DB above it); 0.03 is what I read off adsb_test before (--thresh)
+BLOCK_SIZE = 256 * 1024 # samples per block (this worked best in the adsb_test file)
 
 # my location to check how far the planes are
 HOME_LAT = 42.096
 HOME_LON = -88.121
 
-sdr = RtlSdr() # creating the RTL-SDR object
-sdr.center_freq = FREQ # what frequency it should tune into
-sdr.sample_rate = RATE  # what the RTL should sample at
-sdr.gain = GAIN # amplifier gain
+# create the aircraft table (one Track per ICAO, see track_store.py)
+aircraft = TrackStore(HOME_LAT, HOME_LON)
+cache = DecodeCache() # recently decoded frames
 
-# create the aircraft dictionary
-aircraft = {}
+clock_origin = 0.0 # wall clock time of sample 0 (live) or 0 for a file, so message times line up with the samples
+out = None # where to write the decoded messages in headless mode (None = don't write them)
+server = None # the network output (None = not serving)
+history = None # the track history writer (None = not saving)
+num_valid = 0 # messages that passed the CRC
+msg_counters = {} # (df, tc) -> metrics counter
+CACHE_HIT_RATE = metrics.gauge('adsb_decode_cache_hit_ratio', 'share of frames served from the decode cache')
+AIRCRAFT = metrics.gauge('adsb_aircraft', 'aircraft being tracked')
 
 def get_distance(lat2, lon2):
     lon1, lat1, lon2, lat2 = map(radians, [HOME_LON, HOME_LAT, lon2, lat2]) # converting the degrees into radians
@@ -40,177 +57,345 @@ def get_dir(h):
         return "---"
     return ['N','NE','E','SE','S','SW','W','NW'][int((h+22.5)/45)%8] # lets us know where the plane is going in compass direction based on where it is heading
 
-def sort_rule(plane_pair):
-    data  = plane_pair[1] # get the data dictionary for the plane
-
-    if data['dist'] is not None: # check if we have distance, return it, if not put it at the end
-        return data['dist']
+def sort_rule(track):
+    if track.dist is not None: # check if we have distance, return it, if not put it at the end
+        return track.dist
     else: 
         return 9999
 
-iteration = 0 # used to control the display (updating every 1 second)
+# run the pyModeS chain on one frame and keep what we need as a small record
+# (no aircraft state is touched here, so the record can be cached and reused for repeats of the frame)
+def decode_message(msg):
+    df = pms.df(msg) # extract Downlink Format 
+    rec = {'df': df, 'tc': None, 'icao': None, 'cs': None, 'alt': None, 'cpr': False, 'vel': None, 'sq': None}
 
-# starting the infinite loop since live airplane tracker
-while True:
-    iteration += 1 # increment the counter each loop
+    if df in [17, 18]: # this has the callsign, position, velocity
+        icao = pms.adsb.icao(msg) # extract 24-bit aircraft address
+        if icao and icao not in ['000000','FFFFFF']: # validate the address
+            rec['icao'] = icao
+            tc = rec['tc'] = pms.adsb.typecode(msg) # extract Type Code from ADS-B message
 
-    try:
-        samples = sdr.read_samples(256 * 1024) # try to get the samples (this worked best in the adsb_test file) -- complex numbers
-    except:
-        continue # jump back to the beginning, will keep trying to get the samples
-        
-    mag = np.abs(samples) # will calulate the magnitude of the complex samples
-    # loop through the magnitude array
-    i = 0
-    # used this website -- https://mode-s.org/1090mhz/content/ads-b/1-basics.html to figure out the bits
-    while i < len(mag) - 250: # we need 250 samples ahead to decode the full message (there are 112 bits and 2 samples per bit so 224 samples minimum this just gives a buffer)
-        if mag[i] > THRESH: # needs to exceed the threshold
-            bits = []
-            for b in range(112): # decode the 112 bits, ADS-B long message = 112 bits, this also contains all the data
-                pos = i + b * 2 # calculate the position of bit in the array, each bit is 2 samples, remember 1 bit is 1 microsecond
-                if pos + 1 >= len(mag): break # if the reads past the end 
-                # decode one bit using PPM (pulse-position modulation), if pulse in first half bit 1, if pulse in second half bit 0
-                if mag[pos] > mag[pos + 1]: 
-                    bits.append('1')
-                else:
-                    bits.append('0')
-            
-            if len(bits) >= 112: # check if we decoded enough bits
-                try:
-                    msg = f"{int(''.join(bits[:112]), 2):028X}" # convert the bits into hex with 28 digits
-                    if pms.crc(msg) != 0: # validate message using CRC (checking for corruption -- added due to call signs being strange), skips the message if it is strange
-                        i += 1
-                        continue
-
-                    df = pms.df(msg) # extract Downlink Format 
-
-                    if df in [17, 18]: # this has the callsign, position, velocity
-                        icao = pms.adsb.icao(msg) # extract 24-bit aircraft address
-                        if icao and icao not in ['000000','FFFFFF']: # validate the address
-                            # create new aircraft entry if first time seeing this ICAO
-                            if icao not in aircraft:
-                                aircraft[icao] = {'cs':None,'alt':None,'spd':None,'hdg':None,'vr':None, 
-                                                 'lat':None, 'lon':None, 'even':None, 'odd':None,
-                                                 'dist':None, 'last': time.time()}
-                            
-                            ac = aircraft[icao] # create shorthand reference to this aircraft
-                            ac['last'] = time.time() # update last-seen timestamp
-
-                            tc = pms.adsb.typecode(msg) # extract Type Code from ADS-B message
-
-                            if 1 <= tc <= 4: # decode callsign from message
-                                cs = pms.adsb.callsign(msg).strip().replace('_', '')
-                                if cs: 
-                                    ac['cs'] = cs # only store if callsign exists
-                            
-                            elif 9 <= tc <= 18: # extract altitude from position message
-                                ac['alt'] = pms.adsb.altitude(msg)
-                                # store even or odd position message (need both pairs not just one) using oe_flag
-                                if pms.adsb.oe_flag(msg) == 0: 
-                                    ac['even'] = msg
-                                else: 
-                                    ac['odd'] = msg
-                                
-                                # decode position when we have both messages
-                                if ac['even'] and ac['odd']:
-                                    # takes even message, takes odd message, takes timestamps of both, returns (latitude, longitude) tuple
-                                    pos = pms.adsb.position(ac['even'], ac['odd'], time.time(), time.time())
-                                    if pos:
-                                        ac['lat'], ac['lon'] = pos # store
-                                        ac['dist'] = get_distance(ac['lat'], ac['lon']) # using the function to calculate the distance and store it
-
-                            elif tc == 19: # decode velocity
-                                v = pms.adsb.velocity(msg)
-                                if v: 
-                                    ac['spd'], ac['hdg'], ac['vr'] = v[0], v[1], v[2] # returns the speed (knots), degree, and vertical rate (ft/min)
-                except: # if any error skip, no corrupted messages
-                    pass
-                i += 250 # skipping the 250 samples after message is processed
+            if 1 <= tc <= 4: # decode callsign from message
+                cs = pms.adsb.callsign(msg).strip().replace('_', '')
+                if cs: 
+                    rec['cs'] = cs # only store if callsign exists
+                    
+            elif 9 <= tc <= 18: # extract altitude from position message
+                rec['alt'] = pms.adsb.altitude(msg)
+                rec['cpr'] = True # the position needs the aircraft's CPR state, done in apply_record
+
+            elif tc == 19: # decode velocity
+                rec['vel'] = pms.adsb.velocity(msg) # returns the speed (knots), degree, and vertical rate (ft/min)
+
+    elif df in [0, 4, 16, 20]: # replies to radar with the altitude (only accepted for planes we already track)
+        rec['icao'] = pms.common.icao(msg) # address is recovered from the parity
+        rec['alt'] = pms.common.altcode(msg)
+
+    elif df in [5, 21]: # squawk replies
+        rec['icao'] = pms.common.icao(msg)
+        rec['sq'] = pms.common.idcode(msg)
+
+    elif df == 11: # all-call reply, the plane is still around
+        rec['icao'] = pms.common.icao(msg)
+
+    return rec
+
+# update the aircraft table from a decoded record received at time t
+def apply_record(rec, msg, t):
+    ac = aircraft.update(rec['icao'], t) # creates the track the first time we see this ICAO, updates last-seen
+    if rec['cs']:
+        ac.cs = rec['cs'] # only store if callsign exists
+    if rec['alt'] is not None:
+        ac.alt = rec['alt']
+    if rec['cpr']:
+        # CPR position: local decode against the last position once we have one, even/odd pair before that
+        if aircraft.update_position(ac, msg, t):
+            ac.dist = get_distance(ac.lat, ac.lon) # using the function to calculate the distance and store it
+    if rec['vel']:
+        v = rec['vel']
+        ac.spd, ac.hdg, ac.vr = v[0], v[1], v[2]
+    return ac
+
+# the SBS-1 lines for one decoded frame, using the aircraft's current state
+# 1 = callsign, 3 = airborne position, 4 = velocity, 5 = altitude reply, 6 = squawk, 8 = all-call
+def sbs_lines(rec, ac, t):
+    icao = rec['icao']
+    lines = []
+    if rec['cs']:
+        lines.append(sbs_line(1, icao, t, callsign=rec['cs']))
+    if rec['cpr']:
+        if ac.lat is not None:
+            lines.append(sbs_line(3, icao, t, alt=rec['alt'], lat=f"{ac.lat:.5f}", lon=f"{ac.lon:.5f}"))
         else:
-            i += 1 # no pulse detection move to next sample
-    
-    if iteration % 25 == 0: # updating the display around one second 
-        now = time.time()
-        # remove aircraft not seen for 60 seconds
-        # create a temporary dictionary to hold the ones we want to keep
-        temp_aircraft = {}
-        for k, v in aircraft.items():
-            # 'now' is the current time, 'v[last]' is when we last saw the plane
-            time_since_seen = now - v['last']
-            # if it was seen less than 60 seconds ago, keep it
-            if time_since_seen < 60:
-                temp_aircraft[k] = v
-        # update the main aircraft database with the filtered list
-        aircraft = temp_aircraft
-
-        # Create a dictionary for the planes ready to be displayed
-        active = {}
-        for k, v in aircraft.items():
-            # Check if we have an altitude OR a callsign for this plane
-            if v['alt'] is not None or v['cs'] is not None:
-                active[k] = v # add it 
-
-        # making the title with border
-        print("="*115)
-        print(f"ADSB Tracker | ACTIVE: {len(active)}".center(115))
-        print("="*115)
-        
-        # header Layout
-        header = f"{'CALLSIGN':<12} {'ALTITUDE':<14} {'SPEED':<12} {'HEADING':<15} {'CLIMB RATE':<15} {'DIST':<12} {'LAT/LON'}" # proper padding to space it out
-        print(f"\033[1;32m{header}\033[0m") # light green bold header with reset
-        print("-" * 115)
-        
-        if active:
-            # sort by proximity (closest planes first)
-            sorted_planes = sorted(active.items(), key=sort_rule)
-            for icao, d in sorted_planes:
-                # callsign
-                if d['cs']: 
-                    cs = d['cs']
-                else:
-                    cs = f"{icao}"
-                # altitude
-                if d['alt']:
-                    alt = f"{int(d['alt']):,} ft"
-                else:
-                    alt = "---"
-                # speed
-                if d['spd']:
-                    spd = f"{int(d['spd'])} kt"
-                else:
-                    spd = "---"
-                # heading
-                if d['hdg']:
-                    direction_name = get_dir(d['hdg'])
-                    hdg = f"{int(d['hdg'])}° {direction_name}"
-                else:
-                    hdg = "---"
-                # distance
-                if d['dist']:
-                    dist = f"{d['dist']:.1f} mi"
-                else:
-                    dist = "---"
-                # position (Lat/Lon)
-                if d['lat']:
-                    pos = f"{d['lat']:.3f}, {d['lon']:.3f}"
-                else:
-                    pos = "---"
-                # vertical rate (fpm)
-                # using 115 due to air being bumpy
-                if d['vr'] is not None:
-                    if d['vr'] > 115:
-                        vr = f"+{int(d['vr']):<5} fpm"
-                    elif d['vr'] < -115:
-                        vr = f"{int(d['vr']):<5} fpm"
-                    else:
-                        vr = "LEVEL"
-                else:
-                    vr = "---"
-                
-                print(f"{cs:<12} {alt:<14} {spd:<12} {hdg:<15} {vr:<15} {dist:<12} {pos}") # alligning to the header
+            lines.append(sbs_line(3, icao, t, alt=rec['alt'])) # no position yet
+    if rec['vel']:
+        v = rec['vel']
+        lines.append(sbs_line(4, icao, t, gs=v[0], trk=f"{v[1]:.1f}" if v[1] is not None else '', vr=v[2]))
+    if rec['df'] in [0, 4, 16, 20]:
+        lines.append(sbs_line(5, icao, t, alt=rec['alt']))
+    if rec['sq']:
+        lines.append(sbs_line(6, icao, t, squawk=rec['sq']))
+    if rec['df'] == 11:
+        lines.append(sbs_line(8, icao, t))
+    return lines
+
+# counter for one kind of message, labelled by downlink format (and type code for DF17/18)
+def message_counter(rec):
+    key = (rec['df'], rec['tc'])
+    c = msg_counters.get(key)
+    if c is None:
+        labels = {'df': rec['df']} if rec['tc'] is None else {'df': rec['df'], 'tc': rec['tc']}
+        c = msg_counters[key] = metrics.counter('adsb_messages_total', 'decoded messages by downlink format and type code', **labels)
+    return c
+
+# the history records for one freshly decoded frame: (t, icao, kind, lat, lon, alt, spd, hdg, vr)
+def history_rows(rec, ac, t):
+    nan = float('nan')
+    icao = int(rec['icao'], 16)
+    rows = []
+    if rec['cpr'] and ac.pos_time == t: # the position was updated by this frame
+        rows.append((t, icao, POSITION, ac.lat, ac.lon, ac.alt if ac.alt is not None else nan, nan, nan, nan))
+    if rec['vel']:
+        spd, hdg, vr = (x if x is not None else nan for x in rec['vel'][:3])
+        rows.append((t, icao, VELOCITY, nan, nan, nan, spd, hdg, vr))
+    if rec['df'] in [0, 4, 16, 20] and rec['alt'] is not None:
+        rows.append((t, icao, ALTITUDE, nan, nan, rec['alt'], nan, nan, nan))
+    return rows
+
+# called by the decode workers with every valid frame they found in a block
+# the CRC was already checked (and single bit errors fixed) for the whole block in modes_crc.py
+# starts are the sample numbers where each frame began, so we know when it was received
+# repeats of a frame we decoded recently come out of the cache, only the pyModeS decode is skipped: the track
+# update still runs with the new reception time (CPR even/odd times, last-seen, altitude and velocity)
+def handle_messages(starts, msgs):
+    global num_valid
+    raw, beast, sbs = [], [], [] # what goes out to the network clients for this block
+    rows = [] # what goes into the history for this block
+    kinds = [] # decoded records, only kept when metrics are on
+    for start, msg in zip(starts, msgs):
+        try:
+            t = clock_origin + start / RATE # reception time of the frame
+            num_valid += 1
+            if out is not None:
+                out.write(f"{t:.6f} *{msg};\n") # timestamp + raw frame in AVR format
+            if server is not None:
+                raw.append(f"*{msg};\n")
+                beast.append(beast_frame(msg, start / RATE))
+
+            rec = cache.get(msg, t) # same frame again: nothing new to decode, but the track still gets its time
+            if rec is None:
+                rec = decode_message(msg)
+                cache.put(msg, rec, t)
+            if metrics.enabled():
+                kinds.append(rec)
+            if rec['icao']:
+                ac = apply_record(rec, msg, t)
+                if server is not None:
+                    sbs.extend(sbs_lines(rec, ac, t))
+                if history is not None:
+                    rows.extend(history_rows(rec, ac, t))
+        except: # if any error skip, no corrupted messages
+            pass
+
+    if history is not None:
+        history.add(rows) # only queues them, the writer thread does the disk work
+    if server is not None:
+        server.publish('raw', raw)
+        server.publish('beast', beast)
+        server.publish('sbs', sbs)
+    for rec in kinds:
+        message_counter(rec).inc()
+    if metrics.enabled():
+        CACHE_HIT_RATE.set(cache.hit_rate())
+        AIRCRAFT.set(len(aircraft))
+
+    if len(starts):
+        aircraft.expire(clock_origin + starts[-1] / RATE) # remove aircraft not seen for 60 seconds (only looks at the oldest)
+
+# one row of the aircraft table (also used by table_client.py)
+def format_row(d):
+    # callsign
+    if d.cs: 
+        cs = d.cs
+    else:
+        cs = f"{d.icao}"
+    # altitude
+    if d.alt:
+        alt = f"{int(d.alt):,} ft"
+    else:
+        alt = "---"
+    # speed
+    if d.spd:
+        spd = f"{int(d.spd)} kt"
+    else:
+        spd = "---"
+    # heading
+    if d.hdg:
+        direction_name = get_dir(d.hdg)
+        hdg = f"{int(d.hdg)}° {direction_name}"
+    else:
+        hdg = "---"
+    # distance
+    if d.dist:
+        dist = f"{d.dist:.1f} mi"
+    else:
+        dist = "---"
+    # position (Lat/Lon)
+    if d.lat:
+        pos = f"{d.lat:.3f}, {d.lon:.3f}"
+    else:
+        pos = "---"
+    # vertical rate (fpm)
+    # using 115 due to air being bumpy
+    if d.vr is not None:
+        if d.vr > 115:
+            vr = f"+{int(d.vr):<5} fpm"
+        elif d.vr < -115:
+            vr = f"{int(d.vr):<5} fpm"
         else:
-            print("\n" + "SCANNING SKY FOR ADS-B SIGNALS...".center(115) + "\n")
-        
-        print("-" * 115)
-    
-    time.sleep(0.01) # pause for 10 milliseconds to give CPU a break
\ No newline at end of file
+            vr = "LEVEL"
+    else:
+        vr = "---"
+
+    return f"{cs:<12} {alt:<14} {spd:<12} {hdg:<15} {vr:<15} {dist:<12} {pos}" # alligning to the header
+
+# prints the aircraft table (called about once a second)
+def show_table():
+    aircraft.expire(time.time()) # remove aircraft not seen for 60 seconds
+
+    # the planes ready to be displayed: we need an altitude OR a callsign
+    active = [tr for tr in aircraft.tracks.values() if tr.alt is not None or tr.cs is not None]
+
+    # making the title with border
+    print("="*115)
+    print(f"ADSB Tracker | ACTIVE: {len(active)}".center(115))
+    print("="*115)
+
+    # header Layout
+    header = f"{'CALLSIGN':<12} {'ALTITUDE':<14} {'SPEED':<12} {'HEADING':<15} {'CLIMB RATE':<15} {'DIST':<12} {'LAT/LON'}" # proper padding to space it out
+    print(f"\033[1;32m{header}\033[0m") # light green bold header with reset
+    print("-" * 115)
+
+    if active:
+        # sort by proximity (closest planes first)
+        sorted_planes = sorted(active, key=sort_rule)
+        for d in sorted_planes:
+            print(format_row(d))
+    else:
+        print("\n" + "SCANNING SKY FOR ADS-B SIGNALS...".center(115) + "\n")
+
+    print("-" * 115)
+
+# live mode: the dongle feeds the pipeline through its async read
+# by default we take the raw bytes and use the magnitude lookup table, use_complex goes back to read_samples + np.abs
+def run_live(sdr, use_complex, fix_bits):
+    global clock_origin
+
+    # the capture thread fills the ring buffer, the decode workers call handle_messages (see capture_pipeline.py)
+    pipeline = CapturePipeline(BLOCK_SIZE, handle_messages, THRESH, raw=not use_complex,
+                               known=aircraft.addresses, fix_bits=fix_bits, rate=RATE, trigger_db=TRIGGER_DB)
+    clock_origin = time.time()
+    pipeline.start_rtlsdr(sdr) # the dongle opens here, on the first read
+
+    # starting the infinite loop since live airplane tracker
+    try:
+        while True:
+            time.sleep(1) # updating the display around one second
+            if server is None: # when serving, the table is a client instead (table_client.py)
+                with pipeline.lock: # the decode workers can't change the aircraft while we draw them
+                    show_table()
+            st = pipeline.stats()
+            status = f"Rate: {st['rate']/1e6:.2f} MS/s | Blocks: {st['blocks_in']} | Dropped: {st['blocks_dropped']} | Buffer high-water: {st['high_water']}/{st['slots']} | Triggers: {st['trigger_rate']:.0f}/s ({st['false_trigger_ratio']*100:.0f}% false) | CRC ok: {st['valid']} ({st['fixed']} fixed) | Cache hits: {cache.hit_rate()*100:.0f}%"
+            if server is not None:
+                status += f" | Aircraft: {len(aircraft)} | Clients: {server.num_clients()} ({server.clients_dropped} dropped)"
+            print(status)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        pipeline.stop()
+        sdr.close() # disconnect from the SDR
+
+
+# headless mode: replay a recorded capture, or a synthetic one (no dongle needed)
+# runs as fast as the CPU allows, or at the real sample rate with --realtime; returns the pipeline's stats
+def run_file(source, realtime, fix_bits):
+    raw = source.raw # cu8 files are the same bytes the dongle sends, so they go through the lookup table
+    pipeline = CapturePipeline(BLOCK_SIZE, handle_messages, THRESH, dtype=np.complex64, raw=raw,
+                               known=aircraft.addresses, fix_bits=fix_bits, rate=RATE, trigger_db=TRIGGER_DB)
+    pipeline.start()
+
+    t0 = time.monotonic()
+    t_next = t0
+    for block in source.blocks(BLOCK_SIZE): # views into the file's memory map when it is cu8
+        if realtime:
+            time.sleep(max(0.0, t_next - time.monotonic())) # wait like the dongle would
+            t_next += len(block) / (2 if raw else 1) / RATE
+        pipeline.push(block, wait=True) # wait for a free slot instead of dropping
+    pipeline.drain()
+    pipeline.stop()
+    elapsed = time.monotonic() - t0
+
+    seconds = source.position / RATE
+    print(f"Replayed {source.position:,} samples ({seconds:.1f} s) in {elapsed:.2f} s "
+          f"-- {source.position / elapsed / 1e6:.1f} MS/s, {seconds / elapsed:.1f}x real time", file=sys.stderr)
+    st = pipeline.stats()
+    print(f"Preambles: {st['candidates']} ({st['trigger_rate']:.0f}/s, {st['false_trigger_ratio']*100:.1f}% false) | CRC ok: {st['valid']} ({st['fixed']} with bits fixed)", file=sys.stderr)
+    level = f"noise floor {st['noise_floor']:.4f}, trigger {st['trigger_level']:.4f}" if st['noise_floor'] is not None else f"fixed trigger {THRESH:g}"
+    per_frame = f"{st['cpu_per_frame'] * 1e6:.0f} µs CPU per valid frame" if st['cpu_per_frame'] else "no valid frames"
+    print(f"Demod: {RATE/1e6:g} MS/s {'phase-aware' if pipeline.phase else '2 samples/bit'}, {level} | {per_frame} ({st['cpu_s']:.2f} s)", file=sys.stderr)
+    cache_st = cache.stats()
+    print(f"Decode cache: {cache_st['hit_rate']*100:.1f}% hits ({cache_st['hits']} of {cache_st['hits'] + cache_st['misses']}) | evictions: {cache_st['evictions']} | expired: {cache_st['expired']}", file=sys.stderr)
+    print(f"Valid messages: {num_valid} | Aircraft: {len(aircraft)} | CPR decodes: {aircraft.global_decodes} global, {aircraft.local_decodes} local", file=sys.stderr)
+    return st
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ADS-B tracker -- live from the RTL-SDR, or headless from a recorded capture")
+    parser.add_argument('file', nargs='?', help="recorded IQ capture at 2 MS/s, or --rate (leave out to use the dongle)")
+    parser.add_argument('--format', choices=list(sources.FORMATS), help="IQ format of the file (guessed from the extension if left out)")
+    sources.add_arguments(parser)
+    parser.add_argument('--duration', type=float, default=10.0, help="with --source synthetic: seconds of IQ to make up (default 10)")
+    parser.add_argument('--realtime', action='store_true', help="replay the file at its sample rate instead of as fast as possible")
+    parser.add_argument('--rate', type=float, default=RATE, help="sample rate of the dongle or the file (default 2e6; 2.4e6 uses the phase-aware demod)")
+    parser.add_argument('--thresh', type=float, help="fixed trigger level (e.g. 0.03, full scale 1) instead of following the noise floor")
+    parser.add_argument('--trigger', type=float, default=TRIGGER_DB, help="dB above the noise floor a preamble has to be (default 6)")
+    parser.add_argument('--fix', type=int, choices=[0, 1, 2], default=1, help="how many bit errors to fix in DF17/18 frames (default 1)")
+    parser.add_argument('--complex', action='store_true', help="live mode: use read_samples + np.abs instead of the raw byte lookup table")
+    parser.add_argument('-o', '--output', help="write decoded messages here instead of stdout (file mode only)")
+    parser.add_argument('--net', action='store_true', help="serve raw (30002), SBS-1 (30003) and Beast (30005) feeds over TCP")
+    parser.add_argument('--host', default='127.0.0.1', help="address to serve on with --net (default localhost only)")
+    parser.add_argument('--history', metavar='DIR', help="save every position/velocity/altitude update here (query with track_history.py)")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args)
+    RATE, THRESH, TRIGGER_DB = args.rate, args.thresh, args.trigger
+
+    if args.history:
+        history = HistoryWriter(args.history)
+        history.start()
+
+    if args.net:
+        server = OutputServer(args.host)
+        server.start()
+        print(f"Serving on {args.host}: " + ", ".join(f"{kind} {port}" for kind, port in server.ports.items()), file=sys.stderr)
+
+    if args.file:
+        source = sources.FileSource(args.file, RATE, FREQ, fmt=args.format)
+    else:
+        source = sources.open_source(args.source, RATE, FREQ, GAIN, duration=args.duration)
+    if isinstance(source, sources.RtlSdrSource):
+        run_live(source, args.complex, args.fix)
+    else:
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            run_file(source, args.realtime, args.fix)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    if server is not None:
+        server.stop()
+    if history is not None:
+        history.stop() # writes whatever is still queued
+        print(f"History: {history.records_written:,} records written to {args.history}", file=sys.stderr)
+    metrics.stop() # final JSON dump
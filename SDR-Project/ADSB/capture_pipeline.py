@@ -0,0 +1,251 @@
+import numpy as np # imports the library to do array math
+import threading # capture and decode run on their own threads
+import queue # thread-safe queues to hand blocks between the threads
+import time # for us to work with time
+import os # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # counters and stage timers (free when metrics are off)
+from modes_demod import detect_preambles, slice_bits, bits_to_hex, bytes_to_mag, FRAME_SAMPLES, MAG_SCALE # the vectorized detection engine
+from modes_demod import NoiseFloor, TRIGGER_DB, GRID_RATE, cumulative, detect_preambles_phase, slice_bits_phase, phase_frame_samples
+from modes_crc import check_frames, SHORT_BITS # batched CRC + bit error correction
+
+# producer/consumer pipeline so the dongle never waits on the decoder
+# the capture side copies every block into a preallocated slot of a ring buffer (no allocation per block)
+# each slot also holds the last OVERLAP samples of the block before it, so a frame that straddles
+# the end of one block is still decoded in the next one
+# raw=True takes the uint8 I/Q bytes straight from the dongle (read_bytes_async) and turns them into
+# uint16 magnitudes with the lookup table, instead of complex128 samples from read_samples_async
+# the CRC is checked (and 1 or 2 bit errors fixed) for the whole block in the worker, so the handler
+# only ever sees valid frames (28 hex digits for 112 bit frames, 14 for 56 bit ones)
+# known is a function returning the ICAO addresses (ints) we track, for the address/parity formats
+# thresh=None sets the trigger level trigger_db above the running noise floor of the blocks (see NoiseFloor
+# in modes_demod.py), a number is a fixed level like before
+# at any rate other than 2 MS/s the phase-aware demod is used (2.4 MS/s: fractional bit positions)
+OVERLAP = 256 # >= 250 samples, longer than one full 112 bit frame (240 samples), at 2 MS/s (scaled up for faster rates)
+NUM_SLOTS = 16 # ring buffer size (16 x 131 ms = ~2 s of slack before we drop anything)
+NUM_WORKERS = 2 # decode threads (NumPy lets go of the GIL while it crunches)
+
+SAMPLES_READ = metrics.counter('adsb_samples_total', 'samples received from the dongle or file')
+BLOCKS_DROPPED = metrics.counter('adsb_blocks_dropped_total', 'blocks thrown away because the ring buffer was full')
+PREAMBLES = metrics.counter('adsb_preambles_total', 'preamble triggers')
+CRC_OK = metrics.counter('adsb_crc_total', 'candidate frames by CRC result', result='ok')
+CRC_FAIL = metrics.counter('adsb_crc_total', 'candidate frames by CRC result', result='fail')
+CRC_FIXED = metrics.counter('adsb_crc_fixed_total', 'frames repaired by bit error correction')
+LATENCY = metrics.histogram('adsb_decode_latency_seconds', 'time from a block arriving to its frames being handled')
+QUEUE_DEPTH = metrics.gauge('adsb_ring_buffer_depth', 'blocks waiting for a decode worker')
+NOISE_FLOOR = metrics.gauge('adsb_noise_floor', 'running noise floor (median magnitude, full scale 1)')
+TRIGGER_LEVEL = metrics.gauge('adsb_trigger_level', 'preamble trigger level (full scale 1)')
+DECODE_CPU = metrics.counter('adsb_decode_cpu_seconds_total', 'CPU time the decode workers spent on blocks')
+
+
+class CapturePipeline:
+    def __init__(self, block_size, handler, thresh, dtype=np.complex128, num_slots=NUM_SLOTS, num_workers=NUM_WORKERS, raw=False,
+                 known=None, fix_bits=1, rate=GRID_RATE, trigger_db=TRIGGER_DB):
+        self.block_size = block_size
+        self.handler = handler # called with (starts, msgs) for every decoded block, starts are sample numbers since the capture began
+        self.known = known
+        self.fix_bits = fix_bits
+        self.raw = raw
+        self.scale = MAG_SCALE if raw else 1.0 # the lookup table magnitudes are scaled up to fill a uint16
+        self.thresh = None if thresh is None else thresh * self.scale
+        self.floor = NoiseFloor(trigger_db) if thresh is None else None
+        self.rate = rate
+        self.phase = rate != GRID_RATE # pulses don't line up with the samples, see detect_preambles_phase
+        self.overlap = int(np.ceil(OVERLAP * rate / GRID_RATE))
+        self.frame_samples = phase_frame_samples(rate) if self.phase else FRAME_SAMPLES
+        self.level = self.thresh # trigger level of the last block
+        self.num_workers = num_workers
+        self.width = 2 if raw else 1 # values per sample (raw bytes are I, Q, I, Q, ...)
+        if raw:
+            dtype = np.uint8
+
+        # the ring buffer: every slot is [overlap tail | new block]
+        self.slots = np.zeros((num_slots, (self.overlap + block_size) * self.width), dtype=dtype)
+        self.free = queue.Queue() # slots ready to be filled by the capture side
+        self.filled = queue.Queue() # slots waiting for a decode worker
+        for k in range(num_slots):
+            self.free.put(k)
+        self.tail = np.zeros(self.overlap * self.width, dtype=dtype) # the end of the last block we captured
+
+        self.lock = threading.Lock() # the handler touches shared state (the aircraft list)
+        self.threads = []
+        self.running = False
+        self.sdr = None # only set when the dongle is feeding us
+
+        # counters so we can prove we keep up at 2 MS/s
+        self.blocks_in = 0 # blocks handed to us by the dongle
+        self.blocks_dropped = 0 # blocks thrown away because every slot was busy
+        self.blocks_decoded = 0
+        self.samples_in = 0
+        self.high_water = 0 # most slots ever waiting for a worker at the same time
+        self.candidates = 0 # preambles found (triggers)
+        self.samples_decoded = 0
+        self.cpu = 0.0 # seconds the decode workers spent on the CPU
+        self.valid = 0 # frames that passed the CRC (after fixing)
+        self.fixed = 0 # frames that needed bits fixed
+        self.t_start = None
+
+    # producer side: called from the capture thread (the pyrtlsdr async callback) for every block
+    # samples are complex, or raw I/Q bytes when raw=True
+    # wait=True is for file replay, where we'd rather slow the reader down than lose a block
+    def push(self, samples, wait=False):
+        n = len(samples) // self.width # number of samples in the block
+        if self.t_start is None:
+            self.t_start = time.monotonic()
+        first = self.samples_in - self.overlap # sample number of the first sample in the slot (the overlap tail)
+        self.blocks_in += 1
+        self.samples_in += n
+        SAMPLES_READ.inc(n)
+        t_in = time.monotonic()
+        try:
+            k = self.free.get(block=wait) # never block the dongle, if nothing is free we drop the block
+        except queue.Empty:
+            self.blocks_dropped += 1
+            BLOCKS_DROPPED.inc()
+            self.tail[:] = 0 # the next block has no valid history to overlap with
+            return
+
+        w = self.width
+        slot = self.slots[k]
+        overlap = self.overlap
+        slot[:overlap * w] = self.tail # the end of the previous block goes first
+        slot[overlap * w:(overlap + n) * w] = samples[:n * w] # then the new samples
+        self.tail[:] = slot[n * w:(n + overlap) * w] # keep the end of this block for the next one
+        self.filled.put((k, n, first, t_in))
+        self.high_water = max(self.high_water, self.filled.qsize())
+        QUEUE_DEPTH.set(self.filled.qsize())
+
+    # consumer side: each decode worker takes a slot, decodes it and gives it back
+    def _worker(self):
+        # every worker has its own magnitude buffer that it reuses for every block
+        overlap = self.overlap
+        if self.raw:
+            mag_buf = np.empty(overlap + self.block_size, dtype=np.uint16)
+        else:
+            mag_buf = np.empty(overlap + self.block_size, dtype=self.slots.real.dtype) # float64 for complex128
+
+        while True:
+            item = self.filled.get()
+            if item is None: # shutdown signal
+                return
+            k, n, first, t_in = item
+            cpu = time.thread_time()
+            buf = self.slots[k, :(overlap + n) * self.width]
+            with metrics.timer('adsb_magnitude'):
+                if self.raw:
+                    mag = bytes_to_mag(buf, mag_buf) # bytes -> magnitude in one table lookup
+                else:
+                    mag = np.abs(buf, out=mag_buf[:overlap + n]) # will calulate the magnitude of the complex samples
+            with metrics.timer('adsb_detect'):
+                thresh = self.thresh if self.floor is None else self.floor.update(mag)
+                if self.phase:
+                    cum = cumulative(mag)
+                    x = detect_preambles_phase(mag, thresh, self.rate, cum, self.floor.level if self.floor else 0.0)
+                    # one edge rule for both blocks: a frame belongs to the block it starts before len - frame_samples
+                    # of (the next block starts exactly there), so a frame within a sample of the edge is never kept
+                    # twice, fractional refinement and all
+                    x = x[(x >= overlap - self.frame_samples) & (x < len(mag) - self.frame_samples)]
+                    bits = slice_bits_phase(mag, x, self.rate, cum)
+                    starts = x.astype(np.int64)
+                else:
+                    starts = detect_preambles(mag, thresh)
+                    # frames that start this early were fully inside the previous block and were decoded there already
+                    starts = starts[starts > overlap - self.frame_samples]
+                    bits = slice_bits(mag, starts)
+            self.free.put(k) # slot can be reused as soon as the bits are sliced
+
+            if self.known is not None:
+                with self.lock: # the handler may be adding planes right now
+                    known = self.known()
+            else:
+                known = ()
+            with metrics.timer('adsb_crc'):
+                ok, nbits, icao, fixed = check_frames(bits, known, self.fix_bits)
+                msgs = bits_to_hex(bits[ok])
+                msgs = [m[:SHORT_BITS // 4] if n == SHORT_BITS else m for m, n in zip(msgs, nbits[ok])] # short frames are 14 hex digits
+
+            with self.lock, metrics.timer('adsb_handle'):
+                self.handler(starts[ok] + first, msgs)
+                cpu = time.thread_time() - cpu
+                self.blocks_decoded += 1
+                self.samples_decoded += n
+                self.candidates += len(starts)
+                self.valid += len(msgs)
+                self.fixed += int(np.count_nonzero(fixed))
+                self.cpu += cpu
+                self.level = thresh
+            PREAMBLES.inc(len(starts))
+            CRC_OK.inc(len(msgs))
+            CRC_FAIL.inc(len(starts) - len(msgs))
+            CRC_FIXED.inc(int(np.count_nonzero(fixed)))
+            DECODE_CPU.inc(cpu)
+            TRIGGER_LEVEL.set(thresh / self.scale)
+            if self.floor is not None:
+                NOISE_FLOOR.set(self.floor.level / self.scale)
+            LATENCY.observe(time.monotonic() - t_in)
+
+    def start(self):
+        self.running = True
+        for _ in range(self.num_workers):
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    # capture thread using the async read path pyrtlsdr already has
+    # the async reads keep the USB transfers queued so samples keep flowing while we decode
+    def start_rtlsdr(self, sdr):
+        def on_samples(samples, context):
+            self.push(samples)
+
+        def on_bytes(values, context):
+            self.push(np.ctypeslib.as_array(values)) # view of librtlsdr's buffer, push copies it into a slot
+
+        def capture():
+            if self.raw:
+                sdr.read_bytes_async(on_bytes, self.block_size * 2)
+            else:
+                sdr.read_samples_async(on_samples, self.block_size)
+
+        self.start()
+        t = threading.Thread(target=capture, daemon=True)
+        t.start()
+        self.threads.append(t)
+        self.sdr = sdr
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.sdr is not None:
+            self.sdr.cancel_read_async() # makes read_samples_async return in the capture thread
+        for _ in range(self.num_workers):
+            self.filled.put(None) # one shutdown signal per worker
+        for t in self.threads:
+            t.join(timeout=2)
+
+    # wait until every block that was captured has been decoded
+    def drain(self):
+        while self.blocks_decoded + self.blocks_dropped < self.blocks_in:
+            time.sleep(0.001)
+
+    # trigger_rate: preambles per second of signal, false_trigger_ratio: share of them that failed the CRC,
+    # cpu_per_frame: decode CPU seconds per valid frame (levels are full scale 1 like the complex samples)
+    def stats(self):
+        elapsed = time.monotonic() - self.t_start if self.t_start else 0.0
+        seconds = self.samples_decoded / self.rate
+        return {'blocks_in': self.blocks_in,
+                'blocks_dropped': self.blocks_dropped,
+                'blocks_decoded': self.blocks_decoded,
+                'high_water': self.high_water,
+                'candidates': self.candidates,
+                'valid': self.valid,
+                'fixed': self.fixed,
+                'trigger_rate': self.candidates / seconds if seconds > 0 else 0.0,
+                'false_trigger_ratio': (self.candidates - self.valid) / self.candidates if self.candidates else 0.0,
+                'cpu_s': self.cpu,
+                'cpu_per_frame': self.cpu / self.valid if self.valid else None,
+                'noise_floor': self.floor.level / self.scale if self.floor is not None and self.floor.level is not None else None,
+                'trigger_level': self.level / self.scale if self.level is not None else None,
+                'slots': len(self.slots),
+                'rate': self.samples_in / elapsed if elapsed > 0 else 0.0} # samples per second coming in
@@ -0,0 +1,50 @@
+from collections import OrderedDict # keeps the entries in least-recently-used order
+
+# cache in front of pyModeS: transponders repeat identical frames and the slicer can trigger twice on
+# the same burst, so most frames we get are copies of one we decoded a moment ago
+# key = the raw frame (hex), value = the decoded record + when it was first decoded
+# entries older than WINDOW seconds count as a miss and get decoded again, and once there are more than
+# MAX_ENTRIES the least recently used one is thrown out
+MAX_ENTRIES = 4096
+WINDOW = 30 # seconds
+
+
+class DecodeCache:
+    def __init__(self, max_entries=MAX_ENTRIES, window=WINDOW):
+        self.max_entries = max_entries
+        self.window = window
+        self.entries = OrderedDict() # msg -> (record, time first decoded)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0 # pushed out because the cache was full
+        self.expired = 0 # found but too old to trust
+
+    def __len__(self):
+        return len(self.entries)
+
+    # the cached record for this frame, or None if it has to be decoded
+    def get(self, msg, t):
+        entry = self.entries.get(msg)
+        if entry is not None:
+            if t - entry[1] < self.window:
+                self.entries.move_to_end(msg) # most recently used
+                self.hits += 1
+                return entry[0]
+            del self.entries[msg]
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def put(self, msg, record, t):
+        self.entries[msg] = (record, t)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False) # least recently used
+            self.evictions += 1
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'evictions': self.evictions, 'expired': self.expired}
@@ -0,0 +1,140 @@
+import numpy as np # imports the library to do array math
+from itertools import combinations # every pair of bits for the two-bit error table
+
+# table-driven Mode S CRC-24 for a whole batch of candidate frames at once
+# the CRC is linear, so the syndrome of a frame is the XOR of the syndromes of its 1 bits
+# we precompute, for every byte position of a frame, the syndrome of all 256 byte values,
+# then a batch of N frames needs 7 (56 bit) or 14 (112 bit) table lookups + XORs instead of N pms.crc calls
+# used this website -- https://mode-s.org/1090mhz/content/ads-b/8-error-control.html for the generator
+GENERATOR = 0x1FFF409 # the 25 bit Mode S generator polynomial
+SHORT_BITS = 56 # DF0/4/5/11 replies
+LONG_BITS = 112 # DF16/17/18/20/21 and everything else
+DF_BITS = 5 # the downlink format at the start of the frame, never "corrected" (a wrong DF would give a different frame type)
+
+
+# syndrome of a single 1 bit that is k bits from the end of the frame: x^k mod G
+def _pow_syndromes(n):
+    syn = np.zeros(n, dtype=np.uint32)
+    r = 1
+    for k in range(n):
+        syn[k] = r
+        r <<= 1
+        if r & (1 << 24):
+            r ^= GENERATOR
+    return syn
+
+
+POW_SYNDROME = _pow_syndromes(LONG_BITS)
+
+
+# syndrome contributed by each bit of an n bit frame (bit 0 is the first bit sent)
+def bit_syndromes(n):
+    return POW_SYNDROME[n - 1::-1].copy()
+
+
+# byte tables for an n bit frame: table[j, v] is the syndrome of byte j of the frame having value v
+def _byte_tables(n):
+    per_bit = bit_syndromes(n).reshape(-1, 8) # the syndromes of the 8 bits in each byte
+    values = np.arange(256, dtype=np.uint8)
+    set_bits = np.unpackbits(values[:, None], axis=1).astype(bool) # (256, 8) which bits are set in each byte value
+    tables = np.zeros((n // 8, 256), dtype=np.uint32)
+    for b in range(8):
+        tables[:, set_bits[:, b]] ^= per_bit[:, b:b + 1]
+    return tables
+
+
+BYTE_TABLES = {SHORT_BITS: _byte_tables(SHORT_BITS), LONG_BITS: _byte_tables(LONG_BITS)}
+
+
+# syndrome -> which bits to flip, for 1 and 2 bit errors in a 112 bit DF17/18
+# kept as sorted arrays so a whole batch of syndromes is looked up with one searchsorted
+def _fix_table(n, max_bits):
+    per_bit = bit_syndromes(n)
+    positions = range(DF_BITS, n)
+    syn = [per_bit[i] for i in positions]
+    pos = [(i, -1) for i in positions]
+    if max_bits >= 2:
+        for i, j in combinations(positions, 2):
+            syn.append(per_bit[i] ^ per_bit[j])
+            pos.append((i, j))
+    syn = np.array(syn, dtype=np.uint32)
+    pos = np.array(pos, dtype=np.intp)
+    order = np.argsort(syn)
+    return syn[order], pos[order]
+
+
+FIX_TABLES = {1: _fix_table(LONG_BITS, 1), 2: _fix_table(LONG_BITS, 2)}
+
+
+# CRC syndromes of a batch of frames (one row of bits per frame), using the first n bits of each row
+# 0 means the frame is good (for DF17/18), for the address/parity formats it is the ICAO address
+def syndromes(bits, n=LONG_BITS):
+    packed = np.packbits(bits[:, :n], axis=1) # 8 bits -> 1 byte for every row at once
+    tables = BYTE_TABLES[n]
+    syn = np.zeros(len(bits), dtype=np.uint32)
+    for j in range(n // 8):
+        syn ^= tables[j][packed[:, j]] # one gather per byte position for the whole batch
+    return syn
+
+
+# downlink format (first 5 bits) of every frame
+def downlink_formats(bits):
+    return (bits[:, 0] << 4) | (bits[:, 1] << 3) | (bits[:, 2] << 2) | (bits[:, 3] << 1) | bits[:, 4]
+
+
+# validate a batch of sliced frames, fixing bit errors in place
+#   DF17/18      -> syndrome has to be 0, 1 bit (or 2 with fix_bits=2) errors are corrected through the fix table
+#   DF11         -> the syndrome may only hold the interrogator id (lowest 7 bits)
+#   DF0/4/5      -> 56 bit address/parity: the syndrome is the ICAO, accepted if it is a plane we already track
+#   DF16/20/21   -> same for 112 bit address/parity frames
+# known is a sequence of ICAO addresses (ints) we are tracking
+# returns (ok, nbits, icao, fixed) with one entry per frame
+def check_frames(bits, known=(), fix_bits=1):
+    count = len(bits)
+    ok = np.zeros(count, dtype=bool)
+    icao = np.zeros(count, dtype=np.uint32)
+    fixed = np.zeros(count, dtype=np.uint8)
+    if count == 0:
+        return ok, np.zeros(0, dtype=np.uint8), icao, fixed
+
+    df = downlink_formats(bits)
+    short = (df == 0) | (df == 4) | (df == 5) | (df == 11)
+    nbits = np.where(short, SHORT_BITS, LONG_BITS).astype(np.uint8)
+
+    syn = np.zeros(count, dtype=np.uint32)
+    if short.any():
+        syn[short] = syndromes(bits[short], SHORT_BITS)
+    if (~short).any():
+        syn[~short] = syndromes(bits[~short], LONG_BITS)
+
+    # extended squitter: good frames and the ones we can repair
+    es = (df == 17) | (df == 18)
+    ok |= es & (syn == 0)
+    if fix_bits:
+        fix_syn, fix_pos = FIX_TABLES[min(fix_bits, 2)]
+        broken = np.flatnonzero(es & (syn != 0))
+        k = np.minimum(np.searchsorted(fix_syn, syn[broken]), len(fix_syn) - 1)
+        hit = fix_syn[k] == syn[broken]
+        rows, pos = broken[hit], fix_pos[k[hit]]
+        bits[rows, pos[:, 0]] ^= 1 # flip the bad bits back
+        two = pos[:, 1] >= 0
+        bits[rows[two], pos[two, 1]] ^= 1
+        ok[rows] = True
+        fixed[rows] = np.where(two, 2, 1)
+    if es.any():
+        icao[es] = (np.packbits(bits[es, 8:32], axis=1).astype(np.uint32) * [65536, 256, 1]).sum(axis=1) # address is in bits 8-31
+
+    # all-call reply: the ICAO is in the frame, the parity only carries the interrogator id
+    all_call = (df == 11) & ((syn & ~np.uint32(0x7F)) == 0)
+    if all_call.any():
+        ok |= all_call
+        icao[all_call] = (np.packbits(bits[all_call, 8:32], axis=1).astype(np.uint32) * [65536, 256, 1]).sum(axis=1)
+
+    # address/parity: the syndrome is the address, so it's only trustworthy for planes we already know
+    ap = (df == 0) | (df == 4) | (df == 5) | (df == 16) | (df == 20) | (df == 21)
+    if len(known) and ap.any():
+        match = ap & np.isin(syn, np.asarray(known, dtype=np.uint32))
+        ok |= match
+        icao[match] = syn[match]
+
+    return ok, nbits, icao, fixed
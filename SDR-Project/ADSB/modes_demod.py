@@ -0,0 +1,216 @@
+import numpy as np # imports the library to do array math
+
+# Mode S timing at 2 MS/s (2 samples per 1 µs bit)
+# used this website -- https://mode-s.org/1090mhz/content/ads-b/1-basics.html for the preamble layout
+GRID_RATE = 2.0e6 # the sample rate detect_preambles/slice_bits are written for (other rates: the phase-aware demod below)
+SAMPLES_PER_BIT = 2 # 1 bit is 1 microsecond, 2 samples per microsecond
+PREAMBLE_SAMPLES = 16 # the preamble is 8 µs long
+LONG_BITS = 112 # ADS-B long message = 112 bits
+FRAME_SAMPLES = PREAMBLE_SAMPLES + LONG_BITS * SAMPLES_PER_BIT # 240 samples from the start of the preamble to the last bit
+
+# the preamble is 4 pulses at 0, 1.0, 3.5 and 4.5 µs -> samples 0, 2, 7, 9
+# everything else in the first 8 µs should be quiet
+PULSES = (0, 2, 7, 9)
+QUIET = (1, 3, 4, 5, 6, 8, 10, 11, 12, 13, 14, 15)
+
+
+# magnitude lookup table for the raw uint8 bytes the dongle gives us
+# every I/Q byte pair read as one little-endian uint16 (Q << 8 | I) is an index into a 64K table that
+# already holds the magnitude, so turning bytes into magnitudes is one gather instead of
+# bytes -> complex128 -> abs (which is what read_samples + np.abs does)
+# the table is scaled so that a float magnitude of 1.0 (same units as read_samples) is MAG_SCALE
+MAG_SCALE = 65535 / np.sqrt(2) # the largest possible magnitude (corner of the I/Q square) is 65535
+_iq = (np.arange(256) - 127.5) / 127.5 # byte value -> -1 to 1, same as pyrtlsdr
+MAG_LUT = np.round(np.hypot(_iq[None, :], _iq[:, None]) * MAG_SCALE).astype(np.uint16).ravel() # index = Q * 256 + I
+
+
+# convert raw I/Q bytes to uint16 magnitudes through the lookup table
+# out is a reused buffer (at least len(raw) // 2 long) so nothing is allocated per block
+def bytes_to_mag(raw, out):
+    n = len(raw) // 2
+    pairs = raw[:2 * n].view(np.uint16) # I and Q of each sample in one number, no copy
+    return np.take(MAG_LUT, pairs, out=out[:n], mode='clip') # clip mode skips the bounds check (every uint16 is a valid index)
+
+
+# find every sample index where a Mode S preamble starts, for the whole block at once
+# instead of walking the array one sample at a time, we line up 16 shifted views of the magnitude
+# (view k is mag[k:k+n]) so each comparison checks every possible start position in one NumPy call
+def detect_preambles(mag, thresh):
+    n = len(mag) - FRAME_SAMPLES + 1 # last start position that still has the full 112 bits after it
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    m = [mag[k:k + n] for k in range(PREAMBLE_SAMPLES)] # shifted views, no copies made
+
+    # shape of the pulses: each pulse is higher than the samples next to it (same checks dump1090 does)
+    ok = (m[0] > m[1]) & (m[1] < m[2]) & (m[2] > m[3]) & (m[3] < m[0])
+    ok &= (m[4] < m[0]) & (m[5] < m[0]) & (m[6] < m[0])
+    ok &= (m[7] > m[8]) & (m[8] < m[9]) & (m[9] > m[6])
+
+    # the pulses have to be strong enough to be a real plane (replaces the old single sample > THRESH trigger)
+    pulse_sum = m[0].astype(np.float32) + m[2] + m[7] + m[9]
+    ok &= pulse_sum > 4 * thresh
+
+    # quiet zone: the gaps and the tail of the preamble must be well below the pulse level
+    # high is 2/3 of the mean pulse height, anything in the quiet zone above that is not a preamble
+    high = pulse_sum / 6
+    for k in (4, 5, 11, 12, 13, 14):
+        ok &= m[k] < high
+
+    return np.flatnonzero(ok)
+
+
+# slice the bits of every candidate frame in one batched comparison
+# returns a 2-D matrix, one row per candidate and one column per bit (1 = pulse in first half of the bit)
+def slice_bits(mag, starts, num_bits=LONG_BITS):
+    offsets = PREAMBLE_SAMPLES + SAMPLES_PER_BIT * np.arange(num_bits) # where each bit starts, relative to the preamble
+    pos = starts[:, None] + offsets[None, :] # position of every bit of every candidate
+    # PPM decoding: pulse in the first half -> 1, pulse in the second half -> 0
+    return (mag[pos] > mag[pos + 1]).astype(np.uint8)
+
+
+# pack the bit matrix into hex strings (28 hex digits for 112 bits) in bulk
+def bits_to_hex(bits):
+    if len(bits) == 0:
+        return []
+    packed = np.packbits(bits, axis=1) # 8 bits -> 1 byte for every row at once
+    width = packed.shape[1] * 2 # number of hex digits per message
+    text = packed.tobytes().hex().upper() # one long hex string for the whole batch
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+
+# the whole detection engine: magnitude block in, candidate hex messages out
+# also returns the sample index of each candidate so callers can line things up
+def demodulate(mag, thresh):
+    starts = detect_preambles(mag, thresh)
+    bits = slice_bits(mag, starts)
+    return starts, bits_to_hex(bits)
+
+
+# running noise floor, so the trigger level follows the gain, the antenna and the interference instead of
+# being a number read off an adsb_test plot: the median magnitude of every block (a strided subsample, the
+# sky is quiet >95% of the time so the frames barely move it), smoothed from block to block
+# the preamble trigger is then trigger_db above it (on the mean pulse height)
+# the decode workers update it from their own threads, a lost update only means a slightly older floor
+TRIGGER_DB = 6.0
+FLOOR_STRIDE = 16 # every 16th sample is plenty for a median
+FLOOR_SMOOTHING = 0.2 # share of the new block's estimate in the running floor
+
+
+class NoiseFloor:
+    def __init__(self, trigger_db=TRIGGER_DB, smoothing=FLOOR_SMOOTHING, stride=FLOOR_STRIDE):
+        self.ratio = 10 ** (trigger_db / 20)
+        self.smoothing = smoothing
+        self.stride = stride
+        self.level = None # same units as the magnitudes
+
+    def update(self, mag):
+        estimate = float(np.median(mag[::self.stride]))
+        if self.level is None:
+            self.level = estimate
+        else:
+            self.level += self.smoothing * (estimate - self.level)
+        return self.level * self.ratio # the trigger level for this block
+
+
+# phase-aware demodulation for any sample rate (2.4 MS/s the way dump1090 does it, or 2 MS/s when pulses
+# don't start on a sample): a 0.5 µs half bit is 1.2 samples at 2.4 MS/s, so instead of comparing single
+# samples the magnitude is integrated over the exact half-bit intervals, with fractional sample edges
+# (one running sum over the block, then every integral is two lookups); the preamble is searched on whole
+# samples first, and every hit is then moved in tenths of a sample to where its pulses fit best
+PULSES_US = (0.0, 1.0, 3.5, 4.5) # preamble pulse starts, each 0.5 µs long
+QUIET_US = ((0.5, 1.0), (1.5, 3.5), (4.0, 4.5), (5.0, 8.0)) # where the preamble should be quiet
+QUIET_LENGTH_US = sum(b - a for a, b in QUIET_US)
+PREAMBLE_US = 8
+PHASE_STEPS = np.arange(-5, 6) / 10 # fractions of a sample tried around each hit (the best whole sample is within half of one)
+COARSE = 0.85 # whole-sample search: share of the trigger level it needs (a pulse half a sample off shows less of itself)
+QUIET_RATIO = 0.4 # above the noise floor, the quiet parts must stay under 40% of the pulses (frame data is ~50%)
+WEAKEST = 0.25 # and the weakest pulse a quarter of the way up from the quiet level to the mean pulse
+
+
+# samples a frame needs at this rate (with room for the fractional start)
+def phase_frame_samples(rate):
+    return int(np.ceil((PREAMBLE_US + LONG_BITS) * rate / 1e6)) + 2
+
+
+# running sum of the magnitude: the integral from 0 to x is cum[floor(x)] + frac(x) * mag[floor(x)]
+def cumulative(mag):
+    cum = np.empty(len(mag) + 1)
+    cum[0] = 0.0
+    np.cumsum(mag, out=cum[1:])
+    return cum
+
+
+# integral of the magnitude from x + a to x + b (x an array of fractional sample positions, a/b in samples)
+def _area(cum, mag, x, a, b):
+    hi, lo = x + b, x + a
+    k, j = hi.astype(np.intp), lo.astype(np.intp)
+    return cum[k] + (hi - k) * mag[k] - cum[j] - (lo - j) * mag[j]
+
+
+# weights of the samples after a whole-sample start that make up the integral from a to b (in samples)
+def _taps(a, b):
+    return {k: min(b, k + 1) - max(a, k) for k in range(int(np.floor(a)), int(np.ceil(b)))}
+
+
+# mean pulse height, mean quiet-zone height and the weakest pulse for preambles starting at x
+# (area(a, b) integrates from x + a to x + b)
+def _preamble(area, us):
+    pulses = [area(p * us, (p + 0.5) * us) / (0.5 * us) for p in PULSES_US]
+    quiet = sum(area(a * us, b * us) for a, b in QUIET_US) / (QUIET_LENGTH_US * us)
+    return sum(pulses) / 4, quiet, np.minimum.reduce(pulses)
+
+
+# fractional sample positions of every preamble in the block (floor: the noise floor, if it is known)
+def detect_preambles_phase(mag, thresh, rate, cum=None, floor=0.0):
+    us = rate / 1e6 # samples per microsecond
+    n = len(mag) - phase_frame_samples(rate) + 1
+    if n <= 0:
+        return np.empty(0)
+    cum = cumulative(mag) if cum is None else cum
+
+    # every whole-sample start, loosely (the pulses can be up to half a sample off here): the pulses are
+    # 2-3 samples each, so a few weighted slices, and the quiet zone is the whole 8 µs minus the pulses
+    taps = {}
+    for p in PULSES_US:
+        for k, w in _taps(p * us, (p + 0.5) * us).items():
+            taps[k] = taps.get(k, 0.0) + w
+    pulses = sum(w * mag[k:k + n] for k, w in taps.items())
+    end = PREAMBLE_US * us
+    k = int(end)
+    window = cum[k:k + n] - cum[:n] + (end - k) * mag[k:k + n]
+    level = pulses / (2 * us)
+    quiet = (window - pulses) / (QUIET_LENGTH_US * us)
+    ok = (level > COARSE * thresh) & (quiet - floor < (level - floor) * QUIET_RATIO)
+    score = np.where(ok, level - quiet, -np.inf)
+    # one hit per preamble: the best start within a microsecond either side
+    for d in range(1, int(np.ceil(us)) + 1):
+        ok[d:] &= score[d:] >= score[:-d]
+        ok[:-d] &= score[:-d] > score[d:]
+    starts = np.flatnonzero(ok)
+    if len(starts) == 0:
+        return np.empty(0)
+
+    # move each one in tenths of a sample to where its pulses fit best, then check it properly: above the
+    # trigger level, quiet where it should be, and no pulse missing
+    x = np.clip(starts[:, None] + PHASE_STEPS[None, :], 0, n - 1 + PHASE_STEPS[-1]) # candidates x phases
+    level, quiet, weakest = _preamble(lambda a, b: _area(cum, mag, x, a, b), us)
+    best = np.argmax(level - quiet, axis=1)
+    rows = np.arange(len(starts))
+    x, level, quiet, weakest = x[rows, best], level[rows, best], quiet[rows, best], weakest[rows, best]
+    return x[(level > thresh) & (quiet - floor < (level - floor) * QUIET_RATIO) & (weakest - quiet > WEAKEST * (level - quiet))]
+
+
+# PPM bits of every candidate: the energy in the first half of each bit against the second half
+# only the middle of each half is compared, its edges carry the smear of the neighbouring half bits
+# (a sample at 2.4 MS/s is 0.42 µs wide) -- about a third more frames get through with <= 1 bit error at 10 dB
+EDGE_US = 0.1
+
+
+def slice_bits_phase(mag, x, rate, cum=None, num_bits=LONG_BITS):
+    us = rate / 1e6
+    cum = cumulative(mag) if cum is None else cum
+    pos = x[:, None] + us * (PREAMBLE_US + np.arange(num_bits))[None, :]
+    first = _area(cum, mag, pos, EDGE_US * us, (0.5 - EDGE_US) * us)
+    second = _area(cum, mag, pos, (0.5 + EDGE_US) * us, (1 - EDGE_US) * us)
+    return (first > second).astype(np.uint8)
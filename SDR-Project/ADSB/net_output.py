@@ -0,0 +1,115 @@
+import asyncio # the TCP server runs on its own event loop
+import threading # ...in a background thread, so the decode threads never wait on the network
+from datetime import datetime, timezone # SBS-1 lines carry the date and time
+
+# network output for the tracker, the same ports dump1090 uses so existing tools can connect:
+#   30002 raw   -> AVR text, one "*HEX;" line per frame
+#   30003 sbs   -> SBS-1 (BaseStation) CSV lines with the decoded fields
+#   30005 beast -> Beast binary frames with a 12 MHz timestamp
+# every client has its own bounded queue; when a client is too slow and its queue fills up
+# we drop the client instead of letting it hold up the decoder
+PORTS = {'raw': 30002, 'sbs': 30003, 'beast': 30005}
+QUEUE_SIZE = 64 # batches (one per decoded block) a client may fall behind before we drop it
+
+
+# one SBS-1 line, fields we don't have are left empty
+# used this for the field order -- http://woodair.net/sbs/article/barebones42_socket_data.htm
+def sbs_line(msg_type, icao, t, callsign='', alt='', gs='', trk='', lat='', lon='', vr='', squawk=''):
+    stamp = datetime.fromtimestamp(t, timezone.utc)
+    date = stamp.strftime('%Y/%m/%d')
+    clock = stamp.strftime('%H:%M:%S.') + f"{stamp.microsecond // 1000:03d}"
+    fields = ['MSG', msg_type, 1, 1, icao, 1, date, clock, date, clock,
+              callsign, alt, gs, trk, lat, lon, vr, squawk, '', '', '', '']
+    return ','.join('' if f is None else str(f) for f in fields) + '\r\n'
+
+
+# Beast binary frame: 0x1a, type ('2' = 56 bit, '3' = 112 bit), 6 byte 12 MHz timestamp, signal level, message
+# any 0x1a after the first byte is sent twice so the reader can find the frame starts
+def beast_frame(msg, t, signal=0):
+    data = bytes.fromhex(msg)
+    kind = b'2' if len(data) == 7 else b'3'
+    ticks = int(t * 12e6) & 0xFFFFFFFFFFFF
+    body = ticks.to_bytes(6, 'big') + bytes([signal]) + data
+    return b'\x1a' + kind + body.replace(b'\x1a', b'\x1a\x1a')
+
+
+class OutputServer:
+    def __init__(self, host='127.0.0.1', ports=PORTS, queue_size=QUEUE_SIZE):
+        self.host = host
+        self.ports = dict(ports) # port 0 picks a free port (the real one is filled in once we start)
+        self.queue_size = queue_size
+        self.clients = {kind: set() for kind in self.ports} # kind -> set of (queue, task)
+        self.loop = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.servers = []
+        self.clients_dropped = 0 # slow clients we disconnected
+        self.batches_sent = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait() # don't return until the ports are open
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._open())
+        self.ready.set()
+        self.loop.run_forever()
+        for server in self.servers:
+            server.close()
+        tasks = asyncio.all_tasks(self.loop) # the client tasks that are still connected
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    async def _open(self):
+        for kind, port in self.ports.items():
+            server = await asyncio.start_server(lambda r, w, kind=kind: self._client(kind, r, w), self.host, port)
+            self.ports[kind] = server.sockets[0].getsockname()[1]
+            self.servers.append(server)
+
+    # one of these runs per connected client, it just writes out whatever lands in its queue
+    async def _client(self, kind, reader, writer):
+        queue = asyncio.Queue(self.queue_size)
+        client = (queue, asyncio.current_task())
+        self.clients[kind].add(client)
+        try:
+            while True:
+                data = await queue.get()
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients[kind].discard(client)
+            writer.close()
+
+    # called on the event loop: hand a batch to every client of this kind
+    def _fanout(self, kind, data):
+        for client in list(self.clients[kind]):
+            queue, task = client
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull: # too slow, drop it instead of buffering forever
+                self.clients[kind].discard(client)
+                task.cancel()
+                self.clients_dropped += 1
+        self.batches_sent += 1
+
+    # thread-safe: called from the decode threads with the lines/frames of one block
+    def publish(self, kind, chunks):
+        if not chunks or not self.clients[kind]: # nobody listening, nothing to do
+            return
+        data = ''.join(chunks).encode() if isinstance(chunks[0], str) else b''.join(chunks)
+        self.loop.call_soon_threadsafe(self._fanout, kind, data)
+
+    def num_clients(self):
+        return sum(len(c) for c in self.clients.values())
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=2)
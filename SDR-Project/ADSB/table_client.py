@@ -0,0 +1,108 @@
+import asyncio # reads the SBS-1 feed and redraws on a timer
+import argparse # command line options (where the tracker is)
+import sys # to write straight to the terminal
+import time # for us to work with time
+from track_store import Track # same per-aircraft record the tracker uses
+from adsb_tracker import format_row, sort_rule, get_distance # same table layout as the tracker
+
+# the aircraft table as a network client of adsb_tracker.py --net
+# reads the SBS-1 feed (port 30003) and only rewrites the terminal rows that changed since the last redraw
+# run with: python table_client.py [--host 127.0.0.1] [--port 30003]
+TIMEOUT = 60 # drop aircraft not seen for 60 seconds
+REFRESH = 1.0 # redraw about once a second
+WIDTH = 115
+
+planes = {} # icao -> Track
+
+
+# update our copy of the aircraft from one SBS-1 line
+def handle_line(line):
+    f = line.strip().split(',')
+    if len(f) < 17 or f[0] != 'MSG':
+        return
+    icao = f[4]
+    tr = planes.get(icao)
+    if tr is None:
+        tr = planes[icao] = Track(icao, time.time())
+    tr.last = time.time()
+    tr.msgs += 1
+    if f[10]:
+        tr.cs = f[10]
+    if f[11]:
+        tr.alt = float(f[11])
+    if f[12]:
+        tr.spd = float(f[12])
+    if f[13]:
+        tr.hdg = float(f[13])
+    if f[14] and f[15]:
+        tr.lat, tr.lon = float(f[14]), float(f[15])
+        tr.dist = get_distance(tr.lat, tr.lon)
+    if f[16]:
+        tr.vr = float(f[16])
+
+
+# every line of the screen, top to bottom
+def screen_lines():
+    now = time.time()
+    for icao in [k for k, tr in planes.items() if now - tr.last > TIMEOUT]:
+        del planes[icao]
+    active = [tr for tr in planes.values() if tr.alt is not None or tr.cs is not None]
+
+    header = f"{'CALLSIGN':<12} {'ALTITUDE':<14} {'SPEED':<12} {'HEADING':<15} {'CLIMB RATE':<15} {'DIST':<12} {'LAT/LON'}"
+    lines = ["=" * WIDTH, f"ADSB Tracker | ACTIVE: {len(active)}".center(WIDTH), "=" * WIDTH,
+             f"\033[1;32m{header}\033[0m", "-" * WIDTH]
+    if active:
+        lines += [format_row(d) for d in sorted(active, key=sort_rule)]
+    else:
+        lines.append("SCANNING SKY FOR ADS-B SIGNALS...".center(WIDTH))
+    lines.append("-" * WIDTH)
+    return lines
+
+
+# only rewrite the rows that are different from what is already on the screen
+def redraw(lines, previous):
+    out = []
+    for row, line in enumerate(lines):
+        if row >= len(previous) or previous[row] != line:
+            out.append(f"\033[{row + 1};1H{line}\033[K") # move to the row, write it, clear the rest of the row
+    for row in range(len(lines), len(previous)):
+        out.append(f"\033[{row + 1};1H\033[K") # the table got shorter, blank the old rows
+    if out:
+        sys.stdout.write(''.join(out))
+        sys.stdout.flush()
+    return len(out)
+
+
+async def read_feed(reader):
+    while True:
+        line = await reader.readline()
+        if not line: # the tracker went away
+            return
+        handle_line(line.decode(errors='replace'))
+
+
+async def main(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    sys.stdout.write("\033[2J") # clear the screen once, after that we only touch changed rows
+    feed = asyncio.create_task(read_feed(reader))
+    previous = []
+    try:
+        while not feed.done():
+            lines = screen_lines()
+            redraw(lines, previous)
+            previous = lines
+            await asyncio.sleep(REFRESH)
+    finally:
+        feed.cancel()
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Terminal aircraft table fed by adsb_tracker.py --net")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=30003)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,229 @@
+import numpy as np # imports the library to do array math
+import os # segment files live in one directory
+import glob # to find the segment files
+import queue # hands batches from the decode threads to the writer thread
+import threading # the writer runs on its own thread so the decoder never waits on the disk
+import argparse # command line for querying the history
+from datetime import datetime # to read times given on the command line
+
+# append-only history of every position/velocity/altitude update the tracker decodes
+# records are fixed size, so a segment file is just a NumPy structured array on disk and can be memory-mapped
+# every CHUNK records we also append to two small index files next to the segment:
+#   .tidx -> the first and last time in the chunk (sparse time index)
+#   .iidx -> (icao, chunk) for every aircraft that has a record in the chunk (per-ICAO index)
+# so a query only touches the chunks that can contain matching records
+RECORD = np.dtype([('t', 'f8'), ('icao', 'u4'), ('kind', 'u1'), ('lat', 'f4'), ('lon', 'f4'),
+                   ('alt', 'f4'), ('spd', 'f4'), ('hdg', 'f4'), ('vr', 'f4')])
+TIME_INDEX = np.dtype([('t_min', 'f8'), ('t_max', 'f8')])
+ICAO_INDEX = np.dtype([('icao', 'u4'), ('chunk', 'u4')])
+POSITION, VELOCITY, ALTITUDE = 1, 2, 3 # what kind of update a record is
+CHUNK = 4096 # records per index entry
+SEGMENT = 256 * CHUNK # records per segment file (~40 MB)
+FLUSH_EVERY = 1.0 # seconds between writes
+
+
+def segment_path(directory, number, ext='trk'):
+    return os.path.join(directory, f"seg_{number:06d}.{ext}")
+
+
+# the writer: the decode threads call add() with a list of rows for each block, which just puts the
+# list on a queue; the writer thread collects them and appends them to disk about once a second
+class HistoryWriter:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.queue = queue.Queue() # unbounded, add() never blocks
+        self.thread = None
+        self.records_written = 0
+
+        # carry on after the last segment that is already there
+        segments = sorted(glob.glob(os.path.join(directory, 'seg_*.trk')))
+        self.segment = len(segments) - 1 if segments else 0
+        path = segment_path(directory, self.segment)
+        self.count = os.path.getsize(path) // RECORD.itemsize if os.path.exists(path) else 0 # records in this segment
+        if os.path.exists(path):
+            os.truncate(path, self.count * RECORD.itemsize) # drop a half written record from a crash
+            self._repair(path)
+        if self.count == SEGMENT: # the last one is full, start the next
+            self.segment += 1
+            self.count = 0
+        # the records of the chunk we are still filling (needed for its index entries when it is full)
+        self.pending = [np.memmap(path, dtype=RECORD, mode='r')[self.count - self.count % CHUNK:].copy()] if self.count % CHUNK else []
+
+    # a crash between appending records and appending their index entries leaves whole chunks without
+    # (complete) entries, and as .tidx is read by position every later entry would land on the wrong chunk:
+    # cut both indexes back to the last chunk they fully agree on and rebuild the rest from the records
+    def _repair(self, path):
+        base = path[:-len('.trk')]
+        tidx = np.fromfile(base + '.tidx', dtype=TIME_INDEX) if os.path.exists(base + '.tidx') else np.zeros(0, TIME_INDEX)
+        iidx = np.fromfile(base + '.iidx', dtype=ICAO_INDEX) if os.path.exists(base + '.iidx') else np.zeros(0, ICAO_INDEX)
+        chunks = self.count // CHUNK # chunks fully on disk
+        # the iidx entries of the last chunk it has may be cut short, so that chunk is redone too
+        good = min(len(tidx), chunks, int(iidx['chunk'].max()) if len(iidx) else 0)
+        keep = int(np.count_nonzero(iidx['chunk'] < good)) # entries are in chunk order, so this is a prefix
+        with open(base + '.tidx', 'ab') as f:
+            f.truncate(good * TIME_INDEX.itemsize) # also drops a half written entry
+        with open(base + '.iidx', 'ab') as f:
+            f.truncate(keep * ICAO_INDEX.itemsize)
+        if good == chunks:
+            return
+        data = np.memmap(path, dtype=RECORD, mode='r', shape=(self.count,))
+        times, icaos = [], []
+        for k in range(good, chunks):
+            chunk = data[k * CHUNK:(k + 1) * CHUNK]
+            times.append((chunk['t'].min(), chunk['t'].max()))
+            icaos.extend((icao, k) for icao in np.unique(chunk['icao']))
+        with open(base + '.tidx', 'ab') as f:
+            f.write(np.array(times, dtype=TIME_INDEX).tobytes())
+        with open(base + '.iidx', 'ab') as f:
+            f.write(np.array(icaos, dtype=ICAO_INDEX).tobytes())
+
+    # rows are (t, icao, kind, lat, lon, alt, spd, hdg, vr) tuples, NaN where we don't have a value
+    def add(self, rows):
+        if rows:
+            self.queue.put(rows)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            try:
+                item = self.queue.get(timeout=FLUSH_EVERY)
+                while True: # take everything that is waiting
+                    if item is None:
+                        stop = True
+                        break
+                    batch.extend(item)
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                self.write(np.array(batch, dtype=RECORD))
+            if stop:
+                return
+
+    # append records, rolling over to a new segment when the current one is full
+    def write(self, records):
+        while len(records):
+            room = SEGMENT - self.count
+            part, records = records[:room], records[room:]
+            with open(segment_path(self.directory, self.segment), 'ab') as f:
+                f.write(part.tobytes())
+            self._index(part)
+            self.count += len(part)
+            self.records_written += len(part)
+            if self.count == SEGMENT:
+                self.segment += 1
+                self.count = 0
+                self.pending = []
+
+    # add index entries for every chunk this write completed
+    def _index(self, part):
+        start = self.count % CHUNK # where in the chunk we were before this write
+        self.pending.append(part)
+        done = (start + len(part)) // CHUNK # chunks completed by this write
+        if done == 0:
+            return
+        records = np.concatenate(self.pending)
+        first_chunk = self.count // CHUNK
+        times, icaos = [], []
+        for k in range(done):
+            chunk = records[k * CHUNK:(k + 1) * CHUNK]
+            times.append((chunk['t'].min(), chunk['t'].max()))
+            icaos.extend((icao, first_chunk + k) for icao in np.unique(chunk['icao']))
+        self.pending = [records[done * CHUNK:]]
+        with open(segment_path(self.directory, self.segment, 'tidx'), 'ab') as f:
+            f.write(np.array(times, dtype=TIME_INDEX).tobytes())
+        with open(segment_path(self.directory, self.segment, 'iidx'), 'ab') as f:
+            f.write(np.array(icaos, dtype=ICAO_INDEX).tobytes())
+
+
+# the reader: memory-maps the segments and uses the indexes to pick the chunks worth looking at
+class TrackHistory:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _segments(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, 'seg_*.trk'))):
+            count = os.path.getsize(path) // RECORD.itemsize
+            if count == 0:
+                continue
+            data = np.memmap(path, dtype=RECORD, mode='r', shape=(count,)) # records written so far, no copy
+            base = path[:-len('.trk')]
+            tidx = np.fromfile(base + '.tidx', dtype=TIME_INDEX) if os.path.exists(base + '.tidx') else np.zeros(0, TIME_INDEX)
+            iidx = np.fromfile(base + '.iidx', dtype=ICAO_INDEX) if os.path.exists(base + '.iidx') else np.zeros(0, ICAO_INDEX)
+            tidx = tidx[:count // CHUNK] # an index entry is only trusted if its chunk is fully on disk
+            yield data, tidx, iidx
+
+    # every record between t1 and t2 (epoch seconds), optionally only for one ICAO (hex string or int)
+    # returns a structured array sorted by time
+    def query(self, t1=-np.inf, t2=np.inf, icao=None):
+        if isinstance(icao, str):
+            icao = int(icao, 16)
+        found = []
+        self.chunks_read = 0 # how many chunks we actually had to look at (for checking the indexes work)
+        for data, tidx, iidx in self._segments():
+            # chunks whose time range overlaps the query
+            chunks = np.flatnonzero((tidx['t_max'] >= t1) & (tidx['t_min'] <= t2))
+            if icao is not None:
+                chunks = np.intersect1d(chunks, iidx['chunk'][iidx['icao'] == icao])
+            spans = [(k * CHUNK, (k + 1) * CHUNK) for k in chunks]
+            if len(data) > len(tidx) * CHUNK: # the chunk still being filled has no index yet, so always look at it
+                spans.append((len(tidx) * CHUNK, len(data)))
+            for a, b in spans:
+                rec = data[a:b]
+                keep = (rec['t'] >= t1) & (rec['t'] <= t2)
+                if icao is not None:
+                    keep &= rec['icao'] == icao
+                found.append(np.array(rec[keep]))
+                self.chunks_read += 1
+        if not found:
+            return np.zeros(0, dtype=RECORD)
+        result = np.concatenate(found)
+        return result[np.argsort(result['t'], kind='stable')]
+
+    # history of one aircraft, e.g. "everything 4840D6 did today"
+    def track(self, icao, t1=-np.inf, t2=np.inf):
+        return self.query(t1, t2, icao)
+
+
+# "2026-01-15 14:30", "14:30" (today) or epoch seconds
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        clock = datetime.strptime(text, '%H:%M')
+        return datetime.now().replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0).timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the track history written by adsb_tracker.py --history")
+    parser.add_argument('directory')
+    parser.add_argument('--start', help="from this time (ISO date/time, HH:MM today, or epoch seconds)")
+    parser.add_argument('--end', help="up to this time")
+    parser.add_argument('--icao', help="only this aircraft (hex)")
+    args = parser.parse_args()
+
+    history = TrackHistory(args.directory)
+    t1 = parse_time(args.start) if args.start else -np.inf
+    t2 = parse_time(args.end) if args.end else np.inf
+    rec = history.query(t1, t2, args.icao)
+    print(f"{len(rec):,} records from {len(np.unique(rec['icao']))} aircraft ({history.chunks_read} chunks read)")
+    kinds = {POSITION: 'POS', VELOCITY: 'VEL', ALTITUDE: 'ALT'}
+    for r in rec[-20:] if args.icao else []: # the latest updates of the aircraft
+        stamp = datetime.fromtimestamp(r['t']).strftime('%H:%M:%S')
+        print(f"{stamp} {r['icao']:06X} {kinds.get(r['kind'], '?')} lat {r['lat']:.4f} lon {r['lon']:.4f} "
+              f"alt {r['alt']:.0f} spd {r['spd']:.0f} hdg {r['hdg']:.0f} vr {r['vr']:.0f}")
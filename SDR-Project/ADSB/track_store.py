@@ -0,0 +1,103 @@
+import heapq # min-heap so expiring old aircraft doesn't mean looking at every one of them
+import pyModeS as pms # lets us turn the binary into names
+
+# aircraft state table for the tracker
+# one Track per ICAO address, with __slots__ so 500+ aircraft stay small and attribute access is fast
+# the heap holds (time the track is due to expire, icao) so expire() only ever looks at the oldest ones
+TIMEOUT = 60 # drop aircraft not seen for 60 seconds
+CPR_PAIR_WINDOW = 10 # even and odd frames have to be this close (seconds) for a global CPR decode
+REF_MAX_AGE = 300 # a position older than this is not trusted as a reference for local CPR decoding
+
+
+class Track:
+    __slots__ = ('icao', 'cs', 'alt', 'spd', 'hdg', 'vr', 'lat', 'lon', 'dist', 'last', 'pos_time',
+                 'even', 'even_time', 'odd', 'odd_time', 'msgs')
+
+    def __init__(self, icao, t):
+        self.icao = icao
+        self.cs = None # callsign
+        self.alt = None # altitude (ft)
+        self.spd = None # speed (kt)
+        self.hdg = None # heading (degrees)
+        self.vr = None # vertical rate (ft/min)
+        self.lat = None
+        self.lon = None
+        self.dist = None # miles from home
+        self.last = t # last time we heard it
+        self.pos_time = None # when lat/lon were last updated
+        self.even = None # last even CPR frame and when it was received
+        self.even_time = None
+        self.odd = None # last odd CPR frame and when it was received
+        self.odd_time = None
+        self.msgs = 0 # messages received from this aircraft
+
+
+class TrackStore:
+    def __init__(self, home_lat, home_lon, timeout=TIMEOUT):
+        self.home_lat = home_lat # fallback reference for local CPR decoding
+        self.home_lon = home_lon
+        self.timeout = timeout
+        self.tracks = {} # icao -> Track
+        self.heap = [] # (expiry time, icao), one entry per track
+        self.global_decodes = 0 # how many times we needed an even/odd pair
+        self.local_decodes = 0 # how many positions came from a single frame + reference
+
+    def __len__(self):
+        return len(self.tracks)
+
+    # ICAO addresses of every track as ints (for matching address/parity frames)
+    def addresses(self):
+        return [int(icao, 16) for icao in self.tracks]
+
+    # get the track for this ICAO (creating it the first time we see it) and mark it as seen at time t
+    def update(self, icao, t):
+        tr = self.tracks.get(icao)
+        if tr is None:
+            tr = self.tracks[icao] = Track(icao, t)
+            heapq.heappush(self.heap, (t + self.timeout, icao))
+        tr.last = max(tr.last, t) # decode workers can hand us blocks slightly out of order
+        tr.msgs += 1
+        return tr
+
+    # drop every track that hasn't been heard from in the last timeout seconds
+    # heap entries are not updated when a track is seen again, so when an entry comes up we check
+    # the real last-seen time and push it back with the new expiry if the plane is still around
+    def expire(self, now):
+        removed = 0
+        while self.heap and self.heap[0][0] <= now:
+            due, icao = heapq.heappop(self.heap)
+            tr = self.tracks[icao]
+            if tr.last + self.timeout <= now:
+                del self.tracks[icao]
+                removed += 1
+            else:
+                heapq.heappush(self.heap, (tr.last + self.timeout, icao))
+        return removed
+
+    # handle an airborne position frame (TC 9-18) received at time t
+    # once we know where the plane is, one frame plus a nearby reference is enough (local decoding)
+    # until then we need an even and an odd frame received close together (global decoding)
+    # returns True when lat/lon were updated
+    def update_position(self, tr, msg, t):
+        if pms.adsb.oe_flag(msg) == 0: # store even or odd position message with the time we got it
+            tr.even, tr.even_time = msg, t
+        else:
+            tr.odd, tr.odd_time = msg, t
+
+        pos = None
+        if tr.lat is not None and t - tr.pos_time < REF_MAX_AGE:
+            pos = pms.adsb.position_with_ref(msg, tr.lat, tr.lon) # reference = last known position
+            self.local_decodes += 1
+        elif tr.even and tr.odd and abs(tr.even_time - tr.odd_time) < CPR_PAIR_WINDOW:
+            # takes even message, takes odd message, takes the real timestamps of both, returns (latitude, longitude) tuple
+            pos = pms.adsb.position(tr.even, tr.odd, tr.even_time, tr.odd_time)
+            self.global_decodes += 1
+        elif tr.lat is not None:
+            pos = pms.adsb.position_with_ref(msg, self.home_lat, self.home_lon) # stale track, we are the reference
+            self.local_decodes += 1
+
+        if not pos or pos[0] is None:
+            return False
+        tr.lat, tr.lon = pos
+        tr.pos_time = t
+        return True
@@ -0,0 +1,224 @@
+import numpy as np # imports the library to do array math
+import multiprocessing as mp # the segments are demodulated in worker processes
+from multiprocessing import shared_memory # the audio comes back through shared memory instead of being pickled
+from collections import deque
+import argparse # command line options
+import hashlib # --verify compares the two runs block by block
+import math
+import time
+import os # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # per-stage timing (--metrics-port / --metrics-json)
+from sdr_common import sources # memory-mapped capture files
+from fm_stream import FMStream, WavOutput, RF_CUTOFF, AUDIO_CUTOFF, TAU # the block-streaming demod chain
+from fm_radio_record import SAMPLE_RATE, AUDIO_RATE, BLOCK_SIZE # same chain and same blocks as the recorder
+
+# offline reprocessing of long FM captures on every core: the capture is memory-mapped and cut into segments
+# (30 s, or less so every worker gets at least 4), each segment is demodulated by a worker process, and the
+# audio is stitched back together in order
+# every segment starts a warm-up earlier, so the filters are in the same state at its first sample as in one
+# long run: the two FIRs need their length in samples, the de-emphasis IIR (the only thing with a longer
+# memory) needs enough samples for a different starting state to die away under float32 rounding (64 bits'
+# worth), and segments start where both resamplers are back at the same phase, so every output sample is
+# computed from the same inputs in the same order as in a single pass
+# the AGC is the one part that can't be split (its level depends on all the audio before), so it runs in
+# the main process on the stitched audio, on exactly the pieces fm_radio_record.py's blocks would give
+# the result is bit-identical to one FMStream over the whole file (--verify checks it), with the same edge
+# effect a single pass has (the filters start from zero at the start of the file) and no seams; the one
+# thing that can't be promised is the de-emphasis state landing on exactly the same float32 value after the
+# warm-up -- if it is 1 step off, that seam is off by about that much until the two meet (--verify says where)
+# the workers map the file themselves and write their audio into shared memory slots (a ring buffer like
+# the ADS-B capture pipeline), only sample numbers and slot names are pickled
+# run with: python fm_batch.py capture.cu8 [--offset 200] [--workers 8] [--verify]
+SEGMENT_SECONDS = 30.0 # longest segment (the warm-up is a few ms of it)
+SEGMENTS_PER_WORKER = 4 # shorter segments on short captures, so all the workers have something to do
+SLOTS_PER_WORKER = 2 # shared memory slots, one being worked on and one waiting to be stitched
+SETTLE_BITS = 64 # the de-emphasis warm-up: how far down (in powers of 2) a different starting state has to decay
+
+
+# the FM chain with these settings (settings: audio_rate, rf_cutoff, audio_cutoff, tau, offset)
+def make_stream(rate, settings, agc=True):
+    return FMStream(rate, settings['audio_rate'], settings['rf_cutoff'], settings['audio_cutoff'], settings['tau'], agc=agc)
+
+
+# audio samples the chain has put out once it has seen n input samples (the same count Resampler.process keeps)
+def audio_count(fm, n):
+    c, a = fm.channel, fm.audio
+    return -(-a.up * -(-c.up * n // c.down) // a.down)
+
+
+# input samples after which both resamplers are back at the same phase: segments start on multiples of this
+def period(fm):
+    c, a = fm.channel, fm.audio
+    return c.down * a.down // math.gcd(c.up, a.down)
+
+
+# input samples each segment starts early by (a whole number of periods)
+def warmup(fm, settle_bits=SETTLE_BITS):
+    settle = settle_bits * math.log(2) / -math.log(-float(fm.de_a[1])) # IF samples for the de-emphasis
+    n = len(fm.channel.taps) / fm.channel.up + (len(fm.audio.taps) / fm.audio.up + settle) * fm.sample_rate / fm.if_rate
+    p = period(fm)
+    return int(math.ceil(n / p)) * p
+
+
+# shift the station offset Hz away from the center down to 0, with the phase of every sample worked out
+# from its absolute sample number n0 + k, so a segment gets exactly the phase the single pass had there
+def tune(samples, n0, offset, rate):
+    if not offset:
+        return samples
+    n = np.arange(n0, n0 + len(samples), dtype=np.float64)
+    return samples * np.exp(-2j * np.pi * (offset / rate * n % 1.0)).astype(np.complex64)
+
+
+# samples start..stop of the capture as complex64, BLOCK_SIZE at a time, with the number of the first one
+def read_range(source, start, stop, block_size=BLOCK_SIZE):
+    source.position = start
+    while start < stop:
+        samples = source.read_samples(min(block_size, stop - start))
+        if len(samples) == 0:
+            return
+        yield start, samples
+        start += len(samples)
+
+
+# the reference: the whole capture through one FMStream, in fm_radio_record.py's blocks (one audio piece each)
+def single_pass(path, fmt, rate, settings):
+    source = sources.FileSource(path, rate, fmt=fmt)
+    fm = make_stream(rate, settings)
+    for n0, samples in read_range(source, 0, source.num_samples):
+        yield fm.process(tune(samples, n0, settings['offset'], rate))
+
+
+# per worker process: the capture (mapped once), the settings and the shared memory slots it has attached
+_job = {}
+
+
+def _init(path, fmt, rate, settings, warm):
+    _job.update(source=sources.FileSource(path, rate, fmt=fmt), rate=rate, settings=settings, warm=warm, slots={})
+
+
+# worker: demodulates input samples start..stop into the slot, returns how many audio samples it wrote
+def _demod_segment(start, stop, slot):
+    rate, settings = _job['rate'], _job['settings']
+    if slot not in _job['slots']:
+        _job['slots'][slot] = shared_memory.SharedMemory(name=slot)
+    shm = _job['slots'][slot]
+    out = np.ndarray(shm.size // 4, dtype=np.float32, buffer=shm.buf)
+
+    fm = make_stream(rate, settings, agc=False)
+    first = max(0, start - _job['warm'])
+    skip = audio_count(fm, start - first) # the warm-up's audio is thrown away
+    n = 0
+    for n0, samples in read_range(_job['source'], first, stop):
+        audio = fm.process(tune(samples, n0, settings['offset'], rate))
+        drop = min(skip, len(audio))
+        skip -= drop
+        out[n:n + len(audio) - drop] = audio[drop:]
+        n += len(audio) - drop
+    return n
+
+
+# the capture demodulated across a pool of worker processes, as the same audio pieces single_pass gives
+def batch(path, fmt, rate, settings, workers, segment=SEGMENT_SECONDS):
+    total = sources.FileSource(path, rate, fmt=fmt).num_samples
+    fm = make_stream(rate, settings) # only its AGC runs here, the rest is for the sample counts
+    p = period(fm)
+    length = max(1, min(int(segment * rate), -(-total // (SEGMENTS_PER_WORKER * workers))))
+    length = -(-length // p) * p
+    segments = deque((s, min(s + length, total)) for s in range(0, total, length))
+
+    slots = [shared_memory.SharedMemory(create=True, size=4 * audio_count(fm, length))
+             for _ in range(min(len(segments), SLOTS_PER_WORKER * workers))]
+    views = [np.ndarray(s.size // 4, dtype=np.float32, buffer=s.buf) for s in slots]
+    free = deque(range(len(slots)))
+    running = deque() # (segment end, slot, result) in segment order
+
+    audio = np.zeros(0, np.float32) # stitched audio not yet through the AGC
+    base = 0 # audio sample number of audio[0]
+    block = 0 # input sample number of the next AGC piece
+    try:
+        with mp.Pool(workers, initializer=_init, initargs=(path, fmt, rate, settings, warmup(fm))) as pool:
+            while segments or running:
+                while segments and free:
+                    start, stop = segments.popleft()
+                    k = free.popleft()
+                    running.append((stop, k, pool.apply_async(_demod_segment, (start, stop, slots[k].name))))
+                stop, k, result = running.popleft()
+                count = result.get() # waits for this segment, the later ones keep going meanwhile
+                audio = np.concatenate([audio, views[k][:count]])
+                free.append(k)
+
+                # cut the new audio into fm_radio_record.py's pieces and run them through the AGC
+                while block < stop:
+                    end = min(block + BLOCK_SIZE, total)
+                    if end > stop:
+                        break
+                    a0, a1 = audio_count(fm, block) - base, audio_count(fm, end) - base
+                    with metrics.timer('fm_agc'):
+                        yield fm.agc.process(audio[a0:a1])
+                    audio, base, block = audio[a1:], base + a1, end
+    finally:
+        del views
+        for s in slots:
+            s.close()
+            s.unlink()
+
+
+def digest(audio):
+    return hashlib.sha1(audio.tobytes()).digest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demodulate a long FM capture offline, in parallel segments")
+    parser.add_argument('file', help="recorded capture (.cu8, .cs8 or complex64)")
+    parser.add_argument('--format', choices=list(sources.FORMATS), help="IQ format of the file (guessed from the extension if left out)")
+    parser.add_argument('--rate', type=float, default=SAMPLE_RATE, help="sample rate of the file (default 1.2e6)")
+    parser.add_argument('--offset', type=float, default=0.0, help="station offset from the capture's center in kHz (default 0)")
+    parser.add_argument('--rf-cutoff', type=float, default=RF_CUTOFF / 1e3, help="channel filter cutoff in kHz (default 100)")
+    parser.add_argument('--audio-cutoff', type=float, default=AUDIO_CUTOFF / 1e3, help="audio filter cutoff in kHz (default 15)")
+    parser.add_argument('--tau', type=float, default=TAU * 1e6, help="de-emphasis in µs (default 75, 50 in Europe)")
+    parser.add_argument('--audio-rate', type=int, default=AUDIO_RATE, help="audio sample rate (default 48000)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--segment', type=float, default=SEGMENT_SECONDS, help="longest segment in seconds (default 30)")
+    parser.add_argument('-o', '--output', help="WAV file to write (default: the capture's name with .wav)")
+    parser.add_argument('--verify', action='store_true', help="also run a single pass and check the audio is bit-identical")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args)
+
+    settings = {'audio_rate': args.audio_rate, 'rf_cutoff': args.rf_cutoff * 1e3, 'audio_cutoff': args.audio_cutoff * 1e3,
+                'tau': args.tau * 1e-6, 'offset': args.offset * 1e3}
+    workers = args.workers or os.cpu_count() or 1
+    output = args.output or os.path.splitext(args.file)[0] + '.wav'
+    fmt = args.format or sources.guess_format(args.file)
+    total = sources.FileSource(args.file, args.rate, fmt=fmt).num_samples
+    seconds = total / args.rate
+
+    wav = WavOutput(output, args.audio_rate)
+    digests = []
+    t0 = time.monotonic()
+    try:
+        for audio in batch(args.file, fmt, args.rate, settings, workers, args.segment):
+            with metrics.timer('fm_write'):
+                wav.write(audio)
+            if args.verify:
+                digests.append(digest(audio))
+    finally:
+        wav.close()
+    elapsed = time.monotonic() - t0
+    print(f"{seconds:.1f} s of capture on {workers} workers in {elapsed:.2f} s -- {total / elapsed / 1e6:.1f} MS/s, "
+          f"{seconds / elapsed:.0f}x real time -> {output}")
+
+    if args.verify:
+        t0 = time.monotonic()
+        reference = [digest(audio) for audio in single_pass(args.file, fmt, args.rate, settings)]
+        single = time.monotonic() - t0
+        print(f"Single pass: {single:.2f} s -- {single / elapsed:.1f}x faster on {workers} workers")
+        bad = [k for k, (a, b) in enumerate(zip(reference, digests)) if a != b]
+        if bad or len(reference) != len(digests):
+            first = bad[0] if bad else min(len(reference), len(digests))
+            print(f"NOT identical: {len(bad)} of {len(reference)} blocks differ, first at {first * BLOCK_SIZE / args.rate:.1f} s")
+            sys.exit(1)
+        print(f"Bit-identical to the single pass ({len(reference)} blocks)")
+    metrics.stop()
@@ -0,0 +1,121 @@
+import numpy as np # imports the library to do array math
+from scipy import signal
+from scipy.io import wavfile
+import time # for us to time the two chains
+import os
+from fm_stream import FMStream # the polyphase streaming chain
+from fm_channelizer import Channelizer # FFT filter bank for many stations at once
+
+# benchmark for the FM chain -- no SDR needed, we FM-modulate the audio in fm_radio.wav ourselves
+# and demodulate it with the old full-rate chain and with the polyphase one, then compare CPU time
+# and how close each output is to the audio we started from (SNR)
+# run with: python fm_benchmark.py
+SAMPLE_RATE = 1.2e6 # same as fm_radio_record.py
+AUDIO_RATE = 48000
+DEVIATION = 75e3 # broadcast FM peak deviation
+TAU = 75e-6
+CNR = 25 # carrier to noise in dB (a decent station)
+BLOCK_SIZE = 120 * 1024 # same block size as fm_radio_record.py
+WIDE_RATE = 2.4e6 # capture rate for the many-station comparison (same as fm_spectrum.py)
+WIDE_SECONDS = 4
+STATION_COUNTS = (1, 2, 4, 8)
+WAV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fm_radio.wav')
+
+
+# the chain fm_radio_record.py used to run: everything at 1.2 MS/s in complex128, filtfilt, decimate at the end
+def old_chain(samples):
+    b, a = signal.butter(5, 100e3 / (SAMPLE_RATE / 2), btype='low')
+    filtered = signal.filtfilt(b, a, samples)
+    audio = np.angle(filtered[1:] * np.conj(filtered[:-1]))
+    x = np.exp(-1 / (SAMPLE_RATE * TAU))
+    audio = signal.lfilter([1 - x], [1, -x], audio)
+    b, a = signal.butter(5, 15e3 / (SAMPLE_RATE / 2), btype='low')
+    audio = signal.filtfilt(b, a, audio)
+    return signal.decimate(audio, int(SAMPLE_RATE / AUDIO_RATE), zero_phase=True)
+
+
+def new_chain(samples):
+    fm = FMStream(SAMPLE_RATE, AUDIO_RATE, agc=False) # AGC off so both outputs are compared on the filtering alone
+    out = np.concatenate([fm.process(samples[i:i + BLOCK_SIZE]) for i in range(0, len(samples), BLOCK_SIZE)])
+    # the FIRs are linear phase, so the output is just shifted, by a fraction of a sample too (7.2 at 1.2 MS/s)
+    # which costs a lot of SNR at the top of the audio band if we only line up to the nearest sample
+    delay = fm.delay()
+    freqs = np.fft.rfftfreq(len(out))
+    return np.fft.irfft(np.fft.rfft(out) * np.exp(2j * np.pi * freqs * delay), len(out))
+
+
+# audio -> pre-emphasis -> FM at 1.2 MS/s -> noise
+def modulate(audio, rng):
+    audio = signal.resample_poly(audio, int(SAMPLE_RATE / AUDIO_RATE), 1)
+    x = np.exp(-1 / (SAMPLE_RATE * TAU))
+    audio = signal.lfilter([1, -x], [1 - x], audio) # exact inverse of the de-emphasis
+    audio *= 1 / np.max(np.abs(audio)) # full deviation on the loudest peak
+    phase = 2 * np.pi * DEVIATION * np.cumsum(audio) / SAMPLE_RATE
+    noise = 10 ** (-CNR / 20) / np.sqrt(2)
+    return np.exp(1j * phase) + noise * (rng.normal(size=len(phase)) + 1j * rng.normal(size=len(phase)))
+
+
+# SNR of out against ref after the best gain (and the DC offset) are taken out
+def snr(ref, out):
+    n = min(len(ref), len(out))
+    ref, out = ref[:n] - np.mean(ref[:n]), out[:n] - np.mean(out[:n])
+    skip = AUDIO_RATE // 10 # filter start-up
+    ref, out = ref[skip:], out[skip:]
+    gain = np.dot(ref, out) / np.dot(out, out)
+    return 10 * np.log10(np.sum(ref ** 2) / np.sum((ref - gain * out) ** 2))
+
+
+# K stations from one 2.4 MS/s capture: the channelizer + K demodulators against K single-station chains
+# (each mixing its station down and running its own polyphase filter at the full rate), all in one process
+def run_channelizer(rng):
+    n = int(WIDE_RATE * WIDE_SECONDS)
+    t = np.arange(n) / WIDE_RATE
+    offsets = np.linspace(-1.0e6, 1.0e6, max(STATION_COUNTS)) # 2.4 MHz fits eight 200 kHz channels with room at the edges
+    capture = np.zeros(n, np.complex64)
+    for k, off in enumerate(offsets):
+        phase = 2 * np.pi * DEVIATION * np.cumsum(np.sin(2 * np.pi * (400 + 300 * k) * t)) / WIDE_RATE
+        capture += np.exp(1j * (phase + 2 * np.pi * off * t)).astype(np.complex64)
+    capture += (0.05 * (rng.normal(size=n) + 1j * rng.normal(size=n))).astype(np.complex64)
+    blocks = [capture[i:i + BLOCK_SIZE] for i in range(0, n, BLOCK_SIZE)]
+
+    print(f"\nStations from one {WIDE_RATE/1e6} MS/s capture ({WIDE_SECONDS} s), CPU seconds:")
+    print(f"{'stations':<10} {'single chain x N':>17} {'channelizer':>12}")
+    for count in STATION_COUNTS:
+        offs = offsets[:count]
+        t0 = time.process_time()
+        for off in offs:
+            fm = FMStream(WIDE_RATE, AUDIO_RATE)
+            for i, block in enumerate(blocks):
+                mix = np.exp(-2j * np.pi * off * (np.arange(len(block)) + i * BLOCK_SIZE) / WIDE_RATE).astype(np.complex64)
+                fm.process(block * mix)
+        single = time.process_time() - t0
+
+        t0 = time.process_time()
+        ch = Channelizer(WIDE_RATE, offs)
+        demods = [FMStream(ch.if_rate, AUDIO_RATE, channel=False) for _ in offs]
+        for block in blocks:
+            for fm, samples in zip(demods, ch.process(block)):
+                fm.demodulate(samples)
+        bank = time.process_time() - t0
+        print(f"{count:<10} {single:>17.2f} {bank:>12.2f}")
+
+
+if __name__ == "__main__":
+    rate, audio = wavfile.read(WAV)
+    audio = audio.astype(np.float64) / 32768
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    # broadcast audio stops at 15 kHz, so that is what both chains should give back
+    audio = signal.sosfiltfilt(signal.butter(8, 15e3 / (rate / 2), output='sos'), audio)
+    rng = np.random.default_rng(1)
+    samples = modulate(audio, rng)
+    seconds = len(samples) / SAMPLE_RATE
+    print(f"{seconds:.1f} s of {WAV} at {SAMPLE_RATE/1e6} MS/s, CNR {CNR} dB")
+
+    for name, chain in (('old (filtfilt at 1.2 MS/s)', old_chain), ('polyphase (2 stages)', new_chain)):
+        t0 = time.process_time()
+        out = chain(samples)
+        cpu = time.process_time() - t0
+        print(f"{name:<28} CPU {cpu:6.2f} s ({cpu / seconds:.3f}x real time) | SNR {snr(audio, out):5.1f} dB")
+
+    run_channelizer(rng)
@@ -0,0 +1,224 @@
+import numpy as np # imports the library to do array math
+from scipy.signal import find_peaks # same peak finder as fm_spectrum.py
+import multiprocessing as mp # the demodulators run in their own processes
+import argparse # command line options
+import queue # hands sample blocks from the dongle thread to the channelizer
+import threading
+import time
+import os # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # per-stage timing (--metrics-port / --metrics-json)
+from sdr_common import sources # the dongle, a recorded capture or synthetic IQ behind one interface
+from sdr_common.resample import design_lowpass # same FIR design as the single station chain
+from fm_stream import FMStream, WavOutput, RF_CUTOFF # the rest of the chain, from IF to audio
+from sdr_common.spectrum import welch_psd, bin_freqs, get_noise_floor # spectrum helpers shared with fm_spectrum.py
+
+# demodulate every FM station in one wideband capture instead of one capture per station
+# the channelizer is an FFT filter bank (overlap-save): each frame of the capture is FFT'd once, and every
+# station just takes the bins around its own frequency, multiplied by the channel filter, and an inverse FFT
+# 1/D the size -- that is the filtered, frequency shifted and decimated station at ~240 kS/s in one go
+# the big FFT is shared by all stations, so one more station only costs one small inverse FFT
+# the stations are then demodulated in worker processes, one WAV file per station
+# run with: python fm_channelizer.py [capture.cu8] [--center 96] [--seconds 30] [--workers 4]
+SAMPLE_RATE = 2.4e6 # same as fm_spectrum.py
+CENTER_FREQ = 96e6
+GAIN = 40
+AUDIO_RATE = 48000
+IF_RATE = 240e3 # rate each station comes out at (a whole fraction of the sample rate)
+OUT_FFT = 1024 # inverse FFT size per station and frame (the forward FFT is this times the decimation)
+BLOCK_SIZE = 240 * 1024 # samples per block (~100 ms at 2.4 MS/s)
+CHANNEL_WIDTH = 200e3 # FM stations are ~200 kHz wide
+QUEUE_BLOCKS = 8 # blocks a worker may fall behind before the channelizer waits for it
+
+
+# find the FM stations in a capture, the fm_spectrum.py way (averaged FFT, noise floor from the lowest 20%,
+# find_peaks) but on the power summed over a channel width, since a wideband FM station is a ~150 kHz wide
+# plateau with its own ripples and peaks, not one spike
+# returns the station frequencies (Hz) snapped to the 100 kHz grid, strongest first
+def find_stations(samples, sample_rate, center_freq, nfft=8192, min_snr=8):
+    psd = welch_psd(samples, nfft)
+    width = int(CHANNEL_WIDTH / sample_rate * nfft) # bins per channel
+    channel_power = 10 * np.log10(np.convolve(psd, np.ones(width) / width, mode='same') + 1e-20)
+    freqs = bin_freqs(center_freq, sample_rate, nfft)
+
+    noise_floor = get_noise_floor(10 * np.log10(psd + 1e-20))
+    peaks, _ = find_peaks(channel_power, height=noise_floor + min_snr, distance=width // 2, prominence=3)
+
+    stations = []
+    for peak in peaks[np.argsort(channel_power[peaks])[::-1]]:
+        freq = round(freqs[peak] / 100e3) * 100e3
+        if abs(freq - center_freq) > sample_rate / 2 - CHANNEL_WIDTH / 2: # too close to the edge to get all of it
+            continue
+        if all(abs(freq - f) >= CHANNEL_WIDTH * 0.75 for f in stations): # keep one per channel
+            stations.append(freq)
+    return stations
+
+
+class Channelizer:
+    def __init__(self, sample_rate, offsets, cutoff=RF_CUTOFF, if_rate=IF_RATE, out_fft=OUT_FFT):
+        self.decimation = D = max(1, round(sample_rate / if_rate))
+        self.if_rate = sample_rate / D
+        # stop at the edge of what the small inverse FFT keeps, so nothing outside it aliases back in
+        taps = design_lowpass(sample_rate, cutoff, self.if_rate / 2)
+        M = out_fft
+        while M * D < 4 * len(taps): # keep the overlap (filter length) a small part of the frame
+            M *= 2
+        self.N, self.M = M * D, M
+        self.overlap = D * -(-(len(taps) - 1) // D) # input samples each frame shares with the one before
+        self.step = self.N - self.overlap
+        self.delay = (len(taps) - 1) / 2 / D # group delay in output samples
+
+        # every station takes the M bins around its own bin (in FFT order: 0, 1, ..., -1) times the filter response
+        # the station frequency is rounded to the nearest bin (within sample_rate / 2N, ~100 Hz, nothing for FM)
+        k = np.fft.fftfreq(M, 1 / M).astype(int)
+        self.bins = np.array([int(round(off * self.N / sample_rate)) for off in offsets], dtype=int)
+        self.index = (self.bins[:, None] + k[None, :]) % self.N # (stations, M)
+        H = np.fft.fft(taps, self.N)
+        self.response = (H[k % self.N] / D).astype(np.complex64) # 1/D: the small inverse FFT is D times shorter
+        self.offsets = self.bins * sample_rate / self.N # the frequencies we really shift by
+
+        self.pending = np.zeros(self.overlap, dtype=np.complex64) # the overlap from the last frame + leftover samples
+        self.n0 = 0 # input number of the first sample of the next frame (minus the overlap)
+
+    # one block of samples in, a list with the new IF samples of every station out
+    def process(self, block):
+        x = np.concatenate([self.pending, block.astype(np.complex64, copy=False)])
+        frames = (len(x) - self.overlap) // self.step
+        if frames == 0:
+            self.pending = x
+            return [np.zeros(0, np.complex64) for _ in self.bins]
+        with metrics.timer('fm_channelize'):
+            # all the frames of the block as rows (they overlap, so this is a strided view, no copy)
+            starts = np.arange(frames) * self.step
+            view = np.lib.stride_tricks.sliding_window_view(x, self.N)[starts]
+            X = np.fft.fft(view, axis=1) # (frames, N)
+            Y = X[:, self.index] * self.response # (frames, stations, M)
+            y = np.fft.ifft(Y, axis=2)[:, :, self.overlap // self.decimation:] # overlap-save: the first part wrapped around
+            # taking bins around bin c shifts each frame as if it started at sample 0, put the real start back in
+            n = self.n0 + starts
+            y *= np.exp(-2j * np.pi * np.outer(n, self.bins) / self.N)[:, :, None]
+            out = y.transpose(1, 0, 2).reshape(len(self.bins), -1).astype(np.complex64)
+        self.n0 += frames * self.step
+        self.pending = x[frames * self.step:].copy()
+        return list(out)
+
+
+# worker process: demodulates its share of the stations and writes one WAV each
+def _worker(inbox, jobs, if_rate, audio_rate):
+    streams = {k: (FMStream(if_rate, audio_rate, channel=False), WavOutput(path, audio_rate)) for k, path in jobs.items()}
+    try:
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            for k, samples in item:
+                fm, wav = streams[k]
+                wav.write(fm.demodulate(samples))
+    finally:
+        for fm, wav in streams.values():
+            wav.close()
+
+
+# the pool of demodulator processes, each one owns some of the stations for the whole run
+# (the filter and AGC state of a station has to stay in one place)
+class DemodPool:
+    def __init__(self, paths, if_rate, audio_rate=AUDIO_RATE, workers=None):
+        workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+        self.owner = [k % workers for k in range(len(paths))]
+        self.inboxes = [mp.Queue(QUEUE_BLOCKS) for _ in range(workers)]
+        self.procs = []
+        for w in range(workers):
+            jobs = {k: path for k, path in enumerate(paths) if self.owner[k] == w}
+            p = mp.Process(target=_worker, args=(self.inboxes[w], jobs, if_rate, audio_rate), daemon=True)
+            p.start()
+            self.procs.append(p)
+
+    # the new IF samples of every station (one list entry per station)
+    def send(self, outputs):
+        batches = [[] for _ in self.inboxes]
+        for k, samples in enumerate(outputs):
+            if len(samples):
+                batches[self.owner[k]].append((k, samples))
+        for inbox, batch in zip(self.inboxes, batches):
+            if batch:
+                inbox.put(batch) # waits when a worker is QUEUE_BLOCKS behind, so memory stays bounded
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for p in self.procs:
+            p.join()
+
+
+# blocks from a sample source, read on its own thread like fm_radio_record.py
+# (a capture file or a synthetic source with a duration ends by itself, seconds only limits the dongle)
+def source_blocks(source, seconds, block_size):
+    blocks = queue.Queue(QUEUE_BLOCKS * 2)
+
+    def read():
+        source.read_samples_async(lambda s, c: blocks.put(s), block_size)
+        blocks.put(None) # the end of a file
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        for _ in range(int(source.sample_rate * seconds) // block_size if seconds else sys.maxsize):
+            block = blocks.get()
+            if block is None:
+                return
+            yield block
+    finally:
+        source.cancel_read_async()
+        reader.join(timeout=2)
+        source.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demodulate every FM station in one wideband capture")
+    parser.add_argument('file', nargs='?', help="recorded capture (.cu8, .cs8 or complex64), leave out to use the dongle")
+    parser.add_argument('--center', type=float, default=CENTER_FREQ / 1e6, help="center frequency in MHz (default 96)")
+    parser.add_argument('--rate', type=float, default=SAMPLE_RATE, help="sample rate of the file (default 2.4e6)")
+    parser.add_argument('--seconds', type=float, default=30, help="live (or synthetic): seconds to record, 0 = until Ctrl-C")
+    sources.add_arguments(parser)
+    parser.add_argument('--workers', type=int, help="demodulator processes (default: one per CPU, at most one per station)")
+    parser.add_argument('--outdir', default='.', help="where to write the fm_<MHz>.wav files")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.setup(args)
+    center = args.center * 1e6
+
+    if args.file:
+        source = sources.FileSource(args.file, args.rate, center)
+    else:
+        source = sources.open_source(args.source, args.rate, center, GAIN, duration=args.seconds or None)
+    rate = source.sample_rate
+    blocks = source_blocks(source, args.seconds if isinstance(source, sources.RtlSdrSource) else 0, BLOCK_SIZE)
+
+    first = next(blocks) # the first ~100 ms is enough to find the stations
+    stations = find_stations(first, rate, center)
+    if not stations:
+        print("No stations detected")
+        sys.exit(1)
+    print(f"Found {len(stations)} stations: " + ", ".join(f"{f/1e6:.1f}" for f in stations))
+
+    channelizer = Channelizer(rate, [f - center for f in stations])
+    os.makedirs(args.outdir, exist_ok=True)
+    paths = [os.path.join(args.outdir, f"fm_{f/1e6:.1f}.wav") for f in stations]
+    pool = DemodPool(paths, channelizer.if_rate, workers=args.workers)
+
+    t0 = time.monotonic()
+    total = 0
+    try:
+        block = first
+        while block is not None:
+            pool.send(channelizer.process(block))
+            total += len(block)
+            block = next(blocks, None)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        pool.close()
+    elapsed = time.monotonic() - t0
+    print(f"{total / rate:.1f} s of capture, {len(stations)} stations in {elapsed:.2f} s -> " + ", ".join(paths))
+    metrics.stop()
@@ -1,126 +1,106 @@
-import numpy as np
-from rtlsdr import RtlSdr
-from scipy import signal
-from scipy.io import wavfile # imports the WAV file writing functions
-
-# configuration 
+import argparse # command line options (station, duration, live audio, metrics)
+import queue # hands sample blocks from the dongle thread to the demodulator
+import threading
+import time # to time the whole processing chain
+import os # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # per-stage timing (--metrics-port / --metrics-json)
+from sdr_common import sources # the dongle, a recorded capture or synthetic IQ behind one interface
+from fm_stream import FMStream, WavOutput, AudioOutput # the block-streaming demod chain
+
+# configuration
 STATION_FREQ = 96.3e6      # from the spectrum found the strongest one - tune into this one (can change)
 SAMPLE_RATE = 1.2e6        # FM station is 200 KHz wide - chose a sampling way above nyquist - can filter out the less important stuff later
 AUDIO_RATE = 48000         # audio output - standard
 GAIN = 35                  # gain in the middle (surrounding me, don't need too much gain)
-DURATION = 10              # how long to record (can change)
-
-print(f"\nTuning to: {STATION_FREQ/1e6:.1f} MHz")
-print(f"Sample Rate: {SAMPLE_RATE/1e6} MHz")
-print(f"Duration: {DURATION} seconds")
-
-# SDR setup
-sdr = RtlSdr() # creating the object
-sdr.sample_rate = SAMPLE_RATE # how fast to capture the samples through the SDR
-sdr.center_freq = STATION_FREQ # what frequency to tune into 
-sdr.gain = GAIN # sets the amplifier gain
-
-print("\nCapturing RF data...might take a while")
-num_samples = int(SAMPLE_RATE * DURATION) # need the samples to be in int not float
-samples = sdr.read_samples(num_samples) # capturing the RF data, this is complex numbers 
-sdr.close() # disconnect from the SDR
-
-print(f"Captured {len(samples):,} samples.")
-
-# apply low-pass filter to isolate FM signal
-print("\nFiltering RF signal...")
-# FM stations are ~200 kHz wide
-cutoff = 100e3  # 100 kHz cutoff
-nyquist = SAMPLE_RATE / 2 # using the shannon theorem
-normal_cutoff = cutoff / nyquist # normalizing the cutoff from 0 to 1 for filter use
-
-# design low-pass filter (butterworth)
-b, a = signal.butter(5, normal_cutoff, btype='low') # use 5 as the cutoff, not too sharp
-samples_filtered = signal.filtfilt(b, a, samples) # use the filter design from above on the samples, removes phase shifts 
-
-print("RF signal filtered")
-
-# FM Demodulation
-print("\nNow FM Demodulation...")
-
-# polar discriminator method was better than simple diff
-# below is code for the diff -- too much static ----
-# phase = np.angle(samples)
-# phase_unwrapped = np.unwrap(phase)
-# audio = np.diff(phase_unwrapped)
-# --------------------------------------------------
-
-# the idea is simple: get all samples besides first
-# get all samples besides the last
-# multiply the current sample by the conjugate of the previous sample 
-# since FM encodes audio in frequency and frequency is the derivative of phase (so rate of change in phase is frequency which is audio)
-# the result is the phase difference therefore the frequency
-y = samples_filtered[1:] * np.conj(samples_filtered[:-1])
-audio_angle = np.angle(y) # extract the phase from complex numbers
-
-print(f"Demodulated: {len(audio_angle):,} samples")
-
-# de-emphasis filter (FM broadcast standard)
-print("\nDe-emphasis filter...")
-tau = 75e-6  # 75 microseconds (US FM standard)
-d = SAMPLE_RATE * tau # the time constant in number of samples (seconds -> samples)
-x = np.exp(-1/d) # calculate filter coefficient
-# define filter coefficients for a first order IIR filter
-b_deemph = [1 - x] 
-a_deemph = [1, -x]
-audio_deemph = signal.lfilter(b_deemph, a_deemph, audio_angle) # uses a linear filter function
-
-# low-pass filter for audio (remove high-freq noise)
-print("\nAudio filtering...")
-audio_cutoff = 15000  # 15 kHz (human hearing limit)
-audio_nyquist = SAMPLE_RATE / 2 # using the shannon theorem
-audio_normal_cutoff = audio_cutoff / audio_nyquist # normalizing the cutoff from 0 to 1 for filter use
-
-b_audio, a_audio = signal.butter(5, audio_normal_cutoff, btype='low') # use 5 as the cutoff, not too sharp
-audio_filtered = signal.filtfilt(b_audio, a_audio, audio_deemph) # use the filter design from above on the audio, removes high frequency noise
-
-# decimate/resample to audio rate, we sampled too high
-print(f"Resampling to {AUDIO_RATE} Hz...")
-
-# calculate decimation factor (how much to downsample)
-decimation = int(SAMPLE_RATE / AUDIO_RATE)
-if decimation > 1:
-    # signal.decimate is a smart way to downsample the audio
-    # it doesn't just throw away samples
-    # applies anti-aliasing filter, then downsamples by factor, prevents aliasing
-    # zero_phase set to true for no phase distortion 
-    audio_decimated = signal.decimate(audio_filtered, decimation, zero_phase=True)
-else:
-    # if it is not an integer resample
-    # uses FFT-based resampling
-    audio_decimated = signal.resample(audio_filtered, int(len(audio_filtered) * AUDIO_RATE / SAMPLE_RATE))
-
-print(f"Audio: {len(audio_decimated):,} samples at {AUDIO_RATE} Hz")
-
-# Normalize
-print("\nNormalizing volume...")
-
-# remove DC offset so the audio averages to 0
-audio_decimated = audio_decimated - np.mean(audio_decimated)
-
-# normalize to prevent clipping
-max_val = np.max(np.abs(audio_decimated)) # finding the loudest point in audio, can be negative so take abs
-if max_val > 0:
-    # normalizing and scaling the audio
-    audio_normalized = audio_decimated / max_val
-    audio_normalized *= 0.5  # 50% volume to prevent distortion
-else:
-    audio_normalized = audio_decimated
-
-# convert to int16 since WAV file format uses integers, not floats
-audio_int16 = (audio_normalized * 32767).astype(np.int16)
-
-print(f"Max amplitude: {np.max(np.abs(audio_normalized)):.2f}")
-
-# save to WAV
-wav_filename = 'fm_radio.wav'
-print(f"\nSaving to {wav_filename}...")
-
-wavfile.write(wav_filename, AUDIO_RATE, (audio_normalized * 32767).astype(np.int16))
-
-print(f"\nSaved to {wav_filename}")
\ No newline at end of file
+DURATION = 10              # how long to record (can change, 0 = until Ctrl-C)
+BLOCK_SIZE = 120 * 1024    # samples per block (~100 ms), memory use only depends on this, not on the duration
+QUEUE_BLOCKS = 16          # blocks the demodulator may fall behind before we start dropping
+
+# the old version captured everything first and then filtered the whole array (filtfilt) and normalized
+# against the loudest point, so memory grew with the duration and nothing could be heard live
+# now the dongle's async read hands ~100 ms blocks to a queue and every block is demodulated and written
+# (or played) as soon as it arrives, with all the filter state carried over between blocks (see fm_stream.py)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demodulate a broadcast FM station block by block to a WAV file and/or the speakers")
+    parser.add_argument('--freq', type=float, default=STATION_FREQ / 1e6, help="station in MHz (default 96.3)")
+    parser.add_argument('--duration', type=float, default=DURATION, help="seconds to record, 0 = until Ctrl-C (default 10)")
+    parser.add_argument('--play', action='store_true', help="play the audio live through pyaudio")
+    parser.add_argument('-o', '--output', default='fm_radio.wav', help="WAV file to write (default fm_radio.wav, '' for none)")
+    sources.add_arguments(parser) # --source synthetic / a capture file instead of the dongle (fed at the real sample rate)
+    metrics.add_arguments(parser) # stage timings go into stage_seconds{stage="fm_..."}
+    args = parser.parse_args()
+    metrics.setup(args)
+
+    print(f"\nTuning to: {args.freq:.1f} MHz")
+    print(f"Sample Rate: {SAMPLE_RATE/1e6} MHz")
+    print(f"Duration: {args.duration} seconds" if args.duration else "Duration: until Ctrl-C")
+
+    # SDR setup (the dongle only opens when the reader thread starts reading)
+    sdr = sources.open_source(args.source, SAMPLE_RATE, args.freq * 1e6, GAIN, realtime=True)
+
+    fm = FMStream(SAMPLE_RATE, AUDIO_RATE)
+    outputs = []
+    if args.output:
+        outputs.append(WavOutput(args.output, AUDIO_RATE))
+    if args.play:
+        outputs.append(AudioOutput(AUDIO_RATE))
+
+    samples_read = metrics.counter('fm_samples_total', 'samples read from the dongle')
+    blocks_dropped = metrics.counter('fm_blocks_dropped_total', 'blocks dropped because the demodulator fell behind')
+    rtf = metrics.gauge('fm_real_time_factor', 'processing time divided by the audio duration (under 1 keeps up)')
+    blocks = queue.Queue(QUEUE_BLOCKS) # bounded, so a stall can't eat all the memory
+    total_blocks = int(SAMPLE_RATE * args.duration) // BLOCK_SIZE if args.duration else None
+    dropped = 0
+
+    # runs on the dongle's thread: just queue the block, the main thread does the work
+    def on_samples(samples, context):
+        global dropped
+        try:
+            blocks.put_nowait(samples)
+        except queue.Full:
+            dropped += 1
+            blocks_dropped.inc()
+
+    # the reader thread; a capture file ends, that is passed on as None
+    def read():
+        sdr.read_samples_async(on_samples, BLOCK_SIZE)
+        blocks.put(None)
+
+    reader = threading.Thread(target=read, daemon=True)
+    print("\nListening..." if args.play else "\nRecording...")
+    reader.start()
+
+    busy = 0.0 # seconds spent demodulating
+    done = 0
+    try:
+        while total_blocks is None or done < total_blocks:
+            samples = blocks.get()
+            if samples is None:
+                break
+            samples_read.inc(len(samples))
+            t0 = time.monotonic()
+            audio = fm.process(samples)
+            busy += time.monotonic() - t0
+            for out in outputs:
+                with metrics.timer('fm_write'):
+                    out.write(audio)
+            done += 1
+            rtf.set(busy / (done * BLOCK_SIZE / SAMPLE_RATE))
+            if done % 10 == 0:
+                print(f"{done * BLOCK_SIZE / SAMPLE_RATE:.1f} s | real time factor {busy / (done * BLOCK_SIZE / SAMPLE_RATE):.2f} | dropped blocks {dropped}", end='\r')
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        sdr.cancel_read_async()
+        reader.join(timeout=2)
+        sdr.close() # disconnect from the SDR
+        for out in outputs:
+            out.close()
+
+    seconds = done * BLOCK_SIZE / SAMPLE_RATE
+    print(f"\n{seconds:.1f} s of audio, demodulated in {busy:.2f} s ({busy / max(seconds, 1e-9):.2f}x real time), {dropped} blocks dropped")
+    if args.output:
+        print(f"Saved to {args.output}")
+    metrics.stop() # final JSON dump
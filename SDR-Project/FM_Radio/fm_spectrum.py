@@ -1,119 +1,188 @@
 import numpy as np                      # imports the library to do array math
 import matplotlib.pyplot as plt         # imports the library to graph and visualize
-from rtlsdr import RtlSdr               # imports RTL-SDR radio control class which lets us talk to the RTL-SDR hardware
-from scipy.signal import find_peaks     # import peak-finding function from SciPy, automatically detect stations 
-
-# create RTL-SDR object - represents the physical RTL-SDR dongle
-sdr = RtlSdr()
+from scipy.signal import find_peaks     # import peak-finding function from SciPy, automatically detect stations
+import argparse                         # command line options (single capture or sweep)
+import time                             # to time the sweep
+import os                               # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common.spectrum import welch_psd, bin_freqs, get_noise_floor # batched Welch PSD, shared with the other receivers
+from sdr_common.band_monitor import BandMonitor # memory-mapped average, waterfall and occupancy index
+from sdr_common import sources # the dongle, a recorded capture or synthetic IQ behind one interface
 
 # configure SDR
 sample_rate = 2.4e6  # 2.4 MHz - this is the sample rate by how fast the data is captured - limitation
 center_freq = 96e6  # change to any frequency you want center at
-
-# configuring the hardware what frequency to tune into and how fast to sample
-sdr.sample_rate = sample_rate
-sdr.center_freq = center_freq
-
-sdr.gain = 40 # amplifies weak signals (but really not needed as these waves are near me)
-
-# printing messages to let us know the settings and when it will start to capture the samples 
-print("\nRTL-SDR Connected!")                         
-print(f"Center Frequency: {center_freq/1e6} MHz")
-print(f"Sample Rate: {sample_rate/1e6} MHz")
-print(f"Gain: {sdr.gain} dB")
-print("\nCapturing RF data...")
-
-# capture samples
-samples = sdr.read_samples(1024*1024) # Capture 1,048,576 samples from RTL-SDR, get lots of data for good spectrum resolution, the output is complex array
-sdr.close() # close connection to the RTL-SDR
-
-print(f"Captured {len(samples)} samples!") # printing how many samples captured 
-
-# compute FFT with averaging to reduce noise
-# divide samples into chunks of 8192
-chunk_size = 8192
-num_chunks = len(samples) // chunk_size
-fft_avg = np.zeros(chunk_size) # create array of zeros, size 8192, later will store the averaged FFT result
-
-# loop through each chunk
-for i in range(num_chunks):
-    chunk = samples[i*chunk_size:(i+1)*chunk_size] # process one chunk at a time
-    fft_chunk = np.abs(np.fft.fftshift(np.fft.fft(chunk))) # frequency spectrum of this chunk, by taking the fast fourier transform, making sure 0 Hz is in the center, lastly taking the absolute value to get the magnitude instead of the phase 
-    fft_avg += fft_chunk # add all of these chunks to get the overall FFT avg
-
-fft_avg = fft_avg / num_chunks # divide by number of chunks, to get the avg
-fft_power = 20 * np.log10(fft_avg) # converting to decibels
-
-# frequency axis
-freqs = np.linspace(-sample_rate/2, sample_rate/2, chunk_size) # make evenly spaced array, with proper frequency range by matching with the FFT output size
-freqs_mhz = (freqs + center_freq) / 1e6 # add center frequency, convert Hz to MHz
-
-# plot
-plt.figure(figsize=(14, 7)) # creating the figure window
-plt.plot(freqs_mhz, fft_power, linewidth=1, color='blue') # x-axis, y-axis, line thickness, and color
-# label the axes and title
-plt.xlabel('Frequency (MHz)', fontsize=14, fontweight='bold')
-plt.ylabel('Power (dB)', fontsize=14, fontweight='bold')
-plt.title('RF Spectrum', fontsize=16, fontweight='bold')
-# add grid lines that are dashed
-plt.grid(True, alpha=0.5, linestyle='--')
-# adding axes limits to see the graph properly
-plt.xlim([88, 108])
-plt.ylim([np.min(fft_power), np.max(fft_power) + 5])
-
-# find peaks
-# must be 8 dB above average
-# peaks must be 20 points apart
-# must stand out by 3 dB
-peaks, properties = find_peaks(fft_power, 
-                                height=np.mean(fft_power) + 8,
-                                distance=20,
-                                prominence=3)
-
-# if any peaks found
-if len(peaks) > 0:
-    print(f"\nFOUND {len(peaks)} FM STATIONS!")
-    print("\nTop 10 or less stations:")
-    
-    # sort by power
-    peak_powers = fft_power[peaks] # get power at each peak
-    sorted_indices = np.argsort(peak_powers)[::-1]  # get indices that would sort array in descending order
-    
-    # printing the top 10 and formatting to certain decimal places
-    for i, idx in enumerate(sorted_indices[:10]):
-        peak = peaks[idx]
-        freq = freqs_mhz[peak]
-        power = fft_power[peak]
-        print(f"Station {i+1}: {freq:.2f} MHz at {power:.1f} dB")
-    
-    # mark all peaks on plot, legend included
-    plt.plot(freqs_mhz[peaks], fft_power[peaks], 
-             "x", color='red', markersize=8, 
-             markeredgewidth=2, label=f'{len(peaks)} Detected Stations')
-    plt.legend(fontsize=12)
-else:
-    print("\nNo stations detected")
-
-# finding SNR - tells us how much stronger the signal is from the noise
-# sorts from low to high (weak to strong)
-sorted_power = np.sort(fft_power)
-
-# The average background noise level, when there's no signal, this is what you measure, everything above this is actual signal, choosing the lowest 20 percent -- int
-noise_floor = np.mean(sorted_power[:int(len(sorted_power) * 0.2)])
-
-print(f"\nNoise floor: {noise_floor:.1f} dB")
-
-if len(peaks) > 0:
-    print(f"\nFOUND {len(peaks)} FM STATIONS (with SNR):")
-    print("\nTop 10 Stations or less stations:")
-    
-    for i, idx in enumerate(sorted_indices[:10]):
-        peak = peaks[idx] # Index in frequency array
-        freq = freqs_mhz[peak] # frequency in MHz
-        power = fft_power[peak] # power in dB
-        snr = power - noise_floor  # subtracts(dB) noise floor from signal power: result is Signal-to-Noise Ratio (SNR), subtraction is division in dB
-        print(f"Station {i+1}: {freq:.2f} MHz at {power:.1f} dB (SNR: {snr:.1f} dB)")
-
-plt.tight_layout()
-plt.show() # display the plot
-
+gain = 40 # amplifies weak signals (but really not needed as these waves are near me)
+
+# one capture only sees 2.4 MHz, so to see the whole FM band we sweep: retune in hops, throw away the samples
+# right after each retune (the tuner is still settling), take a Welch PSD of each hop and stitch the middle
+# of every hop (the edges roll off in the dongle's filter) into one band-wide spectrum
+NFFT = 1024           # bins per FFT (2.3 kHz each at 2.4 MS/s)
+HOP_SAMPLES = 64 * 1024 # samples averaged per hop (27 ms)
+SETTLE_SAMPLES = 16 * 1024 # samples thrown away after a retune (~7 ms)
+USABLE = 0.75         # middle part of each hop that we keep
+HOP_OVERLAP = 0.1     # neighbouring hops share this much of their usable part (averaged together)
+
+
+# one hop: retune, let it settle, capture and take the PSD
+def capture_hop(sdr, freq, num_samples=HOP_SAMPLES, settle=SETTLE_SAMPLES):
+    sdr.center_freq = freq
+    samples = sdr.read_samples(settle + num_samples)[settle:] # first samples after a retune are garbage
+    return welch_psd(samples, NFFT)
+
+
+# sweep start..stop (Hz), returns the stitched frequency axis (Hz) and power (linear)
+def sweep(sdr, start, stop, rate=sample_rate, nfft=NFFT):
+    bin_width = rate / nfft
+    keep = int(nfft * USABLE) // 2 # bins kept either side of the hop center
+    step = int(2 * keep * (1 - HOP_OVERLAP)) * bin_width # hop spacing, a whole number of bins so the hops line up
+    grid = np.arange(start, stop + bin_width, bin_width)
+    total = np.zeros(len(grid))
+    count = np.zeros(len(grid))
+
+    centers = np.arange(start + keep * bin_width, stop + step, step)
+    for center in centers:
+        psd = capture_hop(sdr, center)
+        part = psd[nfft // 2 - keep:nfft // 2 + keep]
+        first = int(round((center - start) / bin_width)) - keep # grid index of the first kept bin
+        lo, hi = max(first, 0), min(first + len(part), len(grid))
+        total[lo:hi] += part[lo - first:hi - first]
+        count[lo:hi] += 1
+    return grid, total / np.maximum(count, 1)
+
+
+# find the stations in a spectrum, same test as always: 8 dB above the average, 3 dB prominence
+# peaks must be at least min_spacing (Hz) apart
+def find_stations(freqs, fft_power, min_spacing=150e3):
+    spacing = max(1, int(min_spacing / (freqs[1] - freqs[0])))
+    peaks, properties = find_peaks(fft_power,
+                                    height=np.mean(fft_power) + 8,
+                                    distance=spacing,
+                                    prominence=3)
+    return peaks
+
+
+# keep measuring and add every spectrum to the band monitor in directory, until Ctrl-C
+# (draw it or query it from another terminal with sdr_common/band_monitor.py)
+def monitor(sdr, directory, sweep_range=None, center=center_freq, interval=1.0):
+    def measure():
+        if sweep_range:
+            return sweep(sdr, *sweep_range)
+        sdr.center_freq = center
+        return bin_freqs(center, sample_rate, NFFT), welch_psd(sdr.read_samples(HOP_SAMPLES), NFFT)
+
+    freqs, psd = measure()
+    band = BandMonitor(directory, freqs)
+    try:
+        while True:
+            t0 = time.monotonic()
+            band.update(psd)
+            if band.updates() % 10 == 0:
+                band.flush()
+                print(f"{band.updates()} updates | last took {time.monotonic() - t0:.2f} s", end='\r')
+            time.sleep(max(0.0, interval - (time.monotonic() - t0)))
+            freqs, psd = measure()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        band.flush()
+
+
+def show_spectrum(freqs_mhz, fft_power, title='RF Spectrum'):
+    # plot
+    plt.figure(figsize=(14, 7)) # creating the figure window
+    plt.plot(freqs_mhz, fft_power, linewidth=1, color='blue') # x-axis, y-axis, line thickness, and color
+    # label the axes and title
+    plt.xlabel('Frequency (MHz)', fontsize=14, fontweight='bold')
+    plt.ylabel('Power (dB)', fontsize=14, fontweight='bold')
+    plt.title(title, fontsize=16, fontweight='bold')
+    # add grid lines that are dashed
+    plt.grid(True, alpha=0.5, linestyle='--')
+    # axes limits: only what we actually measured
+    plt.xlim([freqs_mhz[0], freqs_mhz[-1]])
+    plt.ylim([np.min(fft_power), np.max(fft_power) + 5])
+
+    peaks = find_stations(freqs_mhz * 1e6, fft_power)
+
+    # if any peaks found
+    if len(peaks) > 0:
+        # sort by power
+        peak_powers = fft_power[peaks] # get power at each peak
+        sorted_indices = np.argsort(peak_powers)[::-1]  # get indices that would sort array in descending order
+
+        # finding SNR - tells us how much stronger the signal is from the noise
+        noise_floor = get_noise_floor(fft_power)
+        print(f"\nNoise floor: {noise_floor:.1f} dB")
+        print(f"\nFOUND {len(peaks)} FM STATIONS (with SNR):")
+        print("\nTop 10 Stations or less stations:")
+
+        for i, idx in enumerate(sorted_indices[:10]):
+            peak = peaks[idx] # Index in frequency array
+            freq = freqs_mhz[peak] # frequency in MHz
+            power = fft_power[peak] # power in dB
+            snr = power - noise_floor  # subtracts(dB) noise floor from signal power: result is Signal-to-Noise Ratio (SNR), subtraction is division in dB
+            print(f"Station {i+1}: {freq:.2f} MHz at {power:.1f} dB (SNR: {snr:.1f} dB)")
+
+        # mark all peaks on plot, legend included
+        plt.plot(freqs_mhz[peaks], fft_power[peaks],
+                 "x", color='red', markersize=8,
+                 markeredgewidth=2, label=f'{len(peaks)} Detected Stations')
+        plt.legend(fontsize=12)
+    else:
+        print("\nNo stations detected")
+
+    plt.tight_layout()
+    plt.show() # display the plot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FM band spectrum -- one 2.4 MHz capture, or a sweep across any range")
+    parser.add_argument('--center', type=float, default=center_freq / 1e6, help="single capture: center frequency in MHz (default 96)")
+    parser.add_argument('--sweep', type=float, nargs=2, metavar=('START', 'STOP'), help="sweep from START to STOP MHz, e.g. --sweep 88 108")
+    parser.add_argument('--monitor', metavar='DIR', help="keep running and record the average, waterfall and occupancy in DIR")
+    parser.add_argument('--interval', type=float, default=1.0, help="with --monitor: seconds between updates (default 1)")
+    sources.add_arguments(parser) # --source synthetic sweeps a made-up FM band, no dongle needed
+    args = parser.parse_args()
+
+    # the RTL-SDR (or whatever --source says), set to what frequency to tune into and how fast to sample
+    # the dongle itself is only opened on the first read
+    sdr = sources.open_source(args.source, sample_rate, args.center * 1e6, gain)
+
+    # printing messages to let us know the settings and when it will start to capture the samples
+    if isinstance(sdr, sources.RtlSdrSource):
+        print("\nRTL-SDR Connected!")
+        print(f"Sample Rate: {sample_rate/1e6} MHz")
+        print(f"Gain: {sdr.gain} dB")
+    else:
+        print(f"\nSource: {args.source}")
+        print(f"Sample Rate: {sample_rate/1e6} MHz")
+
+    if args.monitor:
+        sweep_range = (args.sweep[0] * 1e6, args.sweep[1] * 1e6) if args.sweep else None
+        print(f"\nMonitoring into {args.monitor} (Ctrl-C to stop)...")
+        monitor(sdr, args.monitor, sweep_range, args.center * 1e6, args.interval)
+        sdr.close()
+        sys.exit()
+
+    if args.sweep:
+        start, stop = args.sweep[0] * 1e6, args.sweep[1] * 1e6
+        print(f"\nSweeping {start/1e6:.1f} - {stop/1e6:.1f} MHz...")
+        t0 = time.monotonic()
+        freqs, psd = sweep(sdr, start, stop)
+        sdr.close() # close connection to the RTL-SDR
+        print(f"Swept {len(freqs):,} bins in {time.monotonic() - t0:.2f} s")
+        title = f'RF Spectrum {start/1e6:.1f} - {stop/1e6:.1f} MHz (sweep)'
+    else:
+        print(f"Center Frequency: {args.center} MHz")
+        print("\nCapturing RF data...")
+        # capture samples
+        samples = sdr.read_samples(1024*1024) # Capture 1,048,576 samples from RTL-SDR, get lots of data for good spectrum resolution, the output is complex array
+        sdr.close() # close connection to the RTL-SDR
+        print(f"Captured {len(samples)} samples!") # printing how many samples captured
+        psd = welch_psd(samples, 8192) # 8192 bins like before, windowed and averaged in one batched FFT
+        freqs = bin_freqs(args.center * 1e6, sample_rate, 8192)
+        title = 'RF Spectrum'
+
+    fft_power = 10 * np.log10(psd + 1e-20) # converting to decibels (it is already power, so 10 not 20)
+    show_spectrum(freqs / 1e6, fft_power, title)
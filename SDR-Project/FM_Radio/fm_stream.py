@@ -0,0 +1,147 @@
+import numpy as np # imports the library to do array math
+from scipy import signal # filter design and the stateful filters
+import wave # WAV writer that can be appended to block by block
+import os # to find the shared sdr_common package
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # per-stage timing (free when metrics are off)
+from sdr_common.resample import Resampler # streaming polyphase FIR resampler (shared with the Meteor recorder)
+
+# block-streaming version of the FM chain in fm_radio_record.py
+# every filter is causal and keeps its state (zi) from one block to the next, the discriminator keeps the
+# last sample of the previous block, and the volume comes from a running AGC instead of the loudest point
+# of the whole recording, so a block can be turned into audio the moment it arrives and memory never grows
+# the rate comes down in two polyphase stages so almost nothing runs at the full sample rate:
+#   channel filter + decimate to ~240 kS/s (complex64) -> discriminator + de-emphasis -> audio filter + decimate to 48 kHz (float32)
+#   fm = FMStream(1.2e6, 48000)
+#   audio = fm.process(samples)  # float32 audio at 48 kHz, -1..1
+IF_RATE = 240e3 # rate the discriminator runs at, still wider than the 200 kHz station
+RF_CUTOFF = 100e3 # FM stations are ~200 kHz wide
+AUDIO_CUTOFF = 15e3 # 15 kHz (human hearing limit)
+TAU = 75e-6 # de-emphasis time constant, 75 microseconds (US FM standard)
+
+
+# running automatic gain control: follows the loudness of the audio instead of normalizing against the
+# global max (which needs the whole recording), fast to turn down on a loud peak, slow to turn back up
+class AGC:
+    def __init__(self, rate, target=0.5, attack=0.01, release=2.0, dc=0.5):
+        self.target = target # 50% volume to prevent distortion, same as the old normalization
+        self.attack = attack # seconds
+        self.release = release
+        self.rate = rate
+        self.level = 0.0 # current peak estimate
+        self.gain = 0.0 # gain applied at the end of the last block (ramped to the new one to avoid clicks)
+        # DC blocker: one pole high-pass just below 1 Hz, removes the offset that a mistuned station gives
+        x = np.exp(-1 / (dc * rate))
+        self.dc_b, self.dc_a = [1, -1], [1, -x]
+        self.dc_zi = np.zeros(1)
+
+    def process(self, audio):
+        if len(audio) == 0:
+            return audio.astype(np.float32)
+        audio, self.dc_zi = signal.lfilter(self.dc_b, self.dc_a, audio, zi=self.dc_zi)
+        peak = np.max(np.abs(audio))
+        seconds = len(audio) / self.rate
+        if peak > self.level:
+            self.level += (peak - self.level) * (1 - np.exp(-seconds / self.attack))
+        else:
+            self.level += (peak - self.level) * (1 - np.exp(-seconds / self.release))
+        new_gain = self.target / self.level if self.level > 0 else 0.0
+        if self.gain == 0.0:
+            self.gain = new_gain # first block, nothing to ramp from
+        gain = np.linspace(self.gain, new_gain, len(audio), dtype=np.float32)
+        self.gain = new_gain
+        return np.clip(audio * gain, -1.0, 1.0).astype(np.float32)
+
+
+class FMStream:
+    def __init__(self, sample_rate, audio_rate=48000, rf_cutoff=RF_CUTOFF, audio_cutoff=AUDIO_CUTOFF, tau=TAU, if_rate=IF_RATE, agc=True, channel=True):
+        self.sample_rate = sample_rate
+        self.audio_rate = audio_rate
+        if channel:
+            self.if_rate = audio_rate * max(1, round(if_rate / audio_rate)) # a whole multiple of the audio rate
+            # stage 1: isolate the FM station and drop to the IF rate (any exact ratio, e.g. 1.024 MS/s -> 240 kS/s is 15/64)
+            self.channel = Resampler(sample_rate, self.if_rate, rf_cutoff, dtype=np.complex64)
+        else:
+            # channel=False: the samples are already one station at its IF rate (fm_channelizer.py does stage 1 for many at once)
+            self.if_rate = sample_rate
+            self.channel = None
+
+        # de-emphasis: first order IIR, now at the IF rate
+        x = np.exp(-1 / (self.if_rate * tau))
+        self.de_b, self.de_a = np.array([1 - x], np.float32), np.array([1, -x], np.float32)
+        self.de_zi = np.zeros(1, np.float32)
+
+        # stage 2: audio low-pass (15 kHz) and decimation to the audio rate in one FIR
+        self.audio = Resampler(self.if_rate, audio_rate, audio_cutoff, dtype=np.float32)
+
+        self.prev = None # last channel sample of the previous block, for the discriminator
+        self.agc = AGC(audio_rate) if agc else None # agc=False gives the raw discriminator level (for comparing chains)
+
+    # how many audio samples the output lags the input (both FIR stages are linear phase)
+    def delay(self):
+        channel = self.channel.delay() if self.channel is not None else 0
+        return channel * self.audio_rate / self.if_rate + self.audio.delay()
+
+    # one block of complex samples in, the audio for it out (float32 at audio_rate)
+    def process(self, samples):
+        with metrics.timer('fm_rf_filter'):
+            filtered = self.channel.process(samples)
+        return self.demodulate(filtered)
+
+    # the rest of the chain, from one station at the IF rate to audio
+    def demodulate(self, filtered):
+        if len(filtered) == 0:
+            return np.zeros(0, np.float32)
+
+        with metrics.timer('fm_demod'):
+            # polar discriminator, the previous block's last sample makes the first product of this block
+            prev = filtered[:1] if self.prev is None else self.prev
+            joined = np.concatenate([prev, filtered])
+            audio = np.angle(joined[1:] * np.conj(joined[:-1]))
+            self.prev = filtered[-1:]
+
+        with metrics.timer('fm_deemphasis'):
+            audio, self.de_zi = signal.lfilter(self.de_b, self.de_a, audio, zi=self.de_zi)
+
+        with metrics.timer('fm_decimate'):
+            audio = self.audio.process(audio)
+
+        if self.agc is None:
+            return audio
+        with metrics.timer('fm_agc'):
+            return self.agc.process(audio)
+
+
+# WAV file written as the audio comes in (the header is fixed up on close)
+class WavOutput:
+    def __init__(self, path, rate):
+        self.path = path
+        self.file = wave.open(path, 'wb')
+        self.file.setnchannels(1)
+        self.file.setsampwidth(2) # int16, the WAV file format uses integers not floats
+        self.file.setframerate(int(rate))
+        self.frames = 0
+
+    def write(self, audio):
+        self.file.writeframes((audio * 32767).astype('<i2').tobytes())
+        self.frames += len(audio)
+
+    def close(self):
+        self.file.close()
+
+
+# live playback through the sound card (pyaudio is only imported when we actually play)
+class AudioOutput:
+    def __init__(self, rate):
+        import pyaudio
+        self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paFloat32, channels=1, rate=int(rate), output=True)
+
+    def write(self, audio):
+        self.stream.write(audio.astype(np.float32).tobytes()) # blocks until the card has room, which paces us
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.pa.terminate()
@@ -0,0 +1,78 @@
+import numpy as np # imports the library to do array math
+import json # the SigMF metadata file
+import os
+import sys
+from datetime import datetime, timezone
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common.resample import Resampler # the same streaming polyphase FIR as the FM chain
+from doppler import DopplerNCO # the mixer (with the Doppler curve, or a flat one)
+
+# LRPT is only ~150 kHz wide, but the full 1.024 MS/s cu8 is ~2 GB a pass
+# this stage runs on the recorder's writer thread and keeps only the satellite: the 50 kHz tuning offset
+# (and the Doppler, with the NCO) is mixed out in one multiply, a stateful polyphase FIR low-passes and
+# decimates to RATE, and the result is written as cs8 or cs16 with a SigMF metadata file next to it
+# 256 kS/s cs8 is 4x smaller than the cu8 (cs16 keeps more dynamic range at 2x)
+RATE = 256e3 # output sample rate
+CUTOFF = 90e3 # LRPT (72k symbols/s QPSK, ~120 kHz wide) plus a few kHz of Doppler either side
+FORMATS = {'cs8': (np.int8, 127.0, 'ci8'), 'cs16': (np.int16, 8192.0, 'ci16_le')} # numpy type, full scale, SigMF datatype
+# cs8 full scale is the input's (a filtered signal is smaller than its input, the odd peak past 1 is clipped);
+# cs16 leaves room for sqrt(2) and still has far finer steps than the 8 bit input
+
+
+class Baseband:
+    def __init__(self, rate_in, offset, rate_out=RATE, fmt='cs8', nco=None, cutoff=CUTOFF):
+        self.dtype, self.scale, self.datatype = FORMATS[fmt]
+        # the Doppler NCO does the offset too, otherwise a flat curve: just the offset
+        self.nco = nco or DopplerNCO(np.array([0.0, 1.0]), np.zeros(2), rate_in, 0.0)
+        self.nco.offset = offset
+        self.resampler = Resampler(rate_in, rate_out, cutoff, dtype=np.complex64)
+        self.rate_in, self.rate_out, self.fmt = rate_in, rate_out, fmt
+        self.clipped = 0 # output values that did not fit (cs8)
+
+    # complex samples (full scale 1) in, interleaved cs8/cs16 out
+    def process(self, block):
+        y = self.resampler.process(self.nco.process(block))
+        iq = y.view(np.float32) * self.scale # interleaved I/Q
+        limit = np.iinfo(self.dtype).max
+        out = np.clip(np.rint(iq), -limit, limit).astype(self.dtype)
+        self.clipped += int(np.count_nonzero(np.abs(iq) > limit))
+        return out
+
+    # RawRecorder transform: one buffer of cu8 bytes (starting at byte offset of the stream) -> what to write
+    def process_bytes(self, raw, offset=None):
+        if offset is not None:
+            self.nco.skip_to(offset // 2) # dropped blocks: keep the mixer's phase in step with the clock
+        iq = (raw.astype(np.float32) - 127.5) / 127.5
+        return self.process(iq[0::2] + 1j * iq[1::2])
+
+    # SigMF-style metadata (https://sigmf.org): the data file keeps its .cs8/.cs16 name for SatDump and is
+    # pointed to with core:dataset, the Doppler curve and the capture settings go in the meteor: fields
+    def save_meta(self, data_path, frequency, gain, t_start, doppler=None, **info):
+        meta = {
+            'global': {
+                'core:datatype': self.datatype,
+                'core:sample_rate': self.rate_out,
+                'core:version': '1.0.0',
+                'core:dataset': os.path.basename(data_path),
+                'core:recorder': 'SDR-Project meteor_recorder.py',
+                'core:hw': 'RTL-SDR',
+                'meteor:gain_db': gain,
+                'meteor:input_rate': self.rate_in,
+                'meteor:full_scale': self.scale,
+                'meteor:clipped': self.clipped,
+                'meteor:group_delay_samples': self.resampler.delay(),
+            },
+            'captures': [{
+                'core:sample_start': 0,
+                'core:frequency': frequency, # the satellite's frequency is at 0 Hz in the file
+                'core:datetime': datetime.fromtimestamp(t_start, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            }],
+            'annotations': [],
+        }
+        if doppler is not None:
+            meta['global']['meteor:doppler'] = doppler
+        meta['global'].update({f'meteor:{k}': v for k, v in info.items()})
+        path = os.path.splitext(data_path)[0] + '.sigmf-meta'
+        with open(path, 'w') as f:
+            json.dump(meta, f, indent=1)
+        return path
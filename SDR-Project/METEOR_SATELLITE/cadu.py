@@ -0,0 +1,229 @@
+import numpy as np # imports the library to do array math
+import argparse # command line options
+import collections
+import json # SatDump's telemetry.json in, columns out
+import time
+import os
+
+# look inside the .cadu file SatDump leaves in every run folder, without loading it:
+# the file is memory-mapped, the 0x1ACFFC1D sync markers are found with array compares a chunk at a time,
+# and the VCDU header after each marker goes into one NumPy structured array (the index), so reports and
+# the demux are array operations on that instead of a loop over the file
+# CADU = 4 byte sync marker + 1020 byte frame (892 byte VCDU + 128 bytes of Reed-Solomon check symbols)
+# VCDU = 6 byte primary header (version, spacecraft id, virtual channel id, 24 bit frame counter, signaling)
+#        + 2 byte insert zone + 2 byte M_PDU header (first header pointer) + 882 bytes of CCSDS packets
+# run with: python cadu.py second_run/meteor_m2-x_lrpt.cadu [--vcid 5 --out vc5.pkt] [--index index.npy]
+SYNC = b'\x1a\xcf\xfc\x1d'
+CADU_SIZE = 1024
+HEADER = 4 + 6 + 2 + 2 # sync, primary header, insert zone, M_PDU header
+PACKET_ZONE = 882
+NO_HEADER = 0x7FF # first header pointer when no packet starts in the frame
+IDLE_APID = 0x7FF # fill packets
+FILL_VCID = 63 # fill frames
+COUNTER_WRAP = 1 << 24
+CHUNK = 64 * 1024 * 1024 # bytes looked at in one go (memory stays flat for multi-GB files)
+
+INDEX_DTYPE = np.dtype([('offset', np.int64), ('version', np.uint8), ('scid', np.uint8), ('vcid', np.uint8),
+                        ('counter', np.uint32), ('signaling', np.uint8), ('fhp', np.uint16)])
+
+
+# first sync marker at or after pos (a plain search, a window at a time), or None
+def _scan(data, pos, window=1 << 20):
+    while pos < len(data) - 3:
+        block = np.asarray(data[pos:pos + window + 3])
+        cand = np.flatnonzero(block[:-3] == SYNC[0])
+        cand = cand[(block[cand + 1] == SYNC[1]) & (block[cand + 2] == SYNC[2]) & (block[cand + 3] == SYNC[3])]
+        if len(cand):
+            return pos + int(cand[0])
+        pos += window
+        window = min(window * 2, CHUNK)
+    return None
+
+
+# byte offsets of every sync marker that starts a whole frame
+# frames come back to back, so once a marker is found the next ones are checked where they should be (the first
+# 4 bytes of every 1024, a strided view, nothing else is read); only where that breaks is the data searched
+def find_sync(data, chunk=CHUNK // CADU_SIZE):
+    sync = np.frombuffer(SYNC, dtype=np.uint8)
+    found = []
+    pos = 0
+    while pos + CADU_SIZE <= len(data):
+        m = _scan(data, pos)
+        if m is None or m + CADU_SIZE > len(data):
+            break
+        while m + CADU_SIZE <= len(data): # follow the frame grid from m, a chunk of frames at a time
+            count = min((len(data) - m) // CADU_SIZE, chunk)
+            heads = np.asarray(data[m:m + count * CADU_SIZE]).reshape(count, CADU_SIZE)[:, :4]
+            ok = np.all(heads == sync, axis=1)
+            run = count if ok.all() else int(np.argmin(ok))
+            found.append(m + CADU_SIZE * np.arange(run, dtype=np.int64))
+            m += run * CADU_SIZE
+            if run < count:
+                break
+        pos = m + 1 if m + CADU_SIZE <= len(data) else m # the grid broke at m: search again from there
+    return np.concatenate(found) if found else np.zeros(0, np.int64)
+
+
+# the structured index: one row per frame
+def build_index(data, offsets=None, chunk=CHUNK // CADU_SIZE):
+    offsets = find_sync(data) if offsets is None else offsets
+    index = np.zeros(len(offsets), dtype=INDEX_DTYPE)
+    index['offset'] = offsets
+    cols = np.arange(4, HEADER)
+    for k in range(0, len(offsets), chunk): # gather the 10 header bytes of each frame, a chunk of frames at a time
+        h = np.asarray(data)[offsets[k:k + chunk, None] + cols].astype(np.uint32)
+        rows = index[k:k + chunk]
+        rows['version'] = h[:, 0] >> 6
+        rows['scid'] = ((h[:, 0] & 0x3F) << 2) | (h[:, 1] >> 6)
+        rows['vcid'] = h[:, 1] & 0x3F
+        rows['counter'] = (h[:, 2] << 16) | (h[:, 3] << 8) | h[:, 4]
+        rows['signaling'] = h[:, 5]
+        rows['fhp'] = ((h[:, 8] & 0x07) << 8) | h[:, 9]
+    return index
+
+
+# frames (of one VCID) whose counter is not between its neighbours' got through with a corrupted header
+def corrupted(counter):
+    counter = counter.astype(np.int64)
+    bad = np.zeros(len(counter), bool)
+    bad[1:-1] = (counter[2:] - counter[:-2]) % COUNTER_WRAP < (counter[1:-1] - counter[:-2]) % COUNTER_WRAP
+    return bad
+
+
+# what is in the file: frames per VCID, byte gaps between frames, frame counter jumps per VCID
+def report(index, size):
+    ends = np.concatenate([[0], index['offset'] + CADU_SIZE]) # where each frame (and the file start) ends
+    gap = np.concatenate([index['offset'], [size]]) - ends # bytes from there to the next frame
+    gaps = np.flatnonzero(gap != 0)
+    result = {'frames': len(index), 'bytes': size,
+              'gaps': [(int(ends[g]), int(gap[g])) for g in gaps],
+              'scids': dict(collections.Counter(index['scid'].tolist())), 'vcids': {}}
+    for vcid in np.unique(index['vcid']):
+        counter = index['counter'][index['vcid'] == vcid].astype(np.int64)
+        bad = corrupted(counter)
+        good = counter[~bad]
+        step = np.diff(good) % COUNTER_WRAP
+        jumps = step != 1
+        forward = jumps & (step > 0) & (step < COUNTER_WRAP // 2) # frames lost on the way
+        result['vcids'][int(vcid)] = {'frames': len(counter), 'corrupted': int(np.count_nonzero(bad)),
+                                      'discontinuities': int(np.count_nonzero(jumps)),
+                                      'missing': int(np.sum(step[forward] - 1)),
+                                      'backwards': int(np.count_nonzero(jumps & ~forward)), # repeats, or a new recording
+                                      'first': int(good[0]) if len(good) else None, 'last': int(good[-1]) if len(good) else None}
+    return result
+
+
+# the CCSDS packets carried by one virtual channel, in order: (apid, packet bytes)
+# each frame's packet zone is read straight from the map; a frame counter jump throws away the packet that
+# was being put together and picks up again at the next frame's first header pointer (same when the
+# pointer disagrees with where the packets we were following say the next one starts)
+def packets(data, index, vcid, skip_idle=True):
+    frames = index[index['vcid'] == vcid]
+    frames = frames[~corrupted(frames['counter'])]
+    buf = bytearray()
+    in_sync = False
+    prev = None
+    for offset, counter, fhp in zip(frames['offset'].tolist(), frames['counter'].tolist(), frames['fhp'].tolist()):
+        zone = memoryview(data[offset + HEADER:offset + HEADER + PACKET_ZONE])
+        if prev is not None and (counter - prev) % COUNTER_WRAP != 1:
+            in_sync = False # lost frames: the packet in progress is incomplete
+        prev = counter
+        if not in_sync:
+            if fhp == NO_HEADER or fhp >= PACKET_ZONE:
+                continue
+            buf = bytearray(zone[fhp:])
+            carry = None # nothing from earlier frames
+            in_sync = True
+        else:
+            carry = len(buf)
+            buf += zone
+        pos = 0
+        checked = carry is None or fhp == NO_HEADER
+        while len(buf) - pos >= 6:
+            if not checked and pos >= carry: # first packet that starts in this frame: is it where the pointer says?
+                checked = True
+                if pos - carry != fhp:
+                    pos = 0
+                    if fhp >= PACKET_ZONE: # a corrupted pointer: nothing to pick up from, wait for a good one
+                        buf = bytearray()
+                        in_sync = False
+                        break
+                    buf = bytearray(zone[fhp:])
+                    continue
+            length = ((buf[pos + 4] << 8) | buf[pos + 5]) + 7 # 6 byte header + data length field + 1
+            if len(buf) - pos < length:
+                break
+            apid = ((buf[pos] & 0x07) << 8) | buf[pos + 1]
+            if not (skip_idle and apid == IDLE_APID):
+                yield apid, bytes(buf[pos:pos + length])
+            pos += length
+        del buf[:pos]
+
+
+# SatDump's telemetry.json is a list of the same few-key records over and over, store it as columns with
+# runs of repeated values: {"rows": n, "columns": {key: [[value, run length], ...]}}
+def columnar(records):
+    keys = list(dict.fromkeys(k for r in records for k in r))
+    columns = {}
+    for key in keys:
+        runs = []
+        for r in records:
+            value = r.get(key)
+            if runs and runs[-1][0] == value:
+                runs[-1][1] += 1
+            else:
+                runs.append([value, 1])
+        columns[key] = runs
+    return {'rows': len(records), 'columns': columns}
+
+
+# back to the list of records
+def rows(table):
+    columns = {key: [v for v, n in runs for _ in range(n)] for key, runs in table['columns'].items()}
+    return [{key: col[i] for key, col in columns.items() if col[i] is not None} for i in range(table['rows'])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a CADU file, report gaps and counter jumps, and pull out one virtual channel")
+    parser.add_argument('file', help="CADU file from SatDump (e.g. second_run/meteor_m2-x_lrpt.cadu)")
+    parser.add_argument('--index', metavar='NPY', help="save the frame index as a .npy structured array")
+    parser.add_argument('--vcid', type=int, help="virtual channel to extract (5 is MSU-MR on Meteor)")
+    parser.add_argument('--out', help="with --vcid: write its CCSDS packets back to back into this file")
+    parser.add_argument('--telemetry', metavar='JSON', help="also convert this telemetry.json to columns (written as <name>.columns.json)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    data = np.memmap(args.file, dtype=np.uint8, mode='r')
+    index = build_index(data)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.file}: {len(data)/1e6:.1f} MB, {len(index)} frames indexed in {elapsed:.2f} s ({len(data)/1e9/max(elapsed, 1e-9):.2f} GB/s)")
+    if args.index:
+        np.save(args.index, index)
+
+    r = report(index, len(data))
+    print(f"Spacecraft ids: {r['scids']}")
+    for gap_start, gap_len in r['gaps']:
+        print(f"  gap: {gap_len} bytes without a frame at byte {gap_start}")
+    for vcid, v in r['vcids'].items():
+        name = ' (fill)' if vcid == FILL_VCID else ''
+        print(f"VCID {vcid:2}{name}: {v['frames']} frames, counter {v['first']} -> {v['last']}, "
+              f"{v['discontinuities']} jumps, {v['missing']} frames missing, {v['backwards']} backwards, {v['corrupted']} corrupted counters")
+
+    if args.vcid is not None:
+        apids = collections.Counter()
+        out = open(args.out, 'wb') if args.out else None
+        for apid, packet in packets(data, index, args.vcid):
+            apids[apid] += 1
+            if out:
+                out.write(packet)
+        if out:
+            out.close()
+        print(f"VCID {args.vcid} packets per APID: " + ", ".join(f"{a}: {n}" for a, n in sorted(apids.items())))
+
+    if args.telemetry:
+        with open(args.telemetry) as f:
+            table = columnar(json.load(f))
+        path = os.path.splitext(args.telemetry)[0] + '.columns.json'
+        with open(path, 'w') as f:
+            json.dump(table, f)
+        print(f"{table['rows']} telemetry records -> {path} ({os.path.getsize(args.telemetry)} -> {os.path.getsize(path)} bytes)")
@@ -0,0 +1,96 @@
+import numpy as np # imports the library to do array math
+import json # the correction curve is saved next to the recording
+import ephem # satellite position and range rate
+from datetime import datetime, timezone
+
+# Doppler correction without retuning: the whole pass's Doppler curve is worked out once at AOS on a fine
+# time grid, the tuner stays put, and a software NCO (numerically controlled oscillator) takes the shift
+# out of every block sample by sample, with the frequency interpolated from the curve
+# the old way (ephem + retune every ~10 s) gave a stair-step frequency error and a tuner glitch per retune
+# the curve is saved in <recording>.doppler.json, so a decoder can put the shift back or redo it
+SPEED_OF_LIGHT = 299792458.0
+STEP = 1.0 # seconds between points of the curve (it is smooth, linear interpolation is plenty)
+
+
+# doppler formula: shift = - (relative_velocity / speed_of_light) * base_freq
+# returns (times as unix seconds, shift in Hz, elevation in degrees) from t_start to t_end
+# ~1000 ephem computes for a 15 minute pass, a few milliseconds, done once before recording starts
+def doppler_curve(sat, observer, t_start, t_end, freq, step=STEP):
+    times = np.arange(t_start, t_end + step, step)
+    shifts = np.empty(len(times))
+    elevations = np.empty(len(times))
+    for i, t in enumerate(times):
+        observer.date = ephem.Date(datetime.fromtimestamp(t, timezone.utc))
+        sat.compute(observer)
+        shifts[i] = -(sat.range_velocity / SPEED_OF_LIGHT) * freq
+        elevations[i] = np.degrees(sat.alt)
+    return times, shifts, elevations
+
+
+# software NCO that follows the curve: sample n (at time t0 + n / sample_rate) is multiplied by
+# exp(-j * 2pi * sum of the shift over all samples before it / sample_rate), so the phase never jumps
+# between blocks and the signal stays where it would be with no Doppler at all
+# offset is a fixed shift on top (the baseband recorder folds its -50 kHz move into the same multiply)
+class DopplerNCO:
+    def __init__(self, times, shifts, sample_rate, t0, offset=0.0):
+        self.times = times
+        self.shifts = shifts
+        self.sample_rate = sample_rate
+        self.t0 = t0 # unix time of sample 0
+        self.offset = offset
+        self.phase = 0.0 # carried over from block to block
+        self.samples = 0 # samples corrected so far
+
+    # the shift (Hz) at unix time(s) t
+    def shift_at(self, t):
+        return np.interp(t, self.times, self.shifts) + self.offset
+
+    # correct one block of complex samples
+    def process(self, block):
+        n = len(block)
+        freq = self.shift_at(self.t0 + (self.samples + np.arange(n)) / self.sample_rate)
+        step = 2 * np.pi / self.sample_rate * freq
+        phase = self.phase + np.cumsum(step) - step # phase at each sample: everything before it
+        self.phase = float(phase[-1] + step[-1]) % (2 * np.pi)
+        self.samples += n
+        return (block * np.exp(-1j * phase)).astype(np.complex64)
+
+    # jump ahead to sample n (blocks were dropped), turning the phase on as if they had been corrected
+    def skip_to(self, n):
+        for start in range(self.samples, n, 1 << 20): # the same sum process() would have made, a chunk at a time
+            k = np.arange(start, min(start + (1 << 20), n))
+            self.phase = (self.phase + 2 * np.pi / self.sample_rate * np.sum(self.shift_at(self.t0 + k / self.sample_rate))) % (2 * np.pi)
+        self.samples = max(self.samples, n)
+
+    # the same for a block of raw cu8 bytes, in place (uint8 I/Q -> complex -> corrected -> uint8 again)
+    # offset: where the block starts in the byte stream (RawRecorder passes it, so dropped blocks are skipped over)
+    def process_bytes(self, raw, offset=None):
+        if offset is not None:
+            self.skip_to(offset // 2)
+        iq = raw.astype(np.float32) - 127.5
+        out = self.process(iq[0::2] + 1j * iq[1::2])
+        raw[0::2] = np.clip(np.rint(out.real + 127.5), 0, 255)
+        raw[1::2] = np.clip(np.rint(out.imag + 127.5), 0, 255)
+
+    # the curve and how it was applied, so a decoder can undo it (multiply by exp(+j * the same phase))
+    # or check what was done
+    def metadata(self, **info):
+        return curve_metadata(self.times, self.shifts, t0=self.t0, sample_rate=self.sample_rate, samples=self.samples, offset_hz=self.offset,
+                              applied="sample n multiplied by exp(-j*2*pi*sum(shift(t0 + k/sample_rate) + offset_hz for k < n)/sample_rate), shift linearly interpolated",
+                              **info)
+
+    # ... next to the recording
+    def save(self, path, **info):
+        with open(path, 'w') as f:
+            json.dump(self.metadata(**info), f, indent=1)
+
+
+def curve_metadata(times, shifts, **info):
+    meta = {'times': times.tolist(), 'shift_hz': np.round(shifts, 3).tolist()}
+    meta.update(info)
+    return meta
+
+
+def save_curve(path, times, shifts, **info):
+    with open(path, 'w') as f:
+        json.dump(curve_metadata(times, shifts, **info), f, indent=1)
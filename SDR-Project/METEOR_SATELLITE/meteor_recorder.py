@@ -1,87 +1,217 @@
 import numpy as np
-from rtlsdr import RtlSdr
-from datetime import datetime, timezone
-import ephem
+from datetime import datetime
 import time
 import os
+import threading # the async read runs on its own thread
+import sys
+import argparse # command line options (metrics)
+import functools # binds the source, TLEs and options to record_pass for the scheduler
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # write throughput (--metrics-port / --metrics-json)
+from sdr_common import sources # the RTL-SDR (opened on the first read), or synthetic IQ to try it without one
+from raw_recorder import RawRecorder, BYTES_WRITTEN, WRITE_MBPS # bit-exact raw byte recording with a writer thread (and its write metrics)
+from doppler import doppler_curve, DopplerNCO, save_curve, curve_metadata # the pass's Doppler curve, worked out once at AOS
+from baseband import Baseband, RATE, FORMATS # in-stream filter + decimate to cs8/cs16 with a SigMF metadata file
+import pass_scheduler # TLE file, pass prediction and the sleep-until-AOS loop
 
 # configuration
-FREQ_CENTER = 137.850e6 # offset tuning to avoid the center spike 
-FREQ_TARGET = 137.9e6 # actual M2-4 center frequency
+OFFSET = 50e3 # offset tuning to avoid the center spike (tune 50 kHz below the satellite's frequency)
 SAMPLE_RATE = 1.024e6  # sample rate
 GAIN = 44           # used this gain for the first image, worked!
-RECORD_SECONDS = 900   # 15 minutes
 MIN_ELEVATION = 15.0   # Clear the houses/fences
 
+DOPPLER_EVERY = 10 # seconds between Doppler retunes (--doppler retune)
+
+chunks_read = metrics.counter('meteor_chunks_total', 'chunks read from the dongle')
+retunes = metrics.counter('meteor_retunes_total', 'Doppler retunes')
+passes_recorded = metrics.counter('meteor_passes_total', 'passes recorded')
+
 # my coordinates - closest city is Chicago (naming preference)
-chicago = ephem.Observer()
-chicago.lat, chicago.lon, chicago.elev = '42.11', '-88.03', 240 
-
-# updated TLEs for Meteor M2-4 (make sure these are changed -- https://celestrak.org/NORAD/elements/gp.php?GROUP=weather&amp;FORMAT=tle)
-name = "METEOR-M2-4"
-l1 = "1 59051U 24039A   26015.61059980 -.00000001  00000+0  19235-4 0  9995"
-l2 = "2 59051  98.6813 336.9967 0006003 249.0894 110.9641 14.22407283 97578"
-m24 = ephem.readtle(name, l1, l2)
-
-
-def get_doppler(sat):
-    chicago.date = datetime.now(timezone.utc)
-    sat.compute(chicago)
-    # doppler formula: shift = - (relative_velocity / speed_of_light) * base_freq
-    shift = - (sat.range_velocity / 299792458.0) * FREQ_TARGET
-    return FREQ_CENTER + shift
-
-# initialize the SDR
-sdr = RtlSdr()
-sdr.sample_rate = SAMPLE_RATE
-sdr.gain = GAIN
-sdr.bandwidth = 500e3 # tighten the bandwidth so local FM noises are gone
-
-print(f"--- Waiting for {name} to rise above {MIN_ELEVATION}° ---")
-
-while True:
-    chicago.date = datetime.now(timezone.utc)
-    m24.compute(chicago)
-    alt = np.degrees(m24.alt) 
-    if alt > MIN_ELEVATION:
-        break
-    print(f"Current Alt: {alt:.1f}° | Now waiting...", end = '\r')
-    time.sleep(10)
-
-# start recording 
-timestamp = datetime.now().strftime('%H%M%S')
-filename = f"meteor_M2_4_{timestamp}.cu8"
-print(f"\n--- Satellite reached {MIN_ELEVATION}°. Recording to: {filename}")
-
-try:
+chicago = pass_scheduler.chicago()
+
+
+# where to tune at unix time t (--doppler retune), read off the precomputed curve instead of running ephem
+def get_doppler(t, curve, center):
+    return center + np.interp(t, curve[0], curve[1])
+
+
+# elevation at unix time t, for the display
+def get_elevation(t, curve):
+    return np.interp(t, curve[0], curve[2])
+
+
+tunes = [] # (time, frequency) of every retune in the current recording
+
+
+def tune(sdr, freq, t):
+    sdr.center_freq = freq
+    tunes.append((t, freq))
+    retunes.inc()
+
+
+# raw mode: the dongle's bytes go to the file (see raw_recorder.py), this thread only retunes and reports
+# with the NCO the writer thread corrects every buffer just before writing it and the tuner never moves
+# with baseband the writer thread mixes, filters and decimates each buffer and writes that instead
+# clock is pass_scheduler's Clock (or a SimClock): the length, the retunes and the display all follow it
+def record_raw(sdr, clock, filename, seconds, center, curve, nco=None, baseband=None):
+    stage = baseband or nco
+    recorder = RawRecorder(filename, transform=stage.process_bytes if stage else None)
+    recorder.start()
+    t0 = clock.now()
+    tune(sdr, center if nco else get_doppler(t0, curve, center), t0)
+    reader = threading.Thread(target=sdr.read_bytes_async, args=(recorder.on_bytes, recorder.buffer_bytes), daemon=True)
+    if stage:
+        (baseband.nco if baseband else nco).t0 = t0 # sample 0 (the first buffer comes a fraction of a second later, a few Hz of error at most)
+    reader.start()
+    next_retune = t0 + DOPPLER_EVERY
+    try:
+        while clock.now() - t0 < seconds:
+            if not nco and clock.now() >= next_retune:
+                tune(sdr, get_doppler(clock.now(), curve, center), clock.now())
+                next_retune += DOPPLER_EVERY
+            clock.sleep(min(1, t0 + seconds - clock.now()))
+            st = recorder.stats()
+            alt = get_elevation(clock.now(), curve)
+            print(f"Alt: {alt:.1f}° | PWR: {recorder.level():.1f} dB | {st['mb_per_s']:.2f} MB/s | dropped: {st['dropped']} | Progress: {(clock.now() - t0) / seconds * 100:.1f}%", end='\r')
+    finally:
+        sdr.cancel_read_async()
+        reader.join(timeout=2)
+        recorder.stop() # writes whatever is still queued
+        st = recorder.stats()
+        print(f"\nBuffers: {st['buffers_in']} received, {st['dropped']} dropped | {st['bytes_written']/1e6:.0f} MB at {st['mb_per_s']:.2f} MB/s sustained ({st['disk_mb_per_s']:.0f} MB/s while writing)")
+
+
+# samples mode: the old way, kept for comparison
+# the time of each chunk is worked out from the samples read since the start (clock.now() at the start),
+# so it is right on a SimClock too, where the reads come back much faster than real time
+def record_samples(sdr, clock, filename, seconds, center, curve, nco=None):
     with open(filename, 'wb') as f:
+        t0 = clock.now()
+        if nco:
+            tune(sdr, center, t0)
         sdr.read_samples(2048) # clear buffer
+        t_start = time.monotonic() # for the sustained throughput, the same figure the raw path reports
+        if nco:
+            nco.t0 = t0
 
         # buffer to store chunks before writing
-        num_chunks = int((SAMPLE_RATE * RECORD_SECONDS) / (256*1024))
+        num_chunks = int((SAMPLE_RATE * seconds) / (256*1024))
         for i in range(num_chunks):
+            t = t0 + i * 256*1024 / SAMPLE_RATE # when this chunk starts
             # update doppler frequency
-            if i % 40 == 0:
-                sdr.center_freq = get_doppler(m24)
+            if not nco and i % 40 == 0:
+                tune(sdr, get_doppler(t, curve, center), t)
 
             # read samples (normalized floats -1 to 1)
-            samples = sdr.read_samples(256*1024)
-            
+            with metrics.timer('meteor_read'):
+                samples = sdr.read_samples(256*1024)
+            chunks_read.inc()
+            if nco:
+                with metrics.timer('meteor_nco'):
+                    samples = nco.process(samples)
+
             # CU8 conversion for SatDump
-            iq = np.empty(samples.size * 2, dtype=np.uint8)
-            iq[0::2] = (samples.real * 127.5 + 127.5).astype(np.uint8)
-            iq[1::2] = (samples.imag * 127.5 + 127.5).astype(np.uint8)
-            f.write(iq.tobytes())
-            
+            with metrics.timer('meteor_convert'):
+                iq = np.empty(samples.size * 2, dtype=np.uint8)
+                iq[0::2] = np.clip(samples.real * 127.5 + 127.5, 0, 255).astype(np.uint8) # clip: after the NCO a corner sample can be past 1
+                iq[1::2] = np.clip(samples.imag * 127.5 + 127.5, 0, 255).astype(np.uint8)
+            with metrics.timer('meteor_write'):
+                f.write(iq.tobytes())
+            BYTES_WRITTEN.inc(iq.size)
+            WRITE_MBPS.set(f.tell() / 1e6 / max(time.monotonic() - t_start, 1e-9))
+
             # when to update the terminal
             if i % 20 == 0:
                 pwr = 10 * np.log10(np.var(samples) + 1e-12)
-                m24.compute(chicago)
-                alt = np.degrees(m24.alt)
+                alt = get_elevation(t, curve)
                 print(f"Alt: {alt:.1f}° | PWR: {pwr:.1f} dB | Progress: {i/num_chunks*100:.1f}%", end='\r')
 
-except KeyboardInterrupt:
-    print("\nManual Stop")
-finally:
-    sdr.close()
-    print(f"\nSaved. File: {filename}. Size: {os.path.getsize(filename)/1e9:.2f} GB") # now when this in SatDump as a .cadu remove this large file for storage
\ No newline at end of file
+
+# one pass, called by the scheduler at AOS: record exactly until LOS
+# sdr is the sample source, tles the loaded TLE file and options the command line settings (mask, doppler,
+# samples, baseband, rate); __main__ binds them with functools.partial, so pass_scheduler.run only passes p
+# clock is the one pass_scheduler.run sleeps on (default the wall clock): the pass length, the AOS time and
+# the Doppler/elevation lookups all come from it, so a SimClock run records each pass for its real length
+def record_pass(p, sdr, tles, options, observer=chicago, clock=None):
+    clock = clock or pass_scheduler.Clock()
+    seconds = p.los - clock.now()
+    center = p.freq - OFFSET
+    timestamp = datetime.fromtimestamp(clock.now()).strftime('%Y%m%d_%H%M%S')
+    filename = f"{p.name.replace(' ', '_')}_{timestamp}.{options.baseband or 'cu8'}"
+    print(f"\n--- {p.name} reached {options.mask}° (max {p.max_elevation:.0f}° at {pass_scheduler.stamp(p.t_max)}). Recording {seconds:.0f} s to: {filename}")
+
+    # the whole pass's Doppler curve, once, before the first sample (nothing in the loops runs ephem)
+    t_compute = time.monotonic()
+    t_aos = clock.now()
+    curve = doppler_curve(tles[p.name][0], observer, t_aos, p.los + 60, p.freq)
+    print(f"Doppler curve: {curve[1][0]:+.0f} to {curve[1][-1]:+.0f} Hz, {len(curve[0])} points in {(time.monotonic() - t_compute)*1000:.0f} ms")
+    metadata = f"{filename}.doppler.json" # the curve and how it was applied, for the decoder
+    tunes.clear()
+
+    nco = DopplerNCO(curve[0], curve[1], SAMPLE_RATE, t_aos) if options.doppler == 'nco' else None
+    baseband = Baseband(SAMPLE_RATE, p.freq - center, options.rate, options.baseband, nco) if options.baseband else None
+    try:
+        if options.samples:
+            record_samples(sdr, clock, filename, seconds, center, curve, nco)
+        else:
+            record_raw(sdr, clock, filename, seconds, center, curve, nco, baseband)
+    finally:
+        info = dict(mode=options.doppler, satellite=p.name, center_freq=center, target_freq=p.freq, tunes=tunes)
+        if baseband:
+            doppler = nco.metadata() if nco else curve_metadata(curve[0], curve[1])
+            metadata = baseband.save_meta(filename, p.freq, GAIN, baseband.nco.t0, doppler, **info)
+            print(f"\n{options.rate/1e3:.0f} kS/s {options.baseband}, {baseband.clipped} values clipped")
+        elif nco:
+            nco.save(metadata, **info)
+        else:
+            save_curve(metadata, curve[0], curve[1], sample_rate=SAMPLE_RATE, **info)
+        passes_recorded.inc()
+        print(f"\nDoppler curve saved to {metadata}")
+        print(f"\nSaved. File: {filename}. Size: {os.path.getsize(filename)/1e9:.2f} GB") # now when this in SatDump as a .cadu remove this large file for storage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record every weather satellite pass (Meteor M2-3/M2-4, NOAA) as cu8 for SatDump")
+    parser.add_argument('--samples', action='store_true', help="old path: read_samples + convert back to uint8 on this thread (default: raw bytes from the async read)")
+    parser.add_argument('--doppler', choices=['nco', 'retune'], default='nco',
+                        help="nco: tuner stays put, a software NCO follows the Doppler curve sample by sample (default); "
+                             "retune: retune the tuner every 10 s like before (the raw file stays bit-exact)")
+    parser.add_argument('--tle', default=pass_scheduler.TLE_FILE, help="TLE file (default weather.tle, celestrak's weather group)")
+    parser.add_argument('--days', type=float, default=1, help="days of passes to plan at a time (default 1)")
+    parser.add_argument('--mask', type=float, default=MIN_ELEVATION, help="only record above this elevation (default 15)")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help="only these satellites, e.g. --only 'METEOR-M2 4'")
+    parser.add_argument('--baseband', choices=list(FORMATS), help="mix the satellite to 0 Hz, filter and decimate while recording, and write cs8/cs16 + .sigmf-meta (4x+ smaller than cu8)")
+    parser.add_argument('--rate', type=float, default=RATE, help="with --baseband: output sample rate (default 256000)")
+    sources.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.baseband and args.samples:
+        parser.error("--baseband works on the raw byte path, leave out --samples")
+    metrics.setup(args)
+
+    # initialize the SDR (nothing touches USB until the first read)
+    sdr = sources.open_source(args.source, SAMPLE_RATE, 137.9e6 - OFFSET, GAIN, realtime=True)
+    if isinstance(sdr, sources.RtlSdrSource):
+        sdr.bandwidth = 500e3 # tighten the bandwidth so local FM noises are gone
+
+    try:
+        while True: # plan args.days ahead, record them all, then plan again (re-reading the TLE file if it changed)
+            tles = pass_scheduler.load_tles(args.tle)
+            if args.only:
+                tles = {name: tle for name, tle in tles.items() if any(pass_scheduler.same_name(name, o) for o in args.only)}
+            if not tles:
+                sys.exit(f"No satellites to record in {args.tle}")
+            for name in pass_scheduler.stale(tles):
+                print(f"WARNING: the {name} TLE is {(time.time() - tles[name][1]) / 86400:.0f} days old, get a new one")
+            passes = pass_scheduler.schedule(tles, time.time(), args.days, args.mask, chicago)
+            print(f"--- {len(passes)} passes in the next {args.days:g} days ---")
+            for p in passes:
+                print(pass_scheduler.describe(p))
+            if not passes:
+                time.sleep(args.days * 86400)
+            pass_scheduler.run(passes, functools.partial(record_pass, sdr=sdr, tles=tles, options=args))
+    except KeyboardInterrupt:
+        print("\nManual Stop")
+    finally:
+        sdr.close()
+        metrics.stop() # final JSON dump
@@ -0,0 +1,243 @@
+import numpy as np # imports the library to do array math
+import ephem # orbit propagation (SGP4 from the TLEs)
+import argparse # command line: list the schedule or run it on a simulated clock
+import collections
+import calendar
+import time
+import os
+
+# pass scheduler: instead of polling one hardcoded satellite every 10 s, read the TLEs of every satellite we
+# can receive from a local file, predict all their passes over the next days in one go, drop the lower pass
+# wherever two overlap (one dongle), then sleep until each AOS and record until LOS
+# prediction steps through time adaptively: while the satellite is far below the horizon the time it needs to
+# come into view is known from how far away its ground point is, so most of an orbit is skipped in a few steps,
+# and only the minutes around a pass are walked in small steps (then AOS/LOS/max are refined by bisection)
+# get the TLEs from https://celestrak.org/NORAD/elements/gp.php?GROUP=weather&FORMAT=tle (save as weather.tle)
+TLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weather.tle')
+STALE_DAYS = 7 # older TLEs drift a few km a day, the Doppler and AOS times start to be off
+MIN_ELEVATION = 15.0 # clear the houses/fences (degrees)
+GAP = 30 # seconds between the end of one recording and the start of the next (retune, new file)
+
+# the satellites we record and their downlink frequency (Meteor LRPT, NOAA APT)
+SATELLITES = {
+    'METEOR-M2 3': 137.9e6,
+    'METEOR-M2 4': 137.9e6,
+    'NOAA 15': 137.62e6,
+    'NOAA 18': 137.9125e6,
+    'NOAA 19': 137.1e6,
+}
+
+EARTH_RADIUS = 6371e3
+GROUND_SPEED = 0.07 # degrees/s the ground point can move relative to us at most (LEO ~0.06 + Earth's turn ~0.004)
+PASS_STEP = 20.0 # seconds between samples during a pass
+MIN_SKIP = 20.0 # smallest step while out of view
+UNIX_TO_EPHEM = 25567.5 # ephem counts days from 1899-12-31 12:00, unix seconds from 1970-01-01
+
+Pass = collections.namedtuple('Pass', 'name freq aos los max_elevation t_max')
+
+
+def ephem_date(t):
+    return ephem.Date(t / 86400 + UNIX_TO_EPHEM)
+
+
+def unix_time(date):
+    return (float(date) - UNIX_TO_EPHEM) * 86400
+
+
+# the observer (same place as always)
+def chicago():
+    observer = ephem.Observer()
+    observer.lat, observer.lon, observer.elev = '42.11', '-88.03', 240
+    return observer
+
+
+# epoch of a TLE (unix seconds), from line 1: YYDDD.DDDDDDDD
+def tle_epoch(line1):
+    epoch = float(line1[18:32])
+    year = int(epoch // 1000)
+    year += 2000 if year < 57 else 1900
+    return calendar.timegm((year, 1, 1, 0, 0, 0)) + (epoch % 1000 - 1) * 86400
+
+
+def same_name(a, b):
+    return ''.join(c for c in a.upper() if c.isalnum()) == ''.join(c for c in b.upper() if c.isalnum())
+
+
+_tle_cache = {} # path -> (mtime, size, parsed), so a long-running scheduler only re-parses a changed file
+
+
+# name -> (ephem body, epoch) for every satellite in SATELLITES that the TLE file has
+def load_tles(path=TLE_FILE):
+    st = os.stat(path)
+    cached = _tle_cache.get(path)
+    if cached and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[2]
+    with open(path) as f:
+        lines = [line.rstrip() for line in f if line.strip()]
+    tles = {}
+    for k in range(len(lines) - 2):
+        if lines[k + 1].startswith('1 ') and lines[k + 2].startswith('2 '):
+            name = next((s for s in SATELLITES if same_name(s, lines[k])), None)
+            if name:
+                try:
+                    tles[name] = (ephem.readtle(name, lines[k + 1], lines[k + 2]), tle_epoch(lines[k + 1]))
+                except ValueError as e: # bad checksum or a cut-off line, skip that satellite
+                    print(f"Skipping {name} in {path}: {e}")
+    _tle_cache[path] = (st.st_mtime, st.st_size, tles)
+    return tles
+
+
+# names of the satellites whose TLE is more than max_age days old at time now
+def stale(tles, now=None, max_age=STALE_DAYS):
+    now = time.time() if now is None else now
+    return [name for name, (_, epoch) in tles.items() if now - epoch > max_age * 86400]
+
+
+# degrees of Earth's surface around the ground point from which a satellite at height is above mask
+def footprint(height, mask):
+    m = np.radians(mask)
+    return np.degrees(np.arccos(EARTH_RADIUS / (EARTH_RADIUS + height) * np.cos(m)) - m)
+
+
+# every pass of one satellite above mask between start and end (unix seconds)
+def predict(sat, observer, start, end, mask=MIN_ELEVATION):
+    lat, lon = float(observer.lat), float(observer.lon)
+
+    def elevation(t):
+        observer.date = ephem_date(t)
+        sat.compute(observer)
+        return np.degrees(sat.alt)
+
+    # first time in (a, b] that the elevation is on the other side of mask than at a
+    def crossing(a, b):
+        rising = elevation(a) < mask
+        while b - a > 0.5:
+            mid = (a + b) / 2
+            if (elevation(mid) < mask) == rising:
+                a = mid
+            else:
+                b = mid
+        return b
+
+    passes = []
+    t = start
+    while t < end:
+        el = elevation(t)
+        if el < mask:
+            # how far the ground point is from us, minus the footprint: it cannot get here faster than GROUND_SPEED
+            sep = np.degrees(np.arccos(np.clip(np.sin(lat) * np.sin(sat.sublat) +
+                                               np.cos(lat) * np.cos(sat.sublat) * np.cos(sat.sublong - lon), -1, 1)))
+            skip = (sep - footprint(sat.elevation, mask)) / GROUND_SPEED
+            if skip > MIN_SKIP:
+                t += skip
+                continue
+            nxt = t + PASS_STEP
+            if nxt < end and elevation(nxt) >= mask:
+                t = crossing(t, nxt) # AOS
+            else:
+                t = nxt
+                continue
+        aos = t
+        samples = [(mask, t)]
+        while t < end and elevation(t + PASS_STEP) >= mask:
+            t += PASS_STEP
+            samples.append((np.degrees(sat.alt), t))
+        los = crossing(t, t + PASS_STEP) if t < end else end
+        # max elevation: golden section around the highest sample
+        _, t_best = max(samples)
+        a, b = max(aos, t_best - PASS_STEP), min(los, t_best + PASS_STEP)
+        for _ in range(20):
+            m1, m2 = a + (b - a) * 0.382, a + (b - a) * 0.618
+            if elevation(m1) < elevation(m2):
+                a = m1
+            else:
+                b = m2
+        t_max = (a + b) / 2
+        passes.append(Pass(sat.name, SATELLITES.get(sat.name), aos, los, elevation(t_max), t_max))
+        t = los + MIN_SKIP
+    return passes
+
+
+# the passes of every satellite over the next days, overlaps resolved by max elevation, in time order
+def schedule(tles, start, days=1, mask=MIN_ELEVATION, observer=None, gap=GAP):
+    observer = observer or chicago()
+    candidates = []
+    for name, (sat, _) in tles.items():
+        candidates += predict(sat, observer, start, start + days * 86400, mask)
+    chosen = []
+    for p in sorted(candidates, key=lambda p: p.max_elevation, reverse=True): # highest first wins
+        if all(p.los + gap <= q.aos or q.los + gap <= p.aos for q in chosen):
+            chosen.append(p)
+    return sorted(chosen, key=lambda p: p.aos)
+
+
+# the real clock
+class Clock:
+    def now(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+# a clock that jumps instead of sleeping, to run a whole schedule in no time
+class SimClock:
+    def __init__(self, start):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += max(0.0, seconds)
+
+
+# sleep until each AOS and call record(pass) (which should return at LOS), passes already over are skipped
+def run(passes, record, clock=None):
+    clock = clock or Clock()
+    for p in passes:
+        if clock.now() >= p.los:
+            print(f"Missed {p.name} at {stamp(p.aos)}")
+            continue
+        clock.sleep(p.aos - clock.now())
+        record(p)
+
+
+def stamp(t):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+
+def describe(p):
+    return f"{p.name:12} {p.freq/1e6:8.4f} MHz  AOS {stamp(p.aos)}  LOS {stamp(p.los)}  ({(p.los - p.aos)/60:4.1f} min)  max {p.max_elevation:4.1f}°"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict the passes of all the weather satellites in a TLE file")
+    parser.add_argument('--tle', default=TLE_FILE, help="TLE file (default weather.tle next to this script)")
+    parser.add_argument('--days', type=float, default=7, help="days to predict (default 7)")
+    parser.add_argument('--mask', type=float, default=MIN_ELEVATION, help="elevation mask in degrees (default 15)")
+    parser.add_argument('--start', help="start time 'YYYY-MM-DD HH:MM' (local, default now)")
+    parser.add_argument('--simulate', action='store_true', help="run the schedule on a simulated clock and show what would be recorded")
+    args = parser.parse_args()
+
+    start = time.mktime(time.strptime(args.start, '%Y-%m-%d %H:%M')) if args.start else time.time()
+    tles = load_tles(args.tle)
+    print(f"{len(tles)} satellites in {args.tle}: " + ", ".join(tles))
+    for name in stale(tles, start):
+        print(f"  WARNING: the {name} TLE is {(start - tles[name][1]) / 86400:.0f} days old, get a new one")
+
+    t0 = time.perf_counter()
+    passes = schedule(tles, start, args.days, args.mask)
+    print(f"{len(passes)} passes in the next {args.days:g} days (predicted in {(time.perf_counter() - t0)*1000:.0f} ms):")
+
+    if args.simulate:
+        clock = SimClock(start)
+
+        def record(p):
+            print(f"[{stamp(clock.now())}] recording {p.name} for {p.los - clock.now():.0f} s")
+            clock.sleep(p.los - clock.now())
+        run(passes, record, clock)
+    else:
+        for p in passes:
+            print(describe(p))
@@ -0,0 +1,120 @@
+import numpy as np # imports the library to do array math
+import queue # hands filled buffers to the writer thread
+import threading # the disk writes happen on their own thread
+import time
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')) # SDR-Project folder, for sdr_common
+from sdr_common import metrics # write throughput and drops (--metrics-port / --metrics-json)
+
+# raw byte recorder: the dongle's own uint8 I/Q bytes go straight to the .cu8 file, bit-exact
+# read_bytes_async hands us librtlsdr's buffer (which it reuses), so the callback copies it once into one of
+# a pool of preallocated buffers and queues it; the writer thread writes whole buffers with unbuffered
+# sequential writes and gives the buffer back to the pool
+# nothing is converted to complex and back, and nothing in the callback allocates
+# if the disk falls behind and the pool runs dry the block is dropped (and counted) instead of stalling USB
+# an optional transform(buffer, offset) runs on the writer thread just before the write (the Doppler NCO uses it),
+# it changes the bytes in place, or returns an array to write instead (the baseband stage: filtered and
+# decimated cs8/cs16), so the file is no longer bit-exact, but the callback stays a plain copy
+BUFFER_BYTES = 1024 * 1024 # bytes per buffer (512k samples, ~0.5 s at 1.024 MS/s), a multiple of 512 for librtlsdr
+NUM_BUFFERS = 32 # ~16 s of slack for a slow disk
+
+BYTES_WRITTEN = metrics.counter('meteor_bytes_written_total', 'bytes written to the recording')
+BUFFERS_IN = metrics.counter('meteor_buffers_total', 'buffers received from the dongle')
+BUFFERS_DROPPED = metrics.counter('meteor_buffers_dropped_total', 'buffers dropped because the pool was empty')
+WRITE_MBPS = metrics.gauge('meteor_write_mb_per_second', 'sustained write throughput of the recording')
+
+
+class RawRecorder:
+    def __init__(self, path, buffer_bytes=BUFFER_BYTES, num_buffers=NUM_BUFFERS, transform=None):
+        self.path = path
+        self.transform = transform
+        self.buffer_bytes = buffer_bytes
+        self.pool = np.zeros((num_buffers, buffer_bytes), dtype=np.uint8) # allocated once, up front
+        self.free = queue.Queue()
+        for k in range(num_buffers):
+            self.free.put(k)
+        self.filled = queue.Queue() # (buffer, bytes) in arrival order
+        self.thread = None
+        self.file = None
+        self.last = None # most recently filled buffer, for the signal level display
+        # counters
+        self.buffers_in = 0
+        self.bytes_in = 0 # bytes received, dropped ones included (the stream position of the next block)
+        self.dropped = 0
+        self.bytes_written = 0
+        self.write_seconds = 0.0 # time spent inside write()
+        self.t_start = None
+
+    # the read_bytes_async callback (runs on the dongle's thread): one copy into a pool buffer, then queue it
+    def on_bytes(self, values, context=None):
+        self.buffers_in += 1
+        BUFFERS_IN.inc()
+        offset = self.bytes_in
+        self.bytes_in += len(values)
+        try:
+            k = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1 # the writer is behind, lose this block rather than hold up the USB transfers
+            BUFFERS_DROPPED.inc()
+            return
+        data = np.frombuffer(values, dtype=np.uint8) # a view on librtlsdr's buffer, no copy
+        n = len(data)
+        self.pool[k, :n] = data
+        self.filled.put((k, n, offset))
+        self.last = (k, n)
+
+    def start(self):
+        self.file = open(self.path, 'wb', buffering=0) # unbuffered: write() goes straight to the OS, no extra copy
+        self.t_start = time.monotonic()
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def _writer(self):
+        while True:
+            item = self.filled.get()
+            if item is None:
+                return
+            k, n, offset = item
+            data = self.pool[k, :n]
+            if self.transform is not None:
+                out = self.transform(data, offset)
+                if out is not None:
+                    data = out
+            t0 = time.monotonic()
+            view = memoryview(data).cast('B')
+            while len(view): # an unbuffered write may take less than all of it
+                view = view[self.file.write(view):]
+            self.write_seconds += time.monotonic() - t0
+            self.bytes_written += data.nbytes
+            BYTES_WRITTEN.inc(data.nbytes)
+            WRITE_MBPS.set(self.throughput())
+            self.free.put(k)
+
+    # write what is still queued, then close the file
+    def stop(self):
+        if self.thread is not None:
+            self.filled.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    # bytes written per second since start (what the disk has kept up with)
+    def throughput(self):
+        elapsed = time.monotonic() - self.t_start if self.t_start else 0
+        return self.bytes_written / 1e6 / elapsed if elapsed > 0 else 0.0
+
+    # signal power (dB) of the newest buffer, for the display
+    def level(self):
+        if self.last is None:
+            return float('nan')
+        k, n = self.last
+        iq = self.pool[k, :min(n, 65536)].astype(np.float32) - 127.5
+        return 10 * np.log10(np.mean(iq ** 2) / 127.5 ** 2 + 1e-12)
+
+    def stats(self):
+        return {'buffers_in': self.buffers_in, 'dropped': self.dropped, 'bytes_written': self.bytes_written,
+                'mb_per_s': self.throughput(), 'disk_mb_per_s': self.bytes_written / 1e6 / max(self.write_seconds, 1e-9),
+                'queued': self.filled.qsize()}
@@ -0,0 +1,417 @@
+import numpy as np # imports the library to do array math
+import multiprocessing as mp # every pipeline runs in a fresh process, so its peak memory is its own
+import argparse # command line options
+import contextlib
+import subprocess # the git commit the numbers belong to
+import tempfile # the synthetic captures live here while the suite runs
+import platform
+import resource # peak RSS
+import json # results go to a JSON file so runs can be compared
+import time
+import io
+import os
+import shutil # the track history written during the ADS-B run
+import sys
+HERE = os.path.dirname(os.path.abspath(__file__))
+for folder in ('', 'ADSB', 'FM_Radio', 'METEOR_SATELLITE'): # sdr_common and the three projects
+    sys.path.insert(0, os.path.join(HERE, folder))
+from sdr_common import sources # the synthetic IQ and the memory-mapped file source
+
+# real-time benchmark for the three receivers with made-up signals whose content we know, so one run says
+# both how fast each pipeline is and whether it still decodes what was sent:
+#   adsb    Mode S frames from a few aircraft (known ICAO, callsign, position, altitude, velocity) at a set
+#           SNR and message rate -> adsb_tracker.py's replay path (capture pipeline + pyModeS + track store),
+#           three ways: the old fixed 0.03 trigger, the noise floor trigger, and the phase-aware demod at 2.4 MS/s
+#   fm      two stations with a known audio tone each -> fm_stream.py's chain as fm_radio_record.py runs it
+#   meteor  a 72k symbols/s QPSK carrier with Doppler at 137.9 MHz -> meteor_recorder.py's NCO (cu8) and
+#           baseband (cs8) stages, and how far the carrier is from where it should be afterwards
+# every capture is made first (cu8, like the dongle sends) and the pipeline then reads it from disk, so
+# making the signal is not timed; MS/s and the real time factor (processing seconds per second of signal,
+# under 1 keeps up with the dongle) are wall clock, peak RSS is the pipeline process's high-water mark
+# run with: python benchmark_suite.py [--json results.json] [--compare old.json]
+SEED = 1
+SECONDS = 10 # of signal per pipeline
+SNRS = (20.0, 10.0, 6.0) # Mode S pulse power over noise power, dB
+DENSITY = 200.0 # Mode S frames per second (a busy sky is a few hundred)
+NOISE = 0.02 # noise standard deviation of I and of Q (about what adsb_test showed with no planes)
+FM_CNR = 25.0 # carrier to noise in the 200 kHz channel, dB (a decent station)
+TOLERANCE = 10.0 # --compare: % of throughput or yield that may be lost before it counts as a regression
+# the ADS-B variants: name prefix, sample rate, trigger level (None = follow the noise floor)
+ADSB_VARIANTS = [('adsb_fixed', 2.0e6, 0.03), ('adsb', 2.0e6, None), ('adsb_2.4', 2.4e6, None)]
+
+# the planes (near home, so local CPR decoding has a sensible reference): icao, callsign, lat, lon, altitude (ft),
+# ground speed (kt), heading (degrees), vertical rate (ft/min, a multiple of 64 like the message carries)
+AIRCRAFT = [('A1B2C3', 'UAL123', 42.3012, -87.9034, 35000, 450, 270, 0),
+            ('AC82EC', 'AAL88', 41.9786, -87.9048, 12000, 250, 90, -1024),
+            ('A4F1D2', 'SWA2211', 42.5120, -88.6071, 24000, 380, 180, 640),
+            ('ABCDEF', 'N512SP', 41.8033, -88.4020, 4500, 120, 45, 1280)]
+# the stations: frequency, audio tone; the tuner sits on the first, the second is 400 kHz away
+FM_STATIONS = [(96.3e6, 1000.0), (96.7e6, 440.0)]
+METEOR_FREQ = 137.9e6
+DOPPLER = 3300.0 # Hz, the shift at the start of an overhead Meteor pass
+DOPPLER_WIDTH = 110.0 # seconds, how quickly it swings through 0 around closest approach
+
+GENERATOR = 0x1FFF409 # the 25 bit Mode S generator polynomial
+CHARSET = '#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######' # 6 bit callsign characters
+
+
+# --- Mode S frames with known content ---------------------------------------------------------------
+
+# 24 bit parity of the 88 data bits of a long frame
+def crc24(data):
+    reg = data << 24
+    for i in range(111, 23, -1):
+        if reg >> i & 1:
+            reg ^= GENERATOR << (i - 24)
+    return reg & 0xFFFFFF
+
+
+# DF17 (ADS-B, capability 5) frame as hex
+def df17(icao, me):
+    data = (17 << 83) | (5 << 80) | (int(icao, 16) << 56) | me
+    return f"{data << 24 | crc24(data):028X}"
+
+
+def identification(icao, callsign):
+    chars = 0
+    for c in f"{callsign:<8}"[:8]:
+        chars = chars << 6 | CHARSET.index(c)
+    return df17(icao, 4 << 51 | chars)
+
+
+# number of longitude zones at a latitude (the CPR NL function)
+def cpr_nl(lat):
+    if lat == 0:
+        return 59
+    if abs(lat) >= 87:
+        return 2 if abs(lat) == 87 else 1
+    return int(np.floor(2 * np.pi / np.arccos(1 - (1 - np.cos(np.pi / 30)) / np.cos(np.radians(abs(lat))) ** 2)))
+
+
+# airborne position, even (odd=0) or odd (odd=1) CPR frame, altitude in 25 ft steps
+def position(icao, lat, lon, altitude, odd):
+    dlat = 360 / (60 - odd)
+    yz = int(np.floor(2 ** 17 * (lat % dlat) / dlat + 0.5))
+    rlat = dlat * (yz / 2 ** 17 + np.floor(lat / dlat))
+    dlon = 360 / max(cpr_nl(rlat) - odd, 1)
+    xz = int(np.floor(2 ** 17 * (lon % dlon) / dlon + 0.5))
+    n = int(round((altitude + 1000) / 25))
+    alt = (n >> 4) << 5 | 0x10 | (n & 0xF) # Q bit set: 25 ft steps
+    return df17(icao, 11 << 51 | alt << 36 | odd << 34 | (yz & 0x1FFFF) << 17 | (xz & 0x1FFFF))
+
+
+# airborne velocity over ground (subtype 1)
+def velocity(icao, speed, heading, vrate):
+    ew = int(round(speed * np.sin(np.radians(heading))))
+    ns = int(round(speed * np.cos(np.radians(heading))))
+    vr = abs(vrate) // 64 + 1
+    return df17(icao, 19 << 51 | 1 << 48 | (ew < 0) << 42 | (abs(ew) + 1) << 32 | (ns < 0) << 31 | (abs(ns) + 1) << 21
+                | (vrate < 0) << 19 | vr << 10)
+
+
+# every frame the planes send (they take turns at random in the capture)
+def modes_messages(aircraft=AIRCRAFT):
+    messages = []
+    for icao, cs, lat, lon, alt, spd, hdg, vr in aircraft:
+        messages += [identification(icao, cs), position(icao, lat, lon, alt, 0), position(icao, lat, lon, alt, 1),
+                     velocity(icao, spd, hdg, vr)]
+    return messages
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * 6371 * np.arcsin(np.sqrt(a)))
+
+
+# --- the synthetic captures -------------------------------------------------------------------------
+
+# the whole pass's Doppler curve would take 15 minutes; these are the seconds around closest approach,
+# where it changes fastest (~30 Hz/s)
+def meteor_doppler(t, seconds=SECONDS):
+    return DOPPLER * np.tanh(-(t - seconds / 2) / DOPPLER_WIDTH)
+
+
+def make_source(kind, seconds, seed, snr=None, density=DENSITY, rate=2e6):
+    if kind == 'adsb':
+        amplitude = NOISE * np.sqrt(2) * 10 ** (snr / 20) # pulse power over the noise power (both I and Q)
+        return sources.SyntheticSource(rate, 1090e6, seed=seed, noise=NOISE, duration=seconds, modes_rate=density,
+                                       modes_amplitude=amplitude, modes_spread=(1.0, 1.0), modes_messages=modes_messages())
+    if kind == 'fm':
+        rate = 1.2e6 # fm_radio_record.py's rate
+        amplitude = 0.3
+        noise = amplitude * np.sqrt(rate / (2 * 200e3)) * 10 ** (-FM_CNR / 20)
+        return sources.SyntheticSource(rate, FM_STATIONS[0][0], seed=seed, noise=noise, duration=seconds,
+                                       fm=[(f, amplitude, tone) for f, tone in FM_STATIONS])
+    rate = 1.024e6 # meteor_recorder.py's rate, tuned 50 kHz below like it does
+    return sources.SyntheticSource(rate, METEOR_FREQ - 50e3, seed=seed, noise=NOISE, duration=seconds,
+                                   qpsk=[(METEOR_FREQ, 0.2, 72e3, lambda t: meteor_doppler(t, seconds))])
+
+
+# write the source as cu8 (what the dongle and rtl_sdr give) a MB at a time
+def make_capture(path, source):
+    with open(path, 'wb') as f:
+        for block in source.blocks(1 << 19, raw=True):
+            f.write(block.tobytes())
+    return path
+
+
+# --- the pipelines (each one runs in its own process) ----------------------------------------------
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on Linux
+
+
+def timing(samples, rate, elapsed):
+    seconds = samples / rate
+    return {'seconds': seconds, 'samples': samples, 'elapsed_s': elapsed, 'msps': samples / elapsed / 1e6,
+            'rtf': elapsed / seconds, 'peak_rss_mb': peak_rss_mb()}
+
+
+# adsb_tracker.py's replay path on the capture (at rate, trigger level thresh or the noise floor), then the
+# aircraft table against the planes we sent, and the track history against the frames that were decoded:
+# one velocity/altitude record per velocity/altitude frame, one position record per CPR frame that moved
+# the position (all but the first one or two of each aircraft, before it has an even/odd pair)
+def bench_adsb(path, sent, rate=2e6, thresh=None, aircraft=AIRCRAFT):
+    import adsb_tracker
+    from track_history import HistoryWriter, TrackHistory, POSITION, VELOCITY, ALTITUDE
+    adsb_tracker.RATE, adsb_tracker.THRESH = rate, thresh # like its command line does
+    source = sources.FileSource(path, rate, adsb_tracker.FREQ)
+    history_dir = tempfile.mkdtemp(prefix='history_', dir=os.path.dirname(path))
+    adsb_tracker.history = HistoryWriter(history_dir)
+    adsb_tracker.history.start()
+    adsb_tracker.out = io.StringIO() # every valid frame, to count what the history should hold
+    t0 = time.perf_counter()
+    with contextlib.redirect_stderr(io.StringIO()): # its own summary
+        stats = adsb_tracker.run_file(source, False, 1)
+    result = timing(source.position, rate, time.perf_counter() - t0)
+    adsb_tracker.history.stop()
+
+    kinds = TrackHistory(history_dir).query()['kind']
+    decoded = {}
+    cpr = velocity = altitude = 0
+    for line in adsb_tracker.out.getvalue().splitlines():
+        msg = line.split('*')[1].rstrip(';')
+        rec = decoded.get(msg) or decoded.setdefault(msg, adsb_tracker.decode_message(msg))
+        if rec['icao']:
+            cpr += bool(rec['cpr'])
+            velocity += bool(rec['vel'])
+            altitude += rec['df'] in [0, 4, 16, 20] and rec['alt'] is not None
+    shutil.rmtree(history_dir)
+    history = {kind: int(np.count_nonzero(kinds == k)) for kind, k in (('position', POSITION), ('velocity', VELOCITY), ('altitude', ALTITUDE))}
+    result.update({'history_records': len(kinds), 'history_positions': history['position'], 'cpr_frames': cpr,
+                   'history_ok': history['velocity'] == velocity and history['altitude'] == altitude
+                                 and 0 <= cpr - history['position'] <= 2 * len(adsb_tracker.aircraft.tracks)})
+
+    tracks = adsb_tracker.aircraft.tracks
+    found = callsign = pos = alt = vel = 0
+    errors = []
+    for icao, cs, lat, lon, altitude, spd, hdg, vr in aircraft:
+        tr = tracks.get(icao)
+        if tr is None:
+            continue
+        found += 1
+        callsign += tr.cs == cs
+        alt += tr.alt == altitude
+        if tr.lat is not None:
+            errors.append(distance_km(lat, lon, tr.lat, tr.lon))
+            pos += errors[-1] < 0.1
+        if tr.spd is not None:
+            vel += abs(tr.spd - spd) <= 2 and abs((tr.hdg - hdg + 180) % 360 - 180) <= 1 and tr.vr == vr
+    result.update({'frames_sent': sent, 'frames_decoded': adsb_tracker.num_valid,
+                   'frame_yield': adsb_tracker.num_valid / max(sent, 1),
+                   'triggers': stats['candidates'], 'trigger_rate': stats['trigger_rate'],
+                   'false_trigger_ratio': stats['false_trigger_ratio'], 'cpu_per_frame_us': (stats['cpu_per_frame'] or 0) * 1e6,
+                   'noise_floor': stats['noise_floor'], 'trigger_level': stats['trigger_level'],
+                   'aircraft': len(aircraft), 'aircraft_found': found, 'ghosts': len(tracks) - found,
+                   'callsigns_ok': callsign, 'positions_ok': pos, 'altitudes_ok': alt, 'velocities_ok': vel,
+                   'max_position_error_km': max(errors) if errors else None,
+                   'yield': (callsign + pos + alt + vel) / (4 * len(aircraft))})
+    return result
+
+
+# frequency of the strongest tone in audio and how clean it is (tone power over everything else, dB)
+def tone(audio, rate):
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio)), 8 * len(audio)))
+    freq = np.argmax(spectrum[1:]) + 1
+    a, b, c = spectrum[freq - 1:freq + 2] # parabola through the peak
+    freq = (freq + 0.5 * (a - c) / (a - 2 * b + c)) * rate / (8 * len(audio))
+    t = np.arange(len(audio)) / rate
+    basis = np.column_stack([np.sin(2 * np.pi * freq * t), np.cos(2 * np.pi * freq * t), np.ones(len(t))])
+    fit = basis @ np.linalg.lstsq(basis, audio, rcond=None)[0]
+    return freq, 10 * np.log10(np.sum(fit ** 2) / np.sum((audio - fit) ** 2))
+
+
+# fm_radio_record.py's chain on the capture, then the audio against the tone the tuned station sent
+def bench_fm(path):
+    import fm_radio_record # only its settings, the script itself does not run on import
+    from fm_stream import FMStream
+    rate, audio_rate, block_size = fm_radio_record.SAMPLE_RATE, fm_radio_record.AUDIO_RATE, fm_radio_record.BLOCK_SIZE
+    source = sources.FileSource(path, rate, FM_STATIONS[0][0])
+    fm = FMStream(rate, audio_rate)
+    audio = []
+    t0 = time.perf_counter()
+    for block in source.blocks(block_size, raw=False):
+        audio.append(fm.process(block))
+    result = timing(source.position, rate, time.perf_counter() - t0)
+
+    audio = np.concatenate(audio)[audio_rate // 2:] # past the filters' and the AGC's start-up
+    freq, sinad = tone(audio, audio_rate)
+    sent = FM_STATIONS[0][1]
+    result.update({'tone_sent_hz': sent, 'tone_hz': freq, 'tone_error_hz': freq - sent, 'sinad_db': sinad,
+                   'yield': float(abs(freq - sent) < 1.0 and sinad > 20)})
+    return result
+
+
+# where the QPSK carrier is in each second of samples (the 4th power takes the modulation off, leaving a
+# tone at 4x the carrier), as offsets from expected in Hz
+def carrier_offsets(samples, rate, expected):
+    n = int(rate)
+    offsets = []
+    for k in range(0, len(samples) - n + 1, n):
+        spectrum = np.abs(np.fft.fft(samples[k:k + n].astype(np.complex128) ** 4))
+        freq = np.fft.fftfreq(n, 1 / rate)[np.argmax(spectrum)] / 4
+        offsets.append((freq - expected + rate / 8) % (rate / 4) - rate / 8) # the 4th power folds every rate/4
+    return np.array(offsets)
+
+
+# meteor_recorder.py's writer-thread stage on the capture: DopplerNCO on the cu8 (--doppler nco) or Baseband
+# to cs8 (--baseband cs8), buffer by buffer like RawRecorder hands them over, written to disk like it does
+# the curve is sampled every second like doppler_curve(), the signal had the exact one
+def bench_meteor(path, fmt, seconds):
+    import meteor_recorder # only its settings
+    from doppler import DopplerNCO, STEP
+    from baseband import Baseband, RATE
+    from raw_recorder import BUFFER_BYTES
+    rate, offset = meteor_recorder.SAMPLE_RATE, meteor_recorder.OFFSET
+    times = np.arange(0, seconds + 2 * STEP, STEP)
+    nco = DopplerNCO(times, meteor_doppler(times, seconds), rate, 0.0)
+    stage = Baseband(rate, offset, RATE, fmt, nco) if fmt else nco
+    source = sources.FileSource(path, rate, METEOR_FREQ - offset)
+    out_path = path + ('.' + fmt if fmt else '.nco.cu8')
+    t0 = time.perf_counter()
+    with open(out_path, 'wb') as f:
+        position = 0
+        for block in source.blocks(BUFFER_BYTES // 2, raw=True):
+            data = np.array(block) # RawRecorder copies the dongle's buffer into one of its own
+            out = stage.process_bytes(data, position)
+            f.write((data if out is None else out).tobytes())
+            position += len(data)
+    result = timing(source.position, rate, time.perf_counter() - t0)
+
+    if fmt:
+        scale = Baseband(rate, offset, RATE, fmt).scale
+        y = np.fromfile(out_path, dtype=stage.dtype).astype(np.float32) / scale
+        out_rate, expected = RATE, 0.0 # the satellite ends up at 0 Hz
+    else:
+        y = sources.bytes_to_complex(np.fromfile(out_path, dtype=np.uint8))
+        out_rate, expected = rate, offset # the satellite stays 50 kHz above the tuner, without the Doppler
+    residual = carrier_offsets(y.view(np.complex64), out_rate, expected)
+    before = carrier_offsets(sources.bytes_to_complex(np.fromfile(path, dtype=np.uint8)), rate, offset)
+    result.update({'output_bytes': os.path.getsize(out_path), 'size_ratio': os.path.getsize(path) / os.path.getsize(out_path),
+                   'doppler_before_hz': float(np.max(np.abs(before))), 'residual_hz': float(np.max(np.abs(residual))),
+                   'yield': float(np.max(np.abs(residual)) < 5.0)})
+    if fmt:
+        result['clipped'] = stage.clipped
+    return result
+
+
+# one pipeline in a fresh process (spawn, so nothing from this one is inherited)
+def isolated(func, *args):
+    with mp.get_context('spawn').Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def run(kinds, seconds, seed, snrs, density, workdir):
+    results = {}
+    if 'adsb' in kinds:
+        for snr in snrs:
+            for name, rate, thresh in ADSB_VARIANTS:
+                source = make_source('adsb', seconds, seed, snr, density, rate)
+                path = make_capture(os.path.join(workdir, f'{name}_{snr:g}.cu8'), source)
+                results[f'{name}_snr{snr:g}'] = dict(isolated(bench_adsb, path, source.bursts_sent, rate, thresh),
+                                                     snr_db=snr, density=density, rate=rate)
+                os.remove(path)
+    if 'fm' in kinds:
+        path = make_capture(os.path.join(workdir, 'fm.cu8'), make_source('fm', seconds, seed))
+        results['fm'] = dict(isolated(bench_fm, path), cnr_db=FM_CNR)
+        os.remove(path)
+    if 'meteor' in kinds:
+        path = make_capture(os.path.join(workdir, 'meteor.cu8'), make_source('meteor', seconds, seed))
+        results['meteor_nco'] = isolated(bench_meteor, path, None, seconds)
+        results['meteor_cs8'] = isolated(bench_meteor, path, 'cs8', seconds)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def show(results):
+    print(f"\n{'pipeline':<18} {'MS/s':>7} {'RTF':>7} {'RSS MB':>7} {'yield':>6}  ground truth")
+    for name, r in results.items():
+        if name.startswith('adsb'):
+            truth = (f"{r['frames_decoded']}/{r['frames_sent']} frames, {r['aircraft_found']}/{r['aircraft']} aircraft, "
+                     f"callsign {r['callsigns_ok']} position {r['positions_ok']} altitude {r['altitudes_ok']} velocity {r['velocities_ok']}, "
+                     f"{r['ghosts']} ghosts | {r['trigger_rate']:.0f} triggers/s, {r['false_trigger_ratio']*100:.0f}% false, "
+                     f"{r['cpu_per_frame_us']:.0f} µs CPU/frame | history {r['history_records']} records "
+                     f"({r['history_positions']} positions of {r['cpr_frames']} CPR frames){'' if r['history_ok'] else ' MISMATCH'}")
+        elif name == 'fm':
+            truth = f"tone {r['tone_hz']:.2f} Hz (sent {r['tone_sent_hz']:g}), SINAD {r['sinad_db']:.1f} dB"
+        else:
+            truth = f"Doppler {r['doppler_before_hz']:.0f} Hz -> residual {r['residual_hz']:.2f} Hz, {r['size_ratio']:.1f}x smaller" if 'cs8' in name else \
+                    f"Doppler {r['doppler_before_hz']:.0f} Hz -> residual {r['residual_hz']:.2f} Hz"
+        print(f"{name:<18} {r['msps']:7.2f} {r['rtf']:7.3f} {r['peak_rss_mb']:7.0f} {r['yield']:6.2f}  {truth}")
+
+
+# the same pipelines in an older results file: throughput or yield down by more than tolerance % is a regression
+def compare(results, old, tolerance=TOLERANCE):
+    regressions = []
+    print(f"\nAgainst {old.get('commit') or 'the old run'} ({old.get('time')}):")
+    for name, r in results.items():
+        o = old['results'].get(name)
+        if o is None:
+            continue
+        speed = (r['msps'] / o['msps'] - 1) * 100
+        print(f"{name:<18} MS/s {o['msps']:7.2f} -> {r['msps']:7.2f} ({speed:+5.1f}%) | yield {o['yield']:.2f} -> {r['yield']:.2f} | "
+              f"RSS {o['peak_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+        if speed < -tolerance:
+            regressions.append(f"{name} throughput {speed:+.1f}%")
+        if r['yield'] < o['yield'] * (1 - tolerance / 100):
+            regressions.append(f"{name} yield {o['yield']:.2f} -> {r['yield']:.2f}")
+        if r.get('history_ok') is False:
+            regressions.append(f"{name} track history does not follow the decoded frames")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ADS-B, FM and Meteor pipelines on synthetic signals with known content")
+    parser.add_argument('--only', nargs='+', choices=['adsb', 'fm', 'meteor'], default=['adsb', 'fm', 'meteor'], help="pipelines to run (default all)")
+    parser.add_argument('--seconds', type=float, default=SECONDS, help="seconds of signal per pipeline (default 10)")
+    parser.add_argument('--snr', type=float, nargs='+', default=list(SNRS), help="Mode S SNRs to run in dB (default 20 10 6)")
+    parser.add_argument('--density', type=float, default=DENSITY, help="Mode S frames per second (default 200)")
+    parser.add_argument('--seed', type=int, default=SEED, help="same seed, same signals (default 1)")
+    parser.add_argument('--json', metavar='FILE', help="write the results here")
+    parser.add_argument('--compare', metavar='FILE', help="an older --json file: print the changes, exit 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="%% lost before it is a regression (default 10)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args.only, args.seconds, args.seed, args.snr, args.density, workdir)
+    show(results)
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'cpus': os.cpu_count(), 'machine': platform.machine(),
+              'seed': args.seed, 'seconds': args.seconds, 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"\nResults saved to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION: {r}")
+        sys.exit(1 if regressions else 0)
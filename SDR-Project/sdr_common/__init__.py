@@ -0,0 +1,2 @@
+# code shared by the receivers in SDR-Project (ADSB, FM_Radio, METEOR_SATELLITE)
+# the scripts add the SDR-Project folder to sys.path so this imports from any of them
@@ -0,0 +1,198 @@
+import numpy as np # imports the library to do array math
+import json # the layout of the files (frequencies, ring sizes)
+import os
+import time
+import argparse # command line for queries and drawing
+
+# long-running band monitor: every update (one spectrum from fm_spectrum.py --monitor or adsb_test.py --monitor)
+# goes into files in one directory that are memory-mapped, so they survive restarts and can be read by
+# another process while the capture keeps running:
+#   ema.f4         exponentially averaged PSD (dB)                       [bins]
+#   waterfall.f2   the last WATERFALL_ROWS spectra (dB), a ring buffer   [rows, bins]
+#   occupancy.f2   power of every channel (dB) for the last OCC_ROWS updates, a ring buffer [rows, channels]
+#   noise.f4       noise floor of each of those updates, so SNR = power - noise
+#   summary.f8     per channel: updates above OCCUPIED_SNR, updates seen, last time above
+#   state.i8       updates written so far -- bumped after the rows, so a reader never sees a half written row
+# "when was 96.3 MHz above -30 dB in the last 24 h" only reads one column of occupancy.f2, no IQ is kept
+WATERFALL_ROWS = 3600 # an hour at one update per second
+OCC_ROWS = 2 * 86400 # two days at one update per second
+CHANNEL_STEP = 100e3 # channel grid
+CHANNEL_WIDTH = 200e3 # power is averaged over this around each channel
+OCCUPIED_SNR = 10 # dB above the noise floor to count a channel as occupied
+ALPHA = 0.1 # weight of the newest spectrum in the average
+
+
+class BandMonitor:
+    def __init__(self, directory, freqs=None, channel_step=CHANNEL_STEP, channel_width=CHANNEL_WIDTH,
+                 waterfall_rows=WATERFALL_ROWS, occ_rows=OCC_ROWS, alpha=ALPHA):
+        self.directory = directory
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if freqs is not None and (len(freqs) != self.meta['bins'] or abs(freqs[0] - self.meta['start']) > 1):
+                raise ValueError(f"{directory} was made for a different frequency range")
+            if 'channel_step' not in self.meta: # made before the grid was stored: read it off the channels
+                ch = self.meta['channels']
+                self.meta['channel_step'] = ch[1] - ch[0] if len(ch) > 1 else CHANNEL_STEP
+            mode = 'r+'
+        else:
+            if freqs is None:
+                raise FileNotFoundError(f"no band monitor in {directory}")
+            os.makedirs(directory, exist_ok=True)
+            channels = np.arange(np.ceil(freqs[0] / channel_step), np.floor(freqs[-1] / channel_step) + 1) * channel_step
+            self.meta = {'start': float(freqs[0]), 'bin_width': float(freqs[1] - freqs[0]), 'bins': len(freqs),
+                         'channels': channels.tolist(), 'channel_step': channel_step, 'channel_width': channel_width,
+                         'waterfall_rows': waterfall_rows, 'occ_rows': occ_rows, 'alpha': alpha}
+            with open(meta_path, 'w') as f:
+                json.dump(self.meta, f)
+            mode = 'w+'
+        m = self.meta
+        self.freqs = m['start'] + np.arange(m['bins']) * m['bin_width']
+        self.channels = np.array(m['channels'])
+        num_ch = len(self.channels)
+
+        def open_map(name, dtype, shape):
+            return np.memmap(os.path.join(directory, name), dtype=dtype, mode=mode, shape=shape)
+        self.ema = open_map('ema.f4', np.float32, (m['bins'],))
+        self.waterfall = open_map('waterfall.f2', np.float16, (m['waterfall_rows'], m['bins']))
+        self.waterfall_times = open_map('waterfall_t.f8', np.float64, (m['waterfall_rows'],))
+        self.occupancy = open_map('occupancy.f2', np.float16, (m['occ_rows'], num_ch))
+        self.occ_times = open_map('occupancy_t.f8', np.float64, (m['occ_rows'],))
+        self.noise = open_map('noise.f4', np.float32, (m['occ_rows'],))
+        self.summary = open_map('summary.f8', np.float64, (num_ch, 3))
+        self.state = open_map('state.i8', np.int64, (1,))
+
+        # bins that make up each channel, as [lo, hi) ranges into a cumulative sum (one subtraction per channel)
+        half = m['channel_width'] / 2
+        self.ch_lo = np.clip(np.searchsorted(self.freqs, self.channels - half), 0, m['bins'] - 1)
+        self.ch_hi = np.clip(np.searchsorted(self.freqs, self.channels + half), 1, m['bins'])
+
+    def updates(self):
+        return int(self.state[0])
+
+    # add one spectrum (linear power per bin, on the same frequencies as when the monitor was made)
+    def update(self, psd, t=None):
+        t = time.time() if t is None else t
+        n = self.updates()
+        power_db = 10 * np.log10(psd + 1e-20)
+        alpha = self.meta['alpha']
+        if n == 0:
+            self.ema[:] = power_db
+        else:
+            self.ema[:] = (1 - alpha) * self.ema + alpha * power_db
+
+        row = n % self.meta['waterfall_rows']
+        self.waterfall[row] = power_db
+        self.waterfall_times[row] = t
+
+        cum = np.concatenate([[0.0], np.cumsum(psd)])
+        channel_db = 10 * np.log10((cum[self.ch_hi] - cum[self.ch_lo]) / (self.ch_hi - self.ch_lo) + 1e-20)
+        noise = np.mean(np.sort(power_db)[:int(len(power_db) * 0.2)]) # same noise floor as fm_spectrum.py (lowest 20%)
+        row = n % self.meta['occ_rows']
+        self.occupancy[row] = channel_db
+        self.occ_times[row] = t
+        self.noise[row] = noise
+
+        occupied = channel_db - noise > OCCUPIED_SNR
+        self.summary[occupied, 0] += 1
+        self.summary[:, 1] += 1
+        self.summary[occupied, 2] = t
+        self.state[0] = n + 1 # last, so readers only ever see finished rows
+
+    def flush(self):
+        for m in (self.ema, self.waterfall, self.waterfall_times, self.occupancy, self.occ_times, self.noise, self.summary, self.state):
+            m.flush()
+
+    # the rows of a ring in time order (oldest first)
+    def _ordered(self, size):
+        n = self.updates()
+        if n <= size:
+            return np.arange(n)
+        return (np.arange(n - size, n)) % size
+
+    def waterfall_rows(self):
+        rows = self._ordered(self.meta['waterfall_rows'])
+        return self.waterfall_times[rows], self.waterfall[rows]
+
+    def channel(self, freq):
+        k = int(np.argmin(np.abs(self.channels - freq)))
+        if abs(self.channels[k] - freq) > self.meta['channel_step'] / 2: # the grid this monitor was made with
+            raise ValueError(f"{freq/1e6:.3f} MHz is not in the monitored range")
+        return k
+
+    # when was the channel at freq above level (dB, or dB of SNR with snr=True) between since and until
+    # returns a list of (start, end) times
+    def query(self, freq, above, since=-np.inf, until=np.inf, snr=False):
+        k = self.channel(freq)
+        rows = self._ordered(self.meta['occ_rows'])
+        times = self.occ_times[rows]
+        level = self.occupancy[rows, k].astype(np.float32)
+        if snr:
+            level = level - self.noise[rows]
+        hit = (level > above) & (times >= since) & (times <= until)
+        # runs of consecutive updates above the level
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], hit.astype(np.int8), [0]])))
+        return [(times[a], times[b - 1]) for a, b in zip(edges[::2], edges[1::2])]
+
+    # share of updates each channel was occupied, and when it last was
+    def occupancy_summary(self):
+        above, seen, last = self.summary[:, 0], self.summary[:, 1], self.summary[:, 2]
+        return self.channels, above / np.maximum(seen, 1), last
+
+    # draw the average spectrum and the waterfall (only when asked, the capture never waits on this)
+    def render(self, path=None):
+        import matplotlib.pyplot as plt # only needed for drawing
+        times, rows = self.waterfall_rows()
+        fig, (top, bottom) = plt.subplots(2, 1, figsize=(14, 9), sharex=True)
+        mhz = self.freqs / 1e6
+        top.plot(mhz, self.ema, linewidth=1, color='blue')
+        top.set_ylabel('Power (dB)', fontsize=12, fontweight='bold')
+        top.set_title(f'Average spectrum ({self.updates()} updates)', fontsize=14, fontweight='bold')
+        top.grid(True, alpha=0.5, linestyle='--')
+        if len(rows):
+            age = (times - times[-1]) / 60 # minutes before the latest update
+            bottom.imshow(rows.astype(np.float32), aspect='auto', origin='lower', cmap='viridis',
+                          extent=[mhz[0], mhz[-1], age[0], 0])
+        bottom.set_xlabel('Frequency (MHz)', fontsize=12, fontweight='bold')
+        bottom.set_ylabel('Minutes ago', fontsize=12, fontweight='bold')
+        plt.tight_layout()
+        if path:
+            plt.savefig(path)
+        else:
+            plt.show()
+
+
+def stamp(t):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query or draw a band monitor made by fm_spectrum.py --monitor / adsb_test.py --monitor")
+    parser.add_argument('directory')
+    parser.add_argument('--query', type=float, metavar='MHZ', help="when was this channel above --above")
+    parser.add_argument('--above', type=float, help=f"power in dB, or with --snr dB above the noise floor (default {OCCUPIED_SNR} with --snr)")
+    parser.add_argument('--snr', action='store_true', help="--above is an SNR instead of a power")
+    parser.add_argument('--hours', type=float, default=24, help="how far back to look (default 24)")
+    parser.add_argument('--show', action='store_true', help="draw the average spectrum and the waterfall")
+    parser.add_argument('--save', metavar='PNG', help="with --show: save the picture instead of opening a window")
+    args = parser.parse_args()
+    if args.above is None:
+        if args.query is not None and not args.snr:
+            parser.error("--query needs --above (a power in dB), or --snr for the SNR threshold")
+        args.above = OCCUPIED_SNR
+
+    monitor = BandMonitor(args.directory)
+    if args.query is not None:
+        spans = monitor.query(args.query * 1e6, args.above, since=time.time() - args.hours * 3600, snr=args.snr)
+        kind = 'SNR' if args.snr else 'power'
+        print(f"{args.query:.1f} MHz with {kind} above {args.above} dB in the last {args.hours:g} h: {len(spans)} times")
+        for start, end in spans:
+            print(f"  {stamp(start)} - {stamp(end)} ({end - start:.0f} s)")
+    if args.show:
+        monitor.render(args.save)
+    if args.query is None and not args.show:
+        channels, share, last = monitor.occupancy_summary()
+        print(f"{monitor.updates()} updates, busiest channels:")
+        for k in np.argsort(share)[::-1][:10]:
+            print(f"  {channels[k]/1e6:.1f} MHz occupied {share[k]*100:.0f}% of the time, last {stamp(last[k]) if last[k] else 'never'}")
@@ -0,0 +1,243 @@
+import threading # metrics are updated from the capture/decode threads
+import time # monotonic clock for the stage timers
+import json # periodic JSON dump
+import os # to swap the JSON file in one step
+import bisect # to find the histogram bucket
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler # Prometheus text endpoint
+
+# shared instrumentation for all the receivers: counters, histograms and stage timers
+# everything is off until enable() is called, and while it is off inc()/observe()/timer() return right away,
+# so leaving the calls in the hot loops costs next to nothing
+#   Prometheus: enable(port=9100) -> curl http://127.0.0.1:9100/metrics
+#   JSON:       enable(json_path='metrics.json', every=10) -> file rewritten every 10 s (and at stop())
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5) # seconds
+
+_enabled = False
+_lock = threading.Lock()
+_metrics = {} # (name, labels) -> Counter or Histogram
+_help = {} # name -> help text
+_server = None
+_dumper = None
+_stop = threading.Event()
+
+
+def enabled():
+    return _enabled
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        if not _enabled:
+            return
+        with self.lock:
+            self.value += n
+
+    def render(self, name, labels):
+        return [f"{name}{_label_text(labels)} {self.value}"]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(Counter):
+    def set(self, value):
+        if not _enabled:
+            return
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        if not _enabled:
+            return
+        k = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[k] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        total = 0
+        for edge, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += n # Prometheus buckets are cumulative
+            lines.append(f"{name}_bucket{_label_text(labels, [('le', edge)])} {total}")
+        lines.append(f"{name}_sum{_label_text(labels)} {self.sum}")
+        lines.append(f"{name}_count{_label_text(labels)} {self.count}")
+        return lines
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else 0.0,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))}
+
+
+def _get(kind, name, help_text, labels, **kwargs):
+    key = (name, _labels(labels))
+    m = _metrics.get(key)
+    if m is None:
+        with _lock:
+            m = _metrics.get(key)
+            if m is None:
+                m = _metrics[key] = kind(**kwargs)
+                _help.setdefault(name, (help_text, kind))
+    return m
+
+
+# get (or create) a metric, labels are keyword arguments: counter('adsb_messages_total', df=17)
+# keep the returned object around in hot code instead of looking it up every time
+def counter(name, help_text='', **labels):
+    return _get(Counter, name, help_text, labels)
+
+
+def gauge(name, help_text='', **labels):
+    return _get(Gauge, name, help_text, labels)
+
+
+def histogram(name, help_text='', buckets=TIME_BUCKETS, **labels):
+    return _get(Histogram, name, help_text, labels, buckets=buckets)
+
+
+class _Timer:
+    __slots__ = ('hist', 't0')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.monotonic() - self.t0)
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+# with timer('fm_demod'): ...  -> time spent goes into the stage_seconds{stage="fm_demod"} histogram
+def timer(stage):
+    if not _enabled:
+        return _NO_TIMER
+    return _Timer(histogram('stage_seconds', 'time spent in each processing stage', stage=stage))
+
+
+# the whole registry in the Prometheus text format
+def render_prometheus():
+    lines = []
+    with _lock:
+        items = sorted(_metrics.items(), key=lambda kv: kv[0])
+    last = None
+    for (name, labels), m in items:
+        if name != last:
+            help_text, kind = _help[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {'histogram' if kind is Histogram else kind.__name__.lower()}")
+            last = name
+        lines.extend(m.render(name, labels))
+    return '\n'.join(lines) + '\n'
+
+
+# the whole registry as a dict (for the JSON dump)
+def snapshot():
+    with _lock:
+        items = list(_metrics.items())
+    out = {'time': time.time()}
+    for (name, labels), m in items:
+        key = name + _label_text(labels)
+        out[key] = m.snapshot()
+    return out
+
+
+def dump_json(path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot(), f, indent=1)
+    os.replace(tmp, path) # readers never see a half written file
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): # keep the terminal quiet
+        pass
+
+
+# turn metrics on, optionally serving Prometheus text on localhost:port and/or dumping JSON every few seconds
+def enable(port=None, json_path=None, every=10.0):
+    global _enabled, _server, _dumper
+    _enabled = True
+    _stop.clear()
+    if port is not None:
+        _server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    if json_path:
+        def loop():
+            while not _stop.wait(every):
+                dump_json(json_path)
+        _dumper = (threading.Thread(target=loop, daemon=True), json_path)
+        _dumper[0].start()
+
+
+# stop the endpoint and write the final JSON dump
+def stop():
+    global _server, _dumper
+    _stop.set()
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    if _dumper is not None:
+        _dumper[0].join(timeout=1)
+        dump_json(_dumper[1])
+        _dumper = None
+
+
+# the same command line options for every script
+def add_arguments(parser):
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument('--metrics-json', metavar='FILE', help="dump metrics as JSON to FILE every --metrics-every seconds")
+    parser.add_argument('--metrics-every', type=float, default=10.0, help="seconds between JSON dumps (default 10)")
+
+
+def setup(args):
+    if args.metrics_port is not None or args.metrics_json:
+        enable(args.metrics_port, args.metrics_json, args.metrics_every)
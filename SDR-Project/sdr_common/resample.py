@@ -0,0 +1,73 @@
+import numpy as np # imports the library to do array math
+from scipy import signal # FIR design and the polyphase filter (upfirdn is what resample_poly runs on)
+from fractions import Fraction # exact rate ratios, 1.024 MS/s -> 240 kS/s is 15/64
+
+# polyphase FIR resampling that streams (the FM chain and the Meteor baseband recorder use it): up/down is
+# any exact ratio, the filter only works out the samples that are kept (upfirdn never computes the ones
+# decimation throws away), and the input samples the next block still needs are kept, so blocks join up
+# exactly as if it was one long array
+#   r = Resampler(1.2e6, 240e3, cutoff=100e3, stop=140e3, dtype=np.complex64)
+#   out = r.process(block)
+ATTENUATION = 60 # dB of stopband rejection for the designed filters
+
+
+# low-pass FIR for a resampler running at rate * up (Kaiser window sized for the transition band)
+def design_lowpass(rate, cutoff, stop, up=1, attenuation=ATTENUATION):
+    fs = rate * up # the filter runs on the zero-stuffed signal
+    numtaps, beta = signal.kaiserord(attenuation, (stop - cutoff) / (fs / 2))
+    numtaps += numtaps % 2 == 0 # odd length, so the delay is a whole number of samples
+    taps = signal.firwin(numtaps, (cutoff + stop) / 2, window=('kaiser', beta), fs=fs)
+    return taps * up # make up for the energy lost to the zero stuffing
+
+
+class Resampler:
+    def __init__(self, rate_in, rate_out, cutoff, stop=None, dtype=np.complex64):
+        ratio = Fraction(rate_out / rate_in).limit_denominator(10000)
+        if float(ratio) * rate_in != rate_out:
+            raise ValueError(f"{rate_in} -> {rate_out} is not a ratio we can hit exactly")
+        self.up, self.down = ratio.numerator, ratio.denominator
+        self.rate_in, self.rate_out = rate_in, rate_out
+        if stop is None:
+            stop = min(rate_in, rate_out) - cutoff # anything above this would alias back into the passband
+        self.dtype = dtype
+        single = np.dtype(dtype) in (np.float32, np.complex64)
+        self.taps = design_lowpass(rate_in, cutoff, stop, self.up).astype(np.float32 if single else np.float64)
+        self.history = np.zeros(0, dtype=dtype) # input samples still needed, starting at input number self.first
+        self.first = 0 # absolute input number of history[0] (always a multiple of down)
+        self.next_out = 0 # absolute number of the next output sample
+
+    # group delay in output samples (the FIR is linear phase, so the whole output is just shifted by this)
+    def delay(self):
+        return (len(self.taps) - 1) / 2 / self.down
+
+    # upfirdn is about 3x slower on complex input than on real and imaginary parts done separately
+    def _filter(self, x):
+        if np.iscomplexobj(x):
+            parts = x.view(x.real.dtype).reshape(-1, 2) # interleaved I/Q, no copy
+            re = signal.upfirdn(self.taps, np.ascontiguousarray(parts[:, 0]), self.up, self.down)
+            im = signal.upfirdn(self.taps, np.ascontiguousarray(parts[:, 1]), self.up, self.down)
+            y = np.empty(len(re), dtype=x.dtype)
+            y.real, y.imag = re, im
+            return y
+        return signal.upfirdn(self.taps, x, self.up, self.down)
+
+    def process(self, block):
+        x = np.concatenate([self.history, block.astype(self.dtype, copy=False)])
+        end = self.first + len(x) # absolute input number just after the last one we have
+        # output m uses the zero-stuffed sample m*down, which we have once m*down < up*end
+        last = -(-self.up * end // self.down) # one past the last output we can finish
+        if last <= self.next_out:
+            self.history = x
+            return np.zeros(0, dtype=self.dtype)
+        # upfirdn on x gives outputs at zero-stuffed positions up*first + n*down, first is a multiple of down
+        # so those line up with our own output numbering
+        skip = self.next_out - self.up * self.first // self.down
+        y = self._filter(x)[skip:skip + last - self.next_out]
+        self.next_out = last
+
+        # keep the inputs the next output needs: from (next_out*down - taps + 1) / up, rounded down to a multiple of down
+        need = max(0, -(-(self.next_out * self.down - len(self.taps) + 1) // self.up))
+        keep_from = min(need // self.down * self.down, end)
+        self.history = x[keep_from - self.first:].copy()
+        self.first = keep_from
+        return y.astype(self.dtype, copy=False)
@@ -0,0 +1,361 @@
+import numpy as np # imports the library to do array math
+import threading
+import time
+import os
+
+# where the samples come from, behind one interface, so every receiver runs the same on the dongle, on a
+# recorded capture or on made-up IQ:
+#   read_block(n)          n samples in the source's own format (raw cu8 bytes, or complex64)
+#   read_samples(n)        complex, -1 to 1 (like pyrtlsdr)      read_bytes(num_bytes)   cu8 bytes
+#   read_samples_async / read_bytes_async / cancel_read_async    same callbacks as pyrtlsdr
+#   blocks(n)              generator of blocks until the source ends
+#   center_freq / retune(freq), sample_rate, gain, raw (True when bytes are the native format)
+# the RTL-SDR is only opened on the first read, so importing a script or building a source never touches USB
+# pick one with --source: rtlsdr (default), a file path (.cu8/.bin/.raw, .cs8, .cfile/.fc32/.complex64),
+# or synthetic / synthetic:SEED
+FORMATS = {'cu8': np.uint8, 'cs8': np.int8, 'complex64': np.complex64}
+EXTENSIONS = {'.cu8': 'cu8', '.bin': 'cu8', '.raw': 'cu8', '.cs8': 'cs8',
+              '.cfile': 'complex64', '.fc32': 'complex64', '.complex64': 'complex64'}
+
+
+# cu8 bytes to complex64 the way pyrtlsdr does it (-1 to 1)
+def bytes_to_complex(raw):
+    iq = raw.astype(np.float32)
+    iq -= 127.5
+    iq /= 127.5
+    return iq.view(np.complex64) # pairs of floats are read as complex numbers, no copy
+
+
+def complex_to_bytes(samples):
+    iq = np.asarray(samples, dtype=np.complex64).view(np.float32)
+    return np.clip(np.rint(iq * 127.5 + 127.5), 0, 255).astype(np.uint8)
+
+
+class SampleSource:
+    raw = False # native format: cu8 bytes (True) or complex64 (False)
+
+    def __init__(self, sample_rate, center_freq, gain=None, realtime=False):
+        self._sample_rate = sample_rate
+        self._center_freq = center_freq
+        self._gain = gain
+        self.realtime = realtime
+        self._cancel = threading.Event()
+
+    # settings go through _apply so the RTL-SDR can pass them on once it is open
+    def _apply(self, name, value):
+        pass
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value):
+        self._sample_rate = value
+        self._apply('sample_rate', value)
+
+    @property
+    def center_freq(self):
+        return self._center_freq
+
+    @center_freq.setter
+    def center_freq(self, value):
+        self._center_freq = value
+        self._apply('center_freq', value)
+
+    @property
+    def gain(self):
+        return self._gain
+
+    @gain.setter
+    def gain(self, value):
+        self._gain = value
+        self._apply('gain', value)
+
+    def retune(self, freq):
+        self.center_freq = freq
+
+    # n samples in the native format (2n bytes when raw), fewer at the end, None once there is nothing left
+    def read_block(self, num_samples):
+        raise NotImplementedError
+
+    def read_samples(self, num_samples):
+        block = self.read_block(num_samples)
+        if block is None:
+            return np.zeros(0, np.complex64)
+        return bytes_to_complex(block) if self.raw else block
+
+    def read_bytes(self, num_bytes):
+        block = self.read_block(num_bytes // 2)
+        if block is None:
+            return np.zeros(0, np.uint8)
+        return block if self.raw else complex_to_bytes(block)
+
+    def blocks(self, num_samples, raw=None):
+        raw = self.raw if raw is None else raw
+        while True:
+            block = self.read_bytes(num_samples * 2) if raw else self.read_samples(num_samples)
+            if len(block) == 0:
+                return
+            yield block
+
+    # the pyrtlsdr async reads: callback(block, context) for every block until cancel_read_async or the end
+    def read_samples_async(self, callback, num_samples, context=None):
+        self._run_async(callback, self.blocks(num_samples, raw=False), context)
+
+    def read_bytes_async(self, callback, num_bytes, context=None):
+        self._run_async(callback, self.blocks(num_bytes // 2, raw=True), context)
+
+    # realtime=True hands the blocks over at the sample rate like the dongle, otherwise as fast as they are made
+    def _run_async(self, callback, blocks, context):
+        self._cancel.clear()
+        t_next = time.monotonic()
+        for block in blocks:
+            if self.realtime:
+                time.sleep(max(0.0, t_next - time.monotonic())) # wait like the dongle would
+                t_next += len(block) / (2 if block.dtype == np.uint8 else 1) / self.sample_rate
+            if self._cancel.is_set():
+                return
+            callback(block, self if context is None else context)
+
+    def cancel_read_async(self):
+        self._cancel.set()
+
+    def close(self):
+        pass
+
+
+# the dongle (pyrtlsdr), opened on the first read
+class RtlSdrSource(SampleSource):
+    raw = True
+
+    def __init__(self, sample_rate, center_freq, gain=None, device_index=0, **settings):
+        super().__init__(sample_rate, center_freq, gain)
+        self.device_index = device_index
+        self.settings = settings # anything else pyrtlsdr has, e.g. bandwidth=500e3
+        self._sdr = None
+
+    @property
+    def device(self):
+        if self._sdr is None:
+            from rtlsdr import RtlSdr # only needed once we really read
+            self._sdr = RtlSdr(self.device_index)
+            self._sdr.sample_rate = self.sample_rate
+            self._sdr.center_freq = self.center_freq
+            if self.gain is not None:
+                self._sdr.gain = self.gain
+            for name, value in self.settings.items():
+                setattr(self._sdr, name, value)
+        return self._sdr
+
+    def _apply(self, name, value):
+        if self._sdr is not None:
+            setattr(self._sdr, name, value)
+
+    @property
+    def bandwidth(self):
+        return self.settings.get('bandwidth')
+
+    @bandwidth.setter
+    def bandwidth(self, value): # kept for when the dongle opens
+        self.settings['bandwidth'] = value
+        self._apply('bandwidth', value)
+
+    def read_block(self, num_samples):
+        return np.frombuffer(self.device.read_bytes(num_samples * 2), dtype=np.uint8).copy() # pyrtlsdr reuses its buffer
+
+    def read_samples(self, num_samples):
+        return self.device.read_samples(num_samples)
+
+    def read_samples_async(self, callback, num_samples, context=None):
+        self.device.read_samples_async(callback, num_samples, context)
+
+    def read_bytes_async(self, callback, num_bytes, context=None):
+        self.device.read_bytes_async(callback, num_bytes, context)
+
+    def cancel_read_async(self):
+        if self._sdr is not None:
+            self._sdr.cancel_read_async()
+
+    def close(self):
+        if self._sdr is not None:
+            self._sdr.close()
+            self._sdr = None
+
+
+# pick the format from the file extension (rtl_sdr captures are usually .bin or .cu8)
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXTENSIONS:
+        raise ValueError(f"can't tell the IQ format of {path}, pass it explicitly ({', '.join(FORMATS)})")
+    return EXTENSIONS[ext]
+
+
+# a recorded capture, memory-mapped: blocks in the file's own format are views into it (no copy)
+# retuning only changes center_freq (the recording is what it is), loop=True starts over at the end
+class FileSource(SampleSource):
+    def __init__(self, path, sample_rate, center_freq=0.0, fmt=None, realtime=False, loop=False):
+        super().__init__(sample_rate, center_freq, realtime=realtime)
+        self.path = path
+        self.fmt = fmt or guess_format(path)
+        if self.fmt not in FORMATS:
+            raise ValueError(f"unknown IQ format {self.fmt}, use one of {', '.join(FORMATS)}")
+        self.data = np.memmap(path, dtype=FORMATS[self.fmt], mode='r') # zero-copy view of the whole file
+        self.values_per_sample = 1 if self.fmt == 'complex64' else 2 # 8 bit formats store I and Q as separate bytes
+        self.num_samples = len(self.data) // self.values_per_sample
+        self.raw = self.fmt == 'cu8'
+        self.position = 0 # next sample to read
+        self.loop = loop
+
+    # the next num_samples straight from the file (a view of the map), None at the end
+    def _next(self, num_samples):
+        if self.position >= self.num_samples:
+            if not self.loop or self.num_samples == 0:
+                return None
+            self.position = 0
+        stop = min(self.position + num_samples, self.num_samples)
+        block = self.data[self.position * self.values_per_sample:stop * self.values_per_sample]
+        self.position = stop
+        return block
+
+    def read_block(self, num_samples):
+        block = self._next(num_samples)
+        if block is not None and self.fmt == 'cs8':
+            return (block.astype(np.float32) / 127.5).view(np.complex64) # cs8 is centered on 0 already
+        return block
+
+    def read_bytes(self, num_bytes):
+        if self.fmt == 'cs8': # cs8 -> cu8 is just the sign bit
+            block = self._next(num_bytes // 2)
+            return np.zeros(0, np.uint8) if block is None else block.view(np.uint8) ^ 0x80
+        return super().read_bytes(num_bytes)
+
+
+# well-known ADS-B frames (valid CRC) for the synthetic Mode S bursts
+MODES_MESSAGES = ['8D4840D6202CC371C32CE0576098', '8D40621D58C382D690C8AC2863A7', '8D40621D58C386435CC412692AD6',
+                  '8D485020994409940838175B284F', '8DA05F219B06B6AF189400CBC33F', '5D4840D6F6A1F7']
+FM_STATIONS = [88.5e6, 91.5e6, 94.7e6, 96.3e6, 97.1e6, 101.1e6, 104.3e6, 107.5e6] # default synthetic FM band
+MODES_FREQ = 1090e6
+
+
+# what the synthetic source puts on the air around center_freq: FM stations in the FM band, Mode S bursts
+# at 1090 MHz, otherwise a 72k symbols/s QPSK carrier 50 kHz above the center (like Meteor LRPT with the offset tuning)
+def default_scene(center_freq):
+    if 87.5e6 <= center_freq <= 108e6:
+        return {'fm': [(f, 0.1, 400.0 + 150 * k) for k, f in enumerate(FM_STATIONS)]}
+    if abs(center_freq - MODES_FREQ) < 5e6:
+        return {'modes_rate': 200.0}
+    return {'qpsk': [(center_freq + 50e3, 0.1, 72e3, None)]}
+
+
+# deterministic made-up IQ: noise + carriers + FM stations (one audio tone each, 75 kHz deviation) + Mode S
+# bursts (PPM at 1 Mbit/s with a real preamble) + QPSK carriers, all at absolute frequencies so retuning
+# moves them like on the air; the same seed and the same reads always give the same samples
+#   tones  [(freq, amplitude)]                fm  [(freq, amplitude, audio tone Hz)]
+#   qpsk   [(freq, amplitude, symbol rate, doppler)]  doppler: None or a function of t (s) -> shift in Hz
+#   modes_rate bursts/s of modes_messages (hex), each at modes_amplitude times a random factor in modes_spread
+# noise is the standard deviation of I and of Q; duration (s) ends the source like the end of a file (None = forever)
+class SyntheticSource(SampleSource):
+    def __init__(self, sample_rate, center_freq, gain=None, seed=0, noise=0.02, duration=None, realtime=False,
+                 tones=(), fm=(), qpsk=(), modes_rate=0.0, modes_amplitude=0.5, modes_spread=(0.3, 1.0),
+                 modes_messages=MODES_MESSAGES, scene=None):
+        super().__init__(sample_rate, center_freq, gain, realtime)
+        if scene is None and not (tones or fm or qpsk or modes_rate):
+            scene = default_scene(center_freq)
+        scene = scene or {}
+        self.tones = list(scene.get('tones', tones))
+        self.fm = list(scene.get('fm', fm))
+        self.qpsk = list(scene.get('qpsk', qpsk))
+        self.qpsk_phase = [0.0] * len(self.qpsk) # carrier phase carried over from block to block
+        self.symbols = np.exp(1j * np.pi / 4 * (2 * np.random.default_rng(seed + 2).integers(0, 4, 1 << 16) + 1)) # repeating symbol table
+        self.modes_rate = scene.get('modes_rate', modes_rate)
+        self.modes_amplitude = modes_amplitude
+        self.modes_spread = modes_spread
+        self.modes_messages = list(modes_messages)
+        self.noise = noise
+        self.seed = seed
+        self.num_samples = None if duration is None else int(duration * sample_rate)
+        self.rng = np.random.default_rng(seed)
+        self.burst_rng = np.random.default_rng(seed + 1)
+        self.position = 0
+        self.bursts = [] # (start sample, waveform) of bursts not fully written yet
+        self.next_burst = self._burst_gap() if self.modes_rate else None
+        self.bursts_sent = 0
+
+    def _burst_gap(self):
+        return int(self.burst_rng.exponential(self.sample_rate / self.modes_rate)) + 1
+
+    # one Mode S frame as complex baseband at our sample rate: 8 us preamble + 1 us per bit,
+    # a 1 bit is high in its first half, a 0 bit in its second
+    # the frame starts offset (0..1) of a sample late and every sample is the average over its sample period
+    # (8 points), like the dongle's ADC sees it, so at 2.4 MS/s (or 2 MS/s with offset) pulse edges fall inside samples
+    def _burst(self, message, amplitude, phase, offset=0.0, points=8):
+        bits = np.unpackbits(np.frombuffer(bytes.fromhex(message), dtype=np.uint8))
+        n = int(np.ceil((8 + len(bits)) * 1e-6 * self.sample_rate + offset))
+        t = (np.arange(n * points) / points - offset) / self.sample_rate * 1e6 # microseconds
+        high = ((t >= 0) & (t < 0.5)) | ((t >= 1) & (t < 1.5)) | ((t >= 3.5) & (t < 4)) | ((t >= 4.5) & (t < 5))
+        k = np.clip(np.floor(t - 8).astype(int), 0, len(bits) - 1)
+        high |= (t >= 8) & (t < 8 + len(bits)) & ((t - 8 - np.floor(t - 8) < 0.5) == (bits[k] == 1))
+        level = high.reshape(n, points).mean(axis=1)
+        return (amplitude * level * np.exp(1j * phase)).astype(np.complex64)
+
+    def read_block(self, num_samples):
+        if self.num_samples is not None:
+            num_samples = min(num_samples, self.num_samples - self.position)
+            if num_samples <= 0:
+                return None
+        n0, fs = self.position, self.sample_rate
+        t = (n0 + np.arange(num_samples)) / fs
+        x = (self.rng.standard_normal(2 * num_samples, dtype=np.float32) * np.float32(self.noise)).view(np.complex64)
+        for freq, amplitude in self.tones:
+            if abs(freq - self.center_freq) < fs / 2:
+                x += (amplitude * np.exp(2j * np.pi * (freq - self.center_freq) * t)).astype(np.complex64)
+        for freq, amplitude, audio in self.fm:
+            if abs(freq - self.center_freq) < fs / 2:
+                x += (amplitude * np.exp(1j * (2 * np.pi * (freq - self.center_freq) * t + 75e3 / audio * np.sin(2 * np.pi * audio * t)))).astype(np.complex64)
+        for k, (freq, amplitude, symbol_rate, doppler) in enumerate(self.qpsk):
+            offset = freq - self.center_freq + (doppler(t) if doppler else 0.0)
+            step = 2 * np.pi * offset / fs * np.ones(num_samples)
+            phase = self.qpsk_phase[k] + np.cumsum(step) - step
+            self.qpsk_phase[k] = float(phase[-1] + step[-1]) % (2 * np.pi) if num_samples else self.qpsk_phase[k]
+            sym = self.symbols[(np.floor(t * symbol_rate).astype(np.int64)) % len(self.symbols)] # rectangular symbols
+            x += (amplitude * sym * np.exp(1j * phase)).astype(np.complex64)
+
+        if self.modes_rate and abs(MODES_FREQ - self.center_freq) < fs / 2:
+            while self.next_burst < n0 + num_samples: # new bursts that start in this block
+                message = self.modes_messages[self.burst_rng.integers(len(self.modes_messages))]
+                amplitude = self.modes_amplitude * self.burst_rng.uniform(*self.modes_spread)
+                wave = self._burst(message, amplitude, self.burst_rng.uniform(0, 2 * np.pi), self.burst_rng.uniform())
+                wave *= np.exp(2j * np.pi * (MODES_FREQ - self.center_freq) * np.arange(len(wave)) / fs).astype(np.complex64)
+                self.bursts.append((self.next_burst, wave))
+                self.bursts_sent += 1
+                self.next_burst += len(wave) + self._burst_gap() # bursts never overlap
+            pending = []
+            for start, wave in self.bursts:
+                a, b = max(start, n0), min(start + len(wave), n0 + num_samples)
+                if a < b:
+                    x[a - n0:b - n0] += wave[a - start:b - start]
+                if start + len(wave) > n0 + num_samples:
+                    pending.append((start, wave))
+            self.bursts = pending
+
+        self.position += num_samples
+        return x
+
+
+# build a source from --source: 'rtlsdr', 'synthetic', 'synthetic:SEED' or a file path
+# realtime and duration only matter for the file and synthetic ones (the dongle is real time and endless anyway)
+def open_source(spec, sample_rate, center_freq, gain=None, realtime=False, duration=None, **settings):
+    spec = spec or 'rtlsdr'
+    if spec == 'rtlsdr':
+        return RtlSdrSource(sample_rate, center_freq, gain, **settings)
+    if spec == 'synthetic' or spec.startswith('synthetic:'):
+        seed = int(spec.split(':', 1)[1]) if ':' in spec else 0
+        return SyntheticSource(sample_rate, center_freq, gain, seed=seed, duration=duration, realtime=realtime)
+    return FileSource(spec, sample_rate, center_freq, realtime=realtime)
+
+
+def add_arguments(parser):
+    parser.add_argument('--source', default='rtlsdr',
+                        help="where the samples come from: rtlsdr (default), a capture file (.cu8/.cs8/.cfile), "
+                             "or synthetic[:SEED] for made-up IQ")
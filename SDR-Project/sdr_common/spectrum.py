@@ -0,0 +1,35 @@
+import numpy as np # imports the library to do array math
+from functools import lru_cache # the FFT window is made once per size
+
+# spectrum helpers shared by fm_spectrum.py, fm_channelizer.py, adsb_test.py and the band monitor
+
+
+@lru_cache(maxsize=None)
+def get_window(nfft):
+    window = np.hanning(nfft).astype(np.float32)
+    return window, float(np.sum(window ** 2)) # the window and its power, to scale the PSD
+
+
+# Welch PSD: 50% overlapping windowed segments, all FFT'd at once as the rows of one array
+# returns the power per bin (linear, fftshifted so 0 Hz is in the middle)
+def welch_psd(samples, nfft=1024):
+    window, power = get_window(nfft)
+    segments = np.lib.stride_tricks.sliding_window_view(samples, nfft)[::nfft // 2] # a view, no copy
+    spectra = np.fft.fft(segments * window, axis=1)
+    psd = (spectra.real ** 2 + spectra.imag ** 2).mean(axis=0) / power
+    psd = np.fft.fftshift(psd)
+    # the dongle has a spike at 0 Hz (its own DC offset), replace the middle bins with their neighbours
+    mid = nfft // 2
+    psd[mid - 1:mid + 2] = (psd[mid - 3] + psd[mid + 3]) / 2
+    return psd
+
+
+# frequency (Hz) of every bin of welch_psd
+def bin_freqs(center, rate, nfft=1024):
+    return np.fft.fftshift(np.fft.fftfreq(nfft, 1 / rate)) + center
+
+
+# The average background noise level, when there's no signal, this is what you measure, everything above this is actual signal, choosing the lowest 20 percent
+def get_noise_floor(power_db):
+    sorted_power = np.sort(power_db) # sorts from low to high (weak to strong)
+    return np.mean(sorted_power[:int(len(sorted_power) * 0.2)])